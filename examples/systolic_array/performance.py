@@ -1,6 +1,9 @@
 from collections import OrderedDict
 from archx.utils import get_prod
+from archx.performance import batch_performance
 
+# matrix_dim may be a numpy array of a workload sweep, which is evaluated at once
+@batch_performance
 def gemm(architecture_dict: OrderedDict, workload_dict: OrderedDict=None)->OrderedDict:
     performance_dict = OrderedDict()
 
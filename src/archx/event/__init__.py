@@ -1 +1 @@
-from .event import create_event_graph, save_event_graph, load_event_graph
+from .event import create_event_graph, save_event_graph, load_event_graph, get_event_dependency, get_graph_cache, clear_graph_cache, graph_cache_lock, index_event_graph, get_event_node, get_module_nodes, get_tag_nodes, get_ancestor_nodes, mark_event_dirty, check_event_count, hash_event_graph, compile_event_plan, get_event_plan, save_event_plan, load_event_plan
\ No newline at end of file
@@ -1,3 +1,8 @@
+import os
+import weakref
+import hashlib
+import threading
+import numpy as np
 import graph_tool.all as gt
 
 from collections import OrderedDict
@@ -6,6 +11,33 @@ from loguru import logger
 from archx.utils import read_yaml, get_path
 
 
+# caches derived from the event graph structure, keyed by graph id
+# they live in memory only, i.e., they are not saved with the graph and are rebuilt after loading
+graph_cache = {}
+graph_cache_lock = threading.RLock()
+key_stamp = 'stamp'
+key_event_index = 'event_index'
+key_event = 'event'
+key_module = 'module'
+key_tag = 'tag'
+key_tag_string = 'tag_string'
+key_subtotal = 'subtotal'
+key_path_count = 'path_count'
+key_breakdown = 'breakdown'
+key_plan = 'plan'
+key_plan_data = 'plan_data'
+key_count_snapshot = 'count_snapshot'
+
+# dependencies of performance models and module queries, saved with the graph for delta simulation
+key_dependency = 'dependency'
+
+# execution plans shared by all event graphs with identical structure, keyed by structural hash
+plan_registry = OrderedDict()
+plan_suffix = '.plan.npz'
+# format version of saved plans, to increase when the arrays of a plan change
+plan_version = 1
+
+
 def create_event_graph(event_file: str) -> gt.Graph:
     """
     create an event graph, whose node are events.
@@ -72,6 +104,8 @@ def create_event_graph(event_file: str) -> gt.Graph:
         event_graph.ep.operation[e] = OrderedDict({})
         event_graph.ep.factor[e] = OrderedDict({})
 
+    index_event_graph(event_graph)
+
     logger.success(f'Create event graph from <{event_file_full_path}>.')
 
     return event_graph
@@ -80,12 +114,311 @@ def create_event_graph(event_file: str) -> gt.Graph:
 def save_event_graph(event_graph: gt.Graph, save_path: str) -> None:
     save_path = get_path(save_path, check_exist=False)
     event_graph.save(save_path)
+    save_event_plan(get_event_plan(event_graph), save_path + plan_suffix)
     logger.success(f'Save event graph to <{save_path}>.')
 
 
 def load_event_graph(ckpt_path: str) -> gt.Graph:
     full_path = get_path(ckpt_path)
     event_graph_ckpt = gt.load_graph(full_path)
+    index_event_graph(event_graph_ckpt)
+    # a saved plan is shared by all checkpoints with the same structure, and a stale plan is compiled again on first use
+    if os.path.exists(full_path + plan_suffix):
+        load_event_plan(full_path + plan_suffix, structure_hash=hash_event_graph(event_graph_ckpt))
     logger.success(f'Load event graph from <{full_path}>.')
     return event_graph_ckpt
 
+
+
+def get_event_dependency(event_graph: gt.Graph) -> OrderedDict:
+    """
+    Get the dependencies recorded in the event graph, which are saved with the graph as a graph property.
+    event: per event, the hash of its performance model, and the architecture and workload keys it read and wrote
+    module: per module, the hash of its query, instance and tag
+    """
+    if key_dependency not in event_graph.gp:
+        event_graph.gp[key_dependency] = event_graph.new_graph_property('object', OrderedDict({key_event: OrderedDict(), key_module: OrderedDict()}))
+    return event_graph.gp[key_dependency]
+
+
+def get_graph_cache(event_graph: gt.Graph, name: str) -> OrderedDict:
+    """
+    Get a named cache of the event graph, which is reset when the number of nodes or edges changes.
+    """
+    graph_id = id(event_graph)
+    stamp = (event_graph.num_vertices(), event_graph.num_edges())
+
+    # the cache can be shared by threads querying the same graph
+    with graph_cache_lock:
+        if graph_id not in graph_cache:
+            # drop the cache together with the graph
+            weakref.finalize(event_graph, graph_cache.pop, graph_id, None)
+            graph_cache[graph_id] = OrderedDict({key_stamp: stamp})
+        elif graph_cache[graph_id][key_stamp] != stamp:
+            logger.info(f'Reset caches of event graph, since its structure changes.')
+            graph_cache[graph_id] = OrderedDict({key_stamp: stamp})
+
+        if name not in graph_cache[graph_id]:
+            graph_cache[graph_id][name] = OrderedDict()
+
+        return graph_cache[graph_id][name]
+
+
+def clear_graph_cache(event_graph: gt.Graph) -> None:
+    """
+    Clear all caches of the event graph, e.g., after editing edges in place.
+    """
+    with graph_cache_lock:
+        graph_cache.pop(id(event_graph), None)
+
+
+def index_event_graph(event_graph: gt.Graph) -> OrderedDict:
+    """
+    Index the event graph for lookup by name, the modules (leaf nodes), and the modules of each tag, all as node indices.
+    The index is rebuilt when the graph is created or loaded, and shall be rebuilt after tags are updated.
+    A change in the graph structure drops the index, which is then rebuilt on the next lookup.
+    """
+    event_to_index = OrderedDict()
+    module_index = []
+    tag_to_index = OrderedDict()
+    tag_string_index = []
+
+    for v in event_graph.vertices():
+        # the first node of a name is used, same as gt.find_vertex
+        event_to_index.setdefault(event_graph.vp.event[v], int(v))
+        if v.out_degree() == 0:
+            module_index.append(int(v))
+
+    # tags are only available after module metrics are created
+    if key_tag in event_graph.vp:
+        for v in module_index:
+            module_tags = event_graph.vp.tag[v]
+            if module_tags is None:
+                continue
+            if isinstance(module_tags, str):
+                # a tag string matches any part of it, same as the membership test of a string
+                tag_string_index.append((v, module_tags))
+                continue
+            for tag in module_tags:
+                tag_to_index.setdefault(tag, []).append(v)
+
+    # replace the index as a whole, so concurrent lookups never see a partial index
+    with graph_cache_lock:
+        event_index = get_graph_cache(event_graph, key_event_index)
+        event_index[key_event] = event_to_index
+        event_index[key_module] = module_index
+        event_index[key_tag] = tag_to_index
+        event_index[key_tag_string] = tag_string_index
+
+    logger.info(f'Index <{len(event_index[key_event])}> events, <{len(event_index[key_module])}> modules and <{len(event_index[key_tag])}> tags in event graph.')
+
+    return event_index
+
+
+def get_event_index(event_graph: gt.Graph) -> OrderedDict:
+    with graph_cache_lock:
+        event_index = get_graph_cache(event_graph, key_event_index)
+        if len(event_index) == 0:
+            event_index = index_event_graph(event_graph)
+        return event_index
+
+
+def get_event_node(event_graph: gt.Graph, event: str) -> gt.Vertex:
+    """
+    Get the node of an event or a module by name, or none if the name is not in the graph.
+    """
+    index = get_event_index(event_graph)[key_event].get(event)
+    if index is None:
+        return None
+    return event_graph.vertex(index)
+
+
+def get_module_nodes(event_graph: gt.Graph) -> list:
+    """
+    Get all modules, i.e., nodes with out degree of 0.
+    """
+    return [event_graph.vertex(v) for v in get_event_index(event_graph)[key_module]]
+
+
+def get_tag_nodes(event_graph: gt.Graph, tag: str) -> list:
+    """
+    Get all modules with the tag.
+    A module with a tag string instead of a list of tags matches any part of the string.
+    """
+    event_index = get_event_index(event_graph)
+    tag_index = event_index[key_tag].get(tag, [])
+    tag_string_index = [v for v, module_tags in event_index[key_tag_string] if tag in module_tags]
+    if len(tag_string_index) > 0:
+        tag_index = sorted(tag_index + tag_string_index)
+    return [event_graph.vertex(v) for v in tag_index]
+
+
+def get_ancestor_nodes(event_graph: gt.Graph, event_node: gt.Vertex) -> list:
+    """
+    Get the node and all nodes reaching it, as node indices.
+    """
+    ancestor_nodes = [int(event_node)]
+    visited = set(ancestor_nodes)
+    for v in ancestor_nodes:
+        for u in event_graph.vertex(v).in_neighbors():
+            if int(u) not in visited:
+                visited.add(int(u))
+                ancestor_nodes.append(int(u))
+    return ancestor_nodes
+
+
+def mark_event_dirty(event_graph: gt.Graph, event_node: gt.Vertex, edge_changed: bool=True) -> None:
+    """
+    Mark an event and all its ancestors dirty, after the edges, performance or metrics of the event change.
+    Cached subtotals of dirty events are recomputed on the next aggregation, and the rest of the graph is reused.
+    If edges change, cached path counts are dropped, and cached breakdowns are dropped on any change.
+    Counts written directly to the edge properties are detected by check_event_count, while factors and aggregations written directly leave all caches stale until this function is called.
+    """
+    with graph_cache_lock:
+        if edge_changed:
+            get_graph_cache(event_graph, key_path_count).clear()
+            get_graph_cache(event_graph, key_plan_data).clear()
+            # counts of the event are expected to change, unlike counts of other events
+            count_snapshot = get_graph_cache(event_graph, key_count_snapshot).get(None)
+            if count_snapshot is not None:
+                edge_index = [int(event_graph.edge_index[e]) for e in event_graph.vertex(int(event_node)).out_edges()]
+                count_snapshot[edge_index] = event_graph.ep.count.a[edge_index]
+        get_graph_cache(event_graph, key_breakdown).clear()
+
+        subtotal_cache = get_graph_cache(event_graph, key_subtotal)
+        if len(subtotal_cache) == 0:
+            return
+
+        dirty_nodes = get_ancestor_nodes(event_graph, event_node)
+        for _, is_clean, _ in subtotal_cache.values():
+            is_clean[dirty_nodes] = False
+
+    logger.debug(f'  Mark <{len(dirty_nodes)}> events dirty from event <{event_graph.vp.event[event_node]}>.')
+
+
+def check_event_count(event_graph: gt.Graph) -> None:
+    """
+    Drop all cached aggregations if counts of edges changed without mark_event_dirty, e.g., counts written directly to the edge property.
+    The counts are compared with a snapshot taken when the caches are filled, which only reads the count array.
+    """
+    with graph_cache_lock:
+        count_cache = get_graph_cache(event_graph, key_count_snapshot)
+        count = event_graph.ep.count.a
+        if None in count_cache and np.array_equal(count_cache[None], count):
+            return
+        if None in count_cache:
+            logger.info(f'Reset cached aggregations of event graph, since counts of edges change without mark_event_dirty.')
+            get_graph_cache(event_graph, key_path_count).clear()
+            get_graph_cache(event_graph, key_plan_data).clear()
+            get_graph_cache(event_graph, key_breakdown).clear()
+            for _, is_clean, _ in get_graph_cache(event_graph, key_subtotal).values():
+                is_clean[:] = False
+        count_cache[None] = count.copy()
+
+
+def hash_event_graph(event_graph: gt.Graph) -> str:
+    """
+    Hash the structure of the event graph, i.e., event names of all nodes and all edges.
+    Counts, factors and metrics are not part of the structure.
+    """
+    edges = event_graph.get_edges([event_graph.edge_index]).astype(np.int64)
+    edges = edges[np.argsort(edges[:, 2], kind='stable')]
+    structure_hash = hashlib.sha256()
+    structure_hash.update('\n'.join(event_graph.vp.event[v] for v in event_graph.vertices()).encode())
+    structure_hash.update(edges.tobytes())
+    return structure_hash.hexdigest()
+
+
+def compile_event_plan(event_graph: gt.Graph) -> OrderedDict:
+    """
+    Compile the structure of the event graph to a flat execution plan of arrays.
+    Each node has a level, which is 0 for modules, and 1 plus the maximum level of its subevents for events.
+    Edges are sorted by the level of their source node, so all events of a level are aggregated together after lower levels.
+    edge: edge index in the graph, to gather edge properties in plan order
+    edge_source, edge_target: node index of each edge
+    edge_level_ptr: edges from nodes of level l are edge[edge_level_ptr[l]:edge_level_ptr[l + 1]]
+    """
+    num_vertices = event_graph.num_vertices()
+    edges = event_graph.get_edges([event_graph.edge_index]).astype(np.int64)
+    edges = edges[np.argsort(edges[:, 2], kind='stable')]
+
+    # level of each node, from module to top event
+    topo_order = np.array(gt.topological_sort(event_graph), dtype=np.int64)[::-1]
+    level = np.zeros(num_vertices, dtype=np.int64)
+    for v in topo_order:
+        children = [int(u) for u in event_graph.vertex(v).out_neighbors()]
+        if len(children) > 0:
+            level[v] = level[children].max() + 1
+
+    edge_order = np.argsort(level[edges[:, 0]], kind='stable')
+    edges = edges[edge_order]
+    num_levels = int(level.max()) + 1 if num_vertices > 0 else 0
+    edge_level_ptr = np.searchsorted(level[edges[:, 0]], np.arange(num_levels + 1), side='left')
+
+    out_degree = np.bincount(edges[:, 0], minlength=num_vertices)
+    is_module = out_degree == 0
+    # events connected to other events, and events connected to modules
+    has_event_child = np.bincount(edges[:, 0], weights=~is_module[edges[:, 1]], minlength=num_vertices) > 0
+    has_module_child = np.bincount(edges[:, 0], weights=is_module[edges[:, 1]], minlength=num_vertices) > 0
+
+    plan = OrderedDict({
+        'version': plan_version,
+        'hash': hash_event_graph(event_graph),
+        'topo_order': topo_order,
+        'level': level,
+        'module': np.flatnonzero(is_module),
+        'has_event_child': has_event_child,
+        'has_module_child': has_module_child,
+        'edge': edges[:, 2],
+        'edge_source': edges[:, 0],
+        'edge_target': edges[:, 1],
+        'edge_level_ptr': edge_level_ptr,
+    })
+
+    logger.info(f'Compile event graph with <{num_vertices}> nodes and <{len(edges)}> edges to a plan of <{num_levels}> levels.')
+
+    return plan
+
+
+def get_event_plan(event_graph: gt.Graph) -> OrderedDict:
+    """
+    Get the execution plan of the event graph, which is compiled once per structure and shared by all graphs with the same structure.
+    """
+    plan_cache = get_graph_cache(event_graph, key_plan)
+    with graph_cache_lock:
+        if key_plan not in plan_cache:
+            structure_hash = hash_event_graph(event_graph)
+            if structure_hash not in plan_registry:
+                plan_registry[structure_hash] = compile_event_plan(event_graph)
+            plan_cache[key_plan] = plan_registry[structure_hash]
+        return plan_cache[key_plan]
+
+
+def save_event_plan(plan: OrderedDict, save_path: str) -> None:
+    save_path = get_path(save_path, check_exist=False)
+    with open(save_path, 'wb') as plan_file:
+        np.savez(plan_file, **plan)
+    logger.success(f'Save event plan to <{save_path}>.')
+
+
+def load_event_plan(ckpt_path: str, structure_hash: str=None) -> OrderedDict:
+    """
+    Load an execution plan, and register it for all graphs with the same structure.
+    A plan of another format version, or of another structure than structure_hash if given, is not registered, and None is returned.
+    """
+    full_path = get_path(ckpt_path)
+    with np.load(full_path) as plan_file:
+        plan = OrderedDict({key: plan_file[key] for key in plan_file.files})
+    version = int(plan['version']) if 'version' in plan else None
+    if version != plan_version:
+        logger.warning(f'Ignore event plan <{full_path}> of version <{version}>, which is not version <{plan_version}>.')
+        return None
+    plan['version'] = version
+    plan['hash'] = str(plan['hash'])
+    if structure_hash is not None and plan['hash'] != structure_hash:
+        logger.warning(f'Ignore event plan <{full_path}> of structure <{plan["hash"]}>, which is not structure <{structure_hash}>.')
+        return None
+    with graph_cache_lock:
+        plan_registry.setdefault(plan['hash'], plan)
+    logger.success(f'Load event plan from <{full_path}>.')
+    return plan_registry[plan['hash']]
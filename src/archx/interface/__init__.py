@@ -1 +1 @@
-from .interface import query_interface, register_interface, unregister_interface, copy_interface
+from .interface import query_interface, query_interface_batch, build_interface, prefetch_interface, load_interface, reload_interface, get_interface_cache_dir, get_interface_cache_stats, register_interface, unregister_interface, copy_interface
@@ -1,9 +1,22 @@
-import subprocess, os, time, random, copy
+import subprocess, os, copy, tempfile, shutil, hashlib, fcntl, json
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from loguru import logger
 
+from archx.interface.interface import get_interface_cache_dir, hash_interface_query, read_interface_cache, write_interface_cache
+
+
+cacti_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'include/cacti7')
+cacti_path = os.path.join(cacti_dir, 'cacti')
+# the lock, checksum and build marker are shared by all processes
+cacti_lock_path = os.path.join(cacti_dir, '.cacti.lock')
+cacti_checksum_path = os.path.join(cacti_dir, '.cacti.sha256')
+cacti_building_path = os.path.join(cacti_dir, '.cacti.building')
+# the binary is verified once per process
+cacti_verified = False
+
 
 def cacti7_run(
     mem_type: str,
@@ -51,168 +64,232 @@ def cacti7_run(
     original.close()
     target.close()
 
-    run_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'include/cacti7')
-    if not os.path.exists(os.path.join(run_dir, 'cacti')):
-        subprocess.call(['make', 'all'], shell=True, cwd=run_dir)
-        time.sleep(10)
-    
-    tartget_cacti_name = result_file.replace('//', '/').replace('/', '_').split('.')[0] + '_'
-    tartget_cacti_name += str(time.time())
+    run_cacti7(target_cfg_file, result_file)
 
-    rep_cmd = 'cp ./cacti ./cacti_' + tartget_cacti_name
-    subprocess.call([rep_cmd], shell=True, cwd=run_dir)
-    final_cmd = './cacti_' + tartget_cacti_name + ' -infile ' + target_cfg_file + ' > ' + result_file
-    subprocess.call([final_cmd], shell=True, cwd=run_dir)
-    rm_cmd = 'rm -rf ./cacti_' + tartget_cacti_name
-    subprocess.call([rm_cmd], shell=True, cwd=run_dir)
 
+def get_cacti_checksum() -> str:
+    with open(cacti_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
-def parse_report_line_count(
-    report=None,
-    index=64
-):
-    # get the area and power numbers in the report for final memory power and energy estimation.
-    cacti_out = open(report, 'r')
+
+def verify_cacti() -> bool:
+    """
+    the binary is valid if its build completed, and it matches the checksum recorded after the build
+    a prebuilt binary without a checksum is recorded on first use
+    """
+    if not os.path.isfile(cacti_path) or os.path.exists(cacti_building_path):
+        return False
+    if not os.path.isfile(cacti_checksum_path):
+        with open(cacti_checksum_path, 'w') as f:
+            f.write(get_cacti_checksum())
+        return True
+    with open(cacti_checksum_path, 'r') as f:
+        return f.read().strip() == get_cacti_checksum()
+
+
+def build(rebuild: bool=False) -> str:
+    """
+    build the cacti binary once, guarded by a file lock shared by all processes, and return the path of the binary
+    concurrent processes wait for the lock instead of building again
+    """
+    global cacti_verified
+    with open(cacti_lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if rebuild or not verify_cacti():
+                logger.info(f'Build CACTI7 in <{cacti_dir}>.')
+                open(cacti_building_path, 'w').close()
+                if os.path.exists(cacti_checksum_path):
+                    os.remove(cacti_checksum_path)
+                build_result = subprocess.run(['make', 'all'], cwd=cacti_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                assert build_result.returncode == 0 and os.path.isfile(cacti_path), logger.error(f'Failed to build CACTI7 in <{cacti_dir}>:\n{build_result.stdout}')
+                with open(cacti_checksum_path, 'w') as f:
+                    f.write(get_cacti_checksum())
+                os.remove(cacti_building_path)
+                logger.success(f'Build CACTI7 binary <{cacti_path}>.')
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    cacti_verified = True
+    return cacti_path
+
+
+def run_cacti7(target_cfg_file: str, result_file: str) -> None:
+    """
+    run the cacti binary in a temporary working dir of this job, so concurrent jobs share one binary without copies
+    cacti reads tech_params and contention.dat from, and appends out.csv to its working dir
+    """
+    if not cacti_verified:
+        build(rebuild=False)
+
+    job_dir = tempfile.mkdtemp(prefix='cacti7_')
+    try:
+        for file in ['tech_params', 'contention.dat']:
+            os.symlink(os.path.join(cacti_dir, file), os.path.join(job_dir, file))
+        with open(result_file, 'w') as result:
+            subprocess.call([cacti_path, '-infile', os.path.abspath(target_cfg_file)], cwd=job_dir, stdout=result)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+# labels of the fields in cacti reports, the first line with a label is used
+cacti_label_dict = OrderedDict({
+    'Block size': 'block_size', # unit: byte
+    'array type': 'array_type',
+    'Number of banks': 'bank',
+    'Access time (ns)': 'access_time', # unit: ns
+    'Cycle time (ns)': 'cycle_time', # unit: ns
+    'Total dynamic read energy per access (nJ)': 'dynamic_energy_rd', # unit: nJ
+    'Total dynamic write energy per access (nJ)': 'dynamic_energy_wr', # unit: nJ
+    'Total leakage power of a bank (mW)': 'leakage_power_bank', # unit: mW
+    'Total gate leakage power of a bank (mW)': 'gate_leakage_power_bank', # unit: mW
+    'Activate Energy (nJ)': 'activate_energy', # unit: nJ
+    'Read Energy (nJ)': 'energy_rd', # unit: nJ
+    'Write Energy (nJ)': 'energy_wr', # unit: nJ
+    'Precharge Energy (nJ)': 'precharge_energy', # unit: nJ
+    'Leakage Power Closed Page (mW)': 'leakage_power_closed_page', # unit: mW
+    'Leakage Power Open Page (mW)': 'leakage_power_open_page', # unit: mW
+    'Leakage Power I/O (mW)': 'leakage_power_IO', # unit: mW
+    'Refresh power (mW)': 'refresh_power', # unit: mW
+    'Cache height x width (mm)': 'height_width' # unit: mm
+})
+# fields required in the report of each memory class, a report missing any of them is broken
+cacti_field_dict = OrderedDict({
+    'sram': ['block_size', 'array_type', 'bank', 'access_time', 'cycle_time', 'dynamic_energy_rd', 'dynamic_energy_wr', 'leakage_power_bank', 'gate_leakage_power_bank', 'height_width'],
+    'dram': ['array_type', 'bank', 'access_time', 'cycle_time', 'activate_energy', 'energy_rd', 'energy_wr', 'precharge_energy', 'leakage_power_closed_page', 'leakage_power_open_page', 'leakage_power_IO', 'refresh_power', 'height_width']
+})
+
+
+def parse_report(
+    report: str,
+    query_class: str
+) -> OrderedDict:
+    """
+    parse the fields of a cacti report in one pass, with fields found by label instead of line number
+    return none if the report is missing, truncated or broken, i.e., any field of the memory class is missing or invalid
+    """
+    field_list = cacti_field_dict['sram' if query_class == 'sram' else 'dram']
+    if not os.path.isfile(report):
+        return None
+
+    # a line after the last field shows the field is not cut off at the end of a truncated report
+    field_dict = OrderedDict()
     line_idx = 0
-    for entry in cacti_out:
-        line_idx += 1
-    broken_rpt = line_idx <= index
-    return broken_rpt
+    field_line_idx = 0
+    with open(report, 'r') as cacti_out:
+        for entry in cacti_out:
+            line_idx += 1
+            if ':' not in entry:
+                continue
+            label = entry.split(':')[0].strip()
+            if label not in cacti_label_dict or cacti_label_dict[label] in field_dict:
+                continue
+            value = entry.strip().split(':')[-1].strip()
+            try:
+                if cacti_label_dict[label] == 'array_type':
+                    field_dict['array_type'] = value
+                elif cacti_label_dict[label] == 'height_width':
+                    field_dict['height_width'] = [float(value.split('x')[0].strip()), float(value.split('x')[1].strip())]
+                else:
+                    field_dict[cacti_label_dict[label]] = float(value)
+            except (ValueError, IndexError):
+                return None
+            field_line_idx = line_idx
+
+    if any(field not in field_dict for field in field_list) or line_idx <= field_line_idx:
+        return None
+    return OrderedDict((field, field_dict[field]) for field in field_list)
+
+
+def load_report(
+    report: str,
+    query_class: str
+) -> OrderedDict:
+    """
+    load the parsed fields of a cacti report from its json sidecar, or parse the report and write the sidecar
+    return none if the report is broken
+    """
+    sidecar = report + '.json'
+    if os.path.isfile(sidecar) and os.path.isfile(report) and os.path.getmtime(sidecar) >= os.path.getmtime(report):
+        with open(sidecar, 'r') as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
 
+    field_dict = parse_report(report, query_class)
+    if field_dict is not None:
+        with open(sidecar, 'w') as f:
+            json.dump(field_dict, f)
+    return field_dict
 
-def parse_report_sram(
-    report=None
+
+def get_report_sram(
+    field_dict: OrderedDict
 ):
     # get the area and power numbers in the report for final memory power and energy estimation.
-    cacti_out = open(report, 'r')
-
-    line_idx = 0
-    for entry in cacti_out:
-        line_idx += 1
-        if line_idx == 12:
-            ram_type = entry.strip().split(':')[-1].strip()
-            assert ram_type == 'Scratch RAM', 'Invalid SRAM type.'
-        if line_idx == 50:
-            # unit: ns
-            bank = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 58:
-            # unit: ns
-            access_time = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 59:
-            # unit: ns
-            cycle_time = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 60:
-            # unit: nJ
-            dynamic_energy_rd = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 61:
-            # unit: nJ
-            dynamic_energy_wr = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 62:
-            # unit: mW
-            leakage_power_bank = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 63:
-            # unit: mW
-            gate_leakage_power_bank = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 64:
-            # unit: mm^2
-            height = float(entry.strip().split(':')[-1].split('x')[0].strip())
-            width = float(entry.strip().split(':')[-1].split('x')[1].strip())
-            area = height * width
-
-        if line_idx == 2:
-            # unit: byte
-            block_sz_bytes = float(entry.strip().split(':')[-1].strip())
-    
-    broken_rpt = parse_report_line_count(report, 64)
-    assert not broken_rpt, logger.error('Check ' + report + ' for sram cacti failure.')
+    assert field_dict['array_type'] == 'Scratch RAM', 'Invalid SRAM type.'
 
     # MHz
-    max_freq = 1 / cycle_time * 1000
+    max_freq = 1 / field_dict['cycle_time'] * 1000
     # nJ
-    energy_per_rd_nJ = dynamic_energy_rd
+    energy_per_rd_nJ = field_dict['dynamic_energy_rd']
     # nJ
-    energy_per_wr_nJ = dynamic_energy_wr
+    energy_per_wr_nJ = field_dict['dynamic_energy_wr']
     # mW
-    leakage_power_mW = (leakage_power_bank + gate_leakage_power_bank) * bank
+    leakage_power_mW = (field_dict['leakage_power_bank'] + field_dict['gate_leakage_power_bank']) * field_dict['bank']
     # mm^2
-    total_area_mm2 = area
-    cacti_out.close()
-    return energy_per_rd_nJ, energy_per_wr_nJ, leakage_power_mW, total_area_mm2, block_sz_bytes, max_freq
+    total_area_mm2 = field_dict['height_width'][0] * field_dict['height_width'][1]
+    return energy_per_rd_nJ, energy_per_wr_nJ, leakage_power_mW, total_area_mm2, field_dict['block_size'], max_freq
 
 
-def parse_report_dram(
-    report=None
+def get_report_dram(
+    field_dict: OrderedDict
 ):
     # get the area and power numbers in the report for final memory power and energy estimation.
-    cacti_out = open(report, 'r')
-
-    line_idx = 0
-    for entry in cacti_out:
-        line_idx += 1
-        if line_idx == 12:
-            ram_type = entry.strip().split(':')[-1].strip()
-            assert ram_type == 'Scratch RAM', 'Invalid DRAM type.'
-        if line_idx == 50:
-            # unit: ns
-            bank = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 58:
-            # unit: ns
-            access_time = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 59:
-            # unit: ns
-            cycle_time = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 61:
-            # unit: nJ
-            activate_energy = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 62:
-            # unit: nJ
-            energy_rd = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 63:
-            # unit: nJ
-            energy_wr = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 64:
-            # unit: nJ
-            precharge_energy = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 65:
-            # unit: mW
-            leakage_power_closed_page = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 66:
-            # unit: mW
-            leakage_power_open_page = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 67:
-            # unit: mW
-            leakage_power_IO = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 68:
-            # unit: mW
-            refresh_power = float(entry.strip().split(':')[-1].strip())
-        if line_idx == 69:
-            # unit: mm^2
-            height = float(entry.strip().split(':')[-1].split('x')[0].strip())
-            width = float(entry.strip().split(':')[-1].split('x')[1].strip())
-            area = height * width
-
-    broken_rpt = parse_report_line_count(report, 69)
-    assert not broken_rpt, logger.error('Check ' + report + ' for dram cacti failure.')
+    assert field_dict['array_type'] == 'Scratch RAM', 'Invalid DRAM type.'
 
     # MHz
-    max_freq = 1 / cycle_time * 1000
-    cacti_out.close()
-    return activate_energy, energy_rd, energy_wr, precharge_energy, leakage_power_closed_page, leakage_power_open_page, leakage_power_IO, refresh_power, area, max_freq
+    max_freq = 1 / field_dict['cycle_time'] * 1000
+    # mm^2
+    area = field_dict['height_width'][0] * field_dict['height_width'][1]
+    return field_dict['activate_energy'], field_dict['energy_rd'], field_dict['energy_wr'], field_dict['precharge_energy'], field_dict['leakage_power_closed_page'], field_dict['leakage_power_open_page'], field_dict['leakage_power_IO'], field_dict['refresh_power'], area, max_freq
 
 
-def query(name: str, interface: str, query: OrderedDict, input_dir=None, output_dir=None):
-    query = copy.deepcopy(query)
-    query_class = query['class'].lower()
-    query_technology = query['technology']
-    query_frequency = query['frequency']
-    del query['class']
-    del query['technology']
-    del query['frequency']
+def parse_report_sram(
+    report=None
+):
+    field_dict = load_report(report, 'sram')
+    assert field_dict is not None, logger.error('Check ' + report + ' for sram cacti failure.')
+    return get_report_sram(field_dict)
 
-    assert os.path.isdir(output_dir), logger.error(f'Invalid output dir <{output_dir}>.')
+
+def parse_report_dram(
+    report=None
+):
+    field_dict = load_report(report, 'dram')
+    assert field_dict is not None, logger.error('Check ' + report + ' for dram cacti failure.')
+    return get_report_dram(field_dict)
+
+
+def get_cacti7_config(query_class: str, query_technology, query: OrderedDict) -> OrderedDict:
+    # cacti only depends on the memory type, technology and memory size
+    if query_class == 'sram':
+        return OrderedDict({'report': 'cacti7', 'class': 'sram', 'technology': query_technology, 'width': query['width'], 'depth': query['depth'], 'bank': query['bank']})
+    else:
+        return OrderedDict({'report': 'cacti7', 'class': 'ddr4', 'technology': query_technology, 'size': query['size']})
+
+
+def get_cacti7_report(name: str, query_class: str, query_technology, query: OrderedDict, output_dir: str) -> list:
+    """
+    get the parsed cacti report of a memory from the shared store of all runs
+    if the memory is not in the store, run cacti in the output dir, and keep the parsed report in the store
+    """
+    cache_dir = get_interface_cache_dir()
+    if cache_dir is not None:
+        cache_key = hash_interface_query('cacti7', get_cacti7_config(query_class, query_technology, query))
+        cacti_report = read_interface_cache(cache_dir, cache_key)
+        if cacti_report is not None:
+            return cacti_report
 
     origin_cfg_file = os.path.dirname(os.path.abspath(__file__))
-    assert query_class in ['sram', 'dram', 'ddr4'], logger.error(f'Invalid <{query_class}> in CACTI7; valid values: [sram, dram, ddr4]')
     if query_class == 'sram':
         origin_cfg_file = origin_cfg_file + '/sram.cfg'
     elif query_class in ['dram', 'ddr4']:
@@ -227,23 +304,81 @@ def query(name: str, interface: str, query: OrderedDict, input_dir=None, output_
     target_cfg_file = os.path.join(output_dir, name + post_fix + '.cacti7.cfg')
     cacti_report = os.path.join(output_dir, name + post_fix + '.cacti7.rpt')
 
+    # an existing report is parsed, or loaded from its sidecar, once; a broken report is run again
     target_cfg_file_flag = target_cfg_file + '.flag'
-    if not os.path.exists(target_cfg_file_flag):
+    field_dict = None
+    if os.path.exists(target_cfg_file_flag):
+        field_dict = load_report(cacti_report, query_class)
+        if field_dict is None:
+            for file in [cacti_report, cacti_report + '.json', target_cfg_file_flag]:
+                if os.path.exists(file):
+                    os.remove(file)
+    if field_dict is None:
         cacti7_run(query_class, query_technology, query, origin_cfg_file, target_cfg_file, cacti_report)
+        field_dict = load_report(cacti_report, query_class)
+        assert field_dict is not None, logger.error('Check ' + cacti_report + ' for ' + query_class + ' cacti failure.')
         f = open(target_cfg_file_flag, 'a')
         f.write(target_cfg_file_flag)
         f.close()
-    else:
-        broken_rpt = parse_report_line_count(cacti_report, 64)
-        if broken_rpt:
-            os.remove(cacti_report)
-            os.remove(target_cfg_file_flag)
-            cacti7_run(query_class, query_technology, query, origin_cfg_file, target_cfg_file, cacti_report)
 
     if query_class == 'sram':
-        energy_per_rd_nJ, energy_per_wr_nJ, leakage_power_mW, total_area_mm2, _, _ = parse_report_sram(cacti_report)
+        cacti_report = list(get_report_sram(field_dict))
+    elif query_class in ['dram', 'ddr4']:
+        cacti_report = list(get_report_dram(field_dict))
+
+    if cache_dir is not None:
+        write_interface_cache(cache_dir, cache_key, cacti_report)
+    return cacti_report
+
+
+def prefetch(query_list: list, output_dir: str, max_workers: int=None) -> int:
+    """
+    run cacti once for each unique memory in the query list with a bounded pool, and keep the parsed reports in the shared store of all runs
+    return the number of cacti runs
+    """
+    cache_dir = get_interface_cache_dir()
+    if cache_dir is None:
+        logger.warning(f'Skip CACTI7 prefetch, since the interface cache is disabled.')
+        return 0
+
+    # unique memories not in the store
+    prefetch_dict = OrderedDict()
+    for query in query_list:
+        query_class = query['class'].lower()
+        assert query_class in ['sram', 'dram', 'ddr4'], logger.error(f'Invalid <{query_class}> in CACTI7; valid values: [sram, dram, ddr4]')
+        cache_key = hash_interface_query('cacti7', get_cacti7_config(query_class, query['technology'], query))
+        if cache_key not in prefetch_dict and read_interface_cache(cache_dir, cache_key) is None:
+            prefetch_dict[cache_key] = (query_class, query)
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(get_cacti7_report, 'prefetch_' + cache_key[:16], query_class, query['technology'], query, output_dir) for cache_key, (query_class, query) in prefetch_dict.items()]
+        for future in futures:
+            future.result()
+
+    logger.success(f'Prefetch <{len(prefetch_dict)}> CACTI7 runs for <{len(query_list)}> queries.')
+    return len(prefetch_dict)
+
+
+def query(name: str, interface: str, query: OrderedDict, input_dir=None, output_dir=None):
+    query = copy.deepcopy(query)
+    query_class = query['class'].lower()
+    query_technology = query['technology']
+    query_frequency = query['frequency']
+    del query['class']
+    del query['technology']
+    del query['frequency']
+
+    assert os.path.isdir(output_dir), logger.error(f'Invalid output dir <{output_dir}>.')
+
+    assert query_class in ['sram', 'dram', 'ddr4'], logger.error(f'Invalid <{query_class}> in CACTI7; valid values: [sram, dram, ddr4]')
+    cacti_report = get_cacti7_report(name, query_class, query_technology, query, output_dir)
+
+    if query_class == 'sram':
+        energy_per_rd_nJ, energy_per_wr_nJ, leakage_power_mW, total_area_mm2, _, _ = cacti_report
     elif query_class in ['dram', 'ddr4']:
-        activate_energy, energy_rd, energy_wr, precharge_energy, leakage_power_closed_page, leakage_power_open_page, leakage_power_IO, refresh_power, area, max_freq = parse_report_dram(cacti_report)
+        activate_energy, energy_rd, energy_wr, precharge_energy, leakage_power_closed_page, leakage_power_open_page, leakage_power_IO, refresh_power, area, max_freq = cacti_report
         
         if 'embedded' not in query or query['embedded'] is False:
             IO_power_factor = 1.
@@ -0,0 +1,167 @@
+import copy, json, hashlib, threading
+import numpy as np
+
+from collections import OrderedDict
+from loguru import logger
+
+from archx.interface.interface import load_interface, get_interface_cache_dir, connect_interface_cache
+
+
+# relative error of the surrogate, above which cacti is run and the result is added to the training set
+# cacti picks discrete array organizations, so its results scatter around a smooth surface by about 10%
+default_tolerance = 0.15
+# sram attributes in the surrogate, in log space
+attribute_list = ['width', 'depth', 'bank']
+# estimates depend on the samples added by earlier queries, so results are not kept in the interface cache
+cache_result = False
+
+# training samples and fitted surfaces of each technology, shared by all queries in this process
+sample_registry = OrderedDict()
+model_registry = OrderedDict()
+surrogate_lock = threading.RLock()
+
+
+def get_feature(attribute_array: np.ndarray) -> np.ndarray:
+    """
+    quadratic polynomial features with cross terms of the log attributes
+    """
+    log_array = np.log(np.atleast_2d(attribute_array))
+    feature_list = [np.ones(log_array.shape[0])]
+    for i in range(log_array.shape[1]):
+        feature_list.append(log_array[:, i])
+    for i in range(log_array.shape[1]):
+        for j in range(i, log_array.shape[1]):
+            feature_list.append(log_array[:, i] * log_array[:, j])
+    return np.stack(feature_list, axis=1)
+
+
+def connect_sample_table():
+    # training samples are kept in the interface cache, and are shared by all runs
+    cache_dir = get_interface_cache_dir()
+    if cache_dir is None:
+        return None
+    return connect_interface_cache(cache_dir, table='CREATE TABLE IF NOT EXISTS cacti7_surrogate (key TEXT PRIMARY KEY, technology TEXT NOT NULL, value TEXT NOT NULL)')
+
+
+def get_samples(query_technology) -> OrderedDict:
+    """
+    get the training samples of a technology, keyed by attributes, with results as values
+    """
+    technology = str(query_technology)
+    with surrogate_lock:
+        if technology not in sample_registry:
+            sample_registry[technology] = OrderedDict()
+            connection = connect_sample_table()
+            if connection is not None:
+                for (value,) in connection.execute('SELECT value FROM cacti7_surrogate WHERE technology = ?', (technology,)):
+                    attribute, result = json.loads(value)
+                    sample_registry[technology][tuple(attribute)] = result
+        return sample_registry[technology]
+
+
+def add_sample(query_technology, attribute: tuple, result: list) -> None:
+    technology = str(query_technology)
+    with surrogate_lock:
+        get_samples(query_technology)[attribute] = result
+        model_registry.pop(technology, None)
+
+    connection = connect_sample_table()
+    if connection is not None:
+        key = hashlib.sha256(json.dumps([technology, attribute]).encode()).hexdigest()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO cacti7_surrogate (key, technology, value) VALUES (?, ?, ?)', (key, technology, json.dumps([attribute, result])))
+
+
+def fit(query_technology) -> OrderedDict:
+    """
+    fit one log-space quadratic surface per result over the training samples of a technology
+    the leave-one-out residuals give the error estimate of predictions
+    return none if there are too few samples
+    """
+    technology = str(query_technology)
+    with surrogate_lock:
+        if technology in model_registry:
+            return model_registry[technology]
+
+        samples = get_samples(query_technology)
+        attribute_array = np.array(list(samples.keys()), dtype=float).reshape(-1, len(attribute_list))
+        feature = get_feature(attribute_array) if len(samples) > 0 else None
+        model = None
+        # at least two more samples than terms, so the leave-one-out error is meaningful
+        if feature is not None and len(samples) >= feature.shape[1] + 2:
+            target = np.log(np.array(list(samples.values()), dtype=float))
+            coefficient, _, rank, _ = np.linalg.lstsq(feature, target, rcond=None)
+            if rank == feature.shape[1]:
+                inverse = np.linalg.pinv(feature.T @ feature)
+                leverage = np.einsum('ij,jk,ik->i', feature, inverse, feature)
+                loo_residual = (target - feature @ coefficient) / (1 - np.minimum(leverage, 1 - 1e-12))[:, None]
+                model = OrderedDict({
+                    'coefficient': coefficient,
+                    'inverse': inverse,
+                    'sigma': np.sqrt(np.mean(loo_residual ** 2, axis=0)),
+                    'low': np.log(attribute_array.min(axis=0)),
+                    'high': np.log(attribute_array.max(axis=0))
+                })
+                logger.info(f'Fit CACTI7 surrogate of technology <{technology}> with <{len(samples)}> samples.')
+        model_registry[technology] = model
+        return model
+
+
+def predict(query_technology, attribute: tuple) -> tuple:
+    """
+    predict the results of an sram, and the relative error estimate
+    the error is infinite without a model, or outside the range of the training samples
+    """
+    model = fit(query_technology)
+    if model is None:
+        return None, float('inf')
+
+    log_attribute = np.log(np.array(attribute, dtype=float))
+    if np.any(log_attribute < model['low']) or np.any(log_attribute > model['high']):
+        return None, float('inf')
+
+    feature = get_feature(np.array(attribute, dtype=float))
+    leverage = float(feature[0] @ model['inverse'] @ feature[0])
+    log_error = float(np.max(model['sigma'])) * np.sqrt(1 + leverage)
+    prediction = np.exp(feature[0] @ model['coefficient'])
+    return [float(value) for value in prediction], float(np.expm1(log_error))
+
+
+def query(name: str, interface: str, query: OrderedDict, input_dir=None, output_dir=None):
+    query = copy.deepcopy(query)
+    query_class = query['class'].lower()
+    query_technology = query['technology']
+    query_frequency = query['frequency']
+    tolerance = float(query.pop('tolerance', default_tolerance))
+
+    # only sram is modeled, other memories are queried in cacti
+    cacti7_py = load_interface('cacti7')
+    if query_class != 'sram':
+        return cacti7_py.query(name, 'cacti7', query, input_dir, output_dir)
+
+    attribute = tuple(float(query[key]) for key in attribute_list)
+    result, error = predict(query_technology, attribute)
+    if error > tolerance:
+        logger.info(f'Run CACTI7 for module <{name}>, since the surrogate error <{error}> is above tolerance <{tolerance}>.')
+        output_dict = cacti7_py.query(name, 'cacti7', query, input_dir, output_dir)
+        add_sample(query_technology, attribute, [output_dict['dynamic_energy']['read']['value'], output_dict['dynamic_energy']['write']['value'], output_dict['leakage_power']['value'], output_dict['area']['value']])
+        output_dict['error'] = OrderedDict({'value': 0., 'unit': 'ratio'})
+        return output_dict
+
+    energy_per_rd_nJ, energy_per_wr_nJ, leakage_power_mW, total_area_mm2 = result
+    logger.info(f'Estimate module <{name}> with the CACTI7 surrogate, with error <{error}>.')
+
+    output_dict = OrderedDict()
+    output_dict['technology'] = OrderedDict({'value': query_technology, 'unit': 'nm'})
+    output_dict['frequency'] = OrderedDict({'value': query_frequency, 'unit': 'MHz'})
+    output_dict['dynamic_energy'] = OrderedDict({'read': OrderedDict({'value': energy_per_rd_nJ, 'unit': 'nJ'}),
+                                                 'write': OrderedDict({'value': energy_per_wr_nJ, 'unit': 'nJ'})})
+    output_dict['leakage_power'] = OrderedDict({'value': leakage_power_mW, 'unit': 'mW'})
+    output_dict['area'] = OrderedDict({'value': total_area_mm2, 'unit': 'mm^2'})
+    output_dict['error'] = OrderedDict({'value': error, 'unit': 'ratio'})
+
+    return output_dict
+
+
+if __name__ == '__main__':
+    pass
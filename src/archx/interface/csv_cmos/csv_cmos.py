@@ -1,71 +1,57 @@
-import csv, os, copy
+import os
+import numpy as np
 
 from collections import OrderedDict
-from loguru import logger
 
-from archx.utils import get_path, interpolate_oneD_linear, interpolate_oneD_quadratic
+from archx.utils import get_path, query_csv_batch
 
 
-skip_list = ['technology', 'frequency', 'interpolation', 'dynamic_uw', 'leakage_uw', 'area_mm2']
-interpolation_list = ['linear', 'quadratic']
+# columns of dynamic power, leakage power and area, and the divisor of each column
+value_column_list = ['dynamic_uw', 'leakage_uw', 'area_mm2']
+value_scale_list = [1, 1, 1]
 
 
-def query(name: str, interface: str, query: OrderedDict, input_dir=None, output_dir=None):
-    query = copy.deepcopy(query)
-    query_class = query['class'].lower()
-    query_technology = query['technology']
-    query_frequency = query['frequency']
-    del query['class']
-    del query['technology']
-    del query['frequency']
-
-    csv_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'include/csv')
-    csv_file = get_path(os.path.join(csv_dir, query_class + '.csv'))
-
-    with open(csv_file) as csv_file:
-        reader = csv.DictReader(csv_file)
-        technology_flag = False
-        for row in reader:
-            interpolation = row['interpolation'].lower()
-
-            # no technology scaling
-            if row['technology'] == str(query_technology):
-                technology_flag = True
-                dynamic_power_mW = float(row['dynamic_uw']) # in mW
-                leakage_power_mW = float(row['leakage_uw']) # in mW
-                area_mm2 = float(row['area_mm2']) # in mm^2
-
-                # frequency scaling (dynamic power)
-                dynamic_power_mW *= (query_frequency / float(row['frequency'])) # in mW
-
-                for attr_key in query:
-                    assert attr_key in row, logger.error(f'Invalid query attribute <{attr_key}>.')
+def get_csv_dir(input_dir=None) -> str:
+    # tables are read from the input dir if given, e.g., tables of a user or a test, otherwise from the tables of the interface
+    if input_dir is not None:
+        return get_path(input_dir)
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'include/csv')
 
-                for attr_key in row:
-                    if attr_key not in skip_list:
-                        if attr_key not in query:
-                            query[attr_key] = 1
-                        if interpolation == 'linear':
-                            dynamic_power_mW   = interpolate_oneD_linear(    query[attr_key], [{'x': 0, 'y': 0}, {'x': float(row[attr_key]), 'y': dynamic_power_mW}])
-                            leakage_power_mW   = interpolate_oneD_linear(    query[attr_key], [{'x': 0, 'y': 0}, {'x': float(row[attr_key]), 'y': leakage_power_mW}])
-                            area_mm2           = interpolate_oneD_linear(    query[attr_key], [{'x': 0, 'y': 0}, {'x': float(row[attr_key]), 'y': area_mm2}])
-                        elif interpolation == 'quadratic':
-                            dynamic_power_mW   = interpolate_oneD_quadratic( query[attr_key], [{'x': 0, 'y': 0}, {'x': float(row[attr_key]), 'y': dynamic_power_mW}])
-                            leakage_power_mW   = interpolate_oneD_quadratic( query[attr_key], [{'x': 0, 'y': 0}, {'x': float(row[attr_key]), 'y': leakage_power_mW}])
-                            area_mm2           = interpolate_oneD_quadratic( query[attr_key], [{'x': 0, 'y': 0}, {'x': float(row[attr_key]), 'y': area_mm2}])
-                        else:
-                            assert interpolation in interpolation_list, logger.error(f'Invalid interpolation <{interpolation}> in <{csv_file}>. Valid options are <{str(interpolation_list)}>.')
-
-        assert technology_flag is True, logger.error(f'Invalid technology: <{query_technology}>.')
-
-    energy_per_event_nJ = dynamic_power_mW / query_frequency
-
-    output_dict = OrderedDict()
-    output_dict['technology'] = OrderedDict({'value': query_technology, 'unit': 'nm'})
-    output_dict['frequency'] = OrderedDict({'value': query_frequency, 'unit': 'MHz'})
-    output_dict['dynamic_energy'] = OrderedDict({'value': energy_per_event_nJ, 'unit': 'nJ'})
-    output_dict['leakage_power'] = OrderedDict({'value': leakage_power_mW, 'unit': 'mW'})
-    output_dict['area'] = OrderedDict({'value': area_mm2, 'unit': 'mm^2'})
-
-    return output_dict
 
+def query(name: str, interface: str, query: OrderedDict, input_dir=None, output_dir=None):
+    # a single query is a batch of one, so both share the evaluation in query_csv_batch
+    return query_batch([name], interface, [query], input_dir=input_dir, output_dir=output_dir)[0]
+
+
+def query_batch(name_list: list, interface: str, query_list: list, input_dir=None, output_dir=None) -> list:
+    """
+    vectorized query of many modules, e.g., all modules of a class in all configs of a sweep
+    queries with the same class and technology are evaluated together, see query_csv_batch
+    """
+    csv_dir = get_csv_dir(input_dir)
+
+    group_dict = OrderedDict()
+    for index, query in enumerate(query_list):
+        group_dict.setdefault((query['class'].lower(), query['technology']), []).append(index)
+
+    output_list = [None] * len(query_list)
+    for (query_class, query_technology), index_list in group_dict.items():
+        csv_file = get_path(os.path.join(csv_dir, query_class + '.csv'))
+        query_frequency = np.array([query_list[index]['frequency'] for index in index_list], dtype=float)
+        value = query_csv_batch(csv_file, query_technology, query_frequency, [query_list[index] for index in index_list], value_column_list, value_scale_list)
+
+        dynamic_power_mW = value[:, 0] # in mW
+        leakage_power_mW = value[:, 1] # in mW
+        area_mm2 = value[:, 2] # in mm^2
+        energy_per_event_nJ = dynamic_power_mW / query_frequency
+
+        for position, index in enumerate(index_list):
+            output_dict = OrderedDict()
+            output_dict['technology'] = OrderedDict({'value': query_technology, 'unit': 'nm'})
+            output_dict['frequency'] = OrderedDict({'value': query_list[index]['frequency'], 'unit': 'MHz'})
+            output_dict['dynamic_energy'] = OrderedDict({'value': float(energy_per_event_nJ[position]), 'unit': 'nJ'})
+            output_dict['leakage_power'] = OrderedDict({'value': float(leakage_power_mW[position]), 'unit': 'mW'})
+            output_dict['area'] = OrderedDict({'value': float(area_mm2[position]), 'unit': 'mm^2'})
+            output_list[index] = output_dict
+
+    return output_list
@@ -1,6 +1,8 @@
-import shutil, os, sys, copy
+import shutil, os, sys, copy, threading, json, hashlib, sqlite3
 import importlib.util
 
+from concurrent.futures import ThreadPoolExecutor
+
 from collections import OrderedDict
 from loguru import logger
 
@@ -9,29 +11,345 @@ from archx.utils import get_path
 
 key_interface = 'interface'
 
+# interface backends loaded once per process, keyed by interface name, with the modification time of the interface file
+interface_registry = OrderedDict()
+interface_lock = threading.RLock()
+
+# results of interface queries are cached across processes and run directories, unless the cache dir is set to off
+key_cache_env = 'ARCHX_INTERFACE_CACHE'
+default_cache_dir = os.path.join('~', '.cache', 'archx', 'interface')
+disabled_cache_dir = ['', 'off', 'none', '0']
+cache_file = 'interface.db'
+# each thread keeps one connection per cache dir
+interface_connection_local = threading.local()
+# sqlite limits the number of variables in a statement, so batch reads are split into chunks
+cache_read_chunk = 500
+# hash of each interface, with the modification time of its files and directories when hashed
+interface_hash_registry = OrderedDict()
+interface_cache_stats = OrderedDict({'hit': 0, 'miss': 0})
+
 
-def query_interface(module: str, query: OrderedDict, input_dir=None, output_dir=None) -> OrderedDict:
+def query_interface(module: str, query: OrderedDict, input_dir=None, output_dir=None, use_cache: bool=True) -> OrderedDict:
     """
     query is a dictionary with query configurations
+    if use_cache is true, the result is read from and written to the interface cache, unless the interface sets cache_result to false
+    results of an input dir are not cached, since the hash of the interface does not cover the files in the input dir
     """
     query = copy.deepcopy(query)
     assert key_interface in query, logger.error(f'Invalid query: <{query}>. Must contain <{key_interface}>. Possible undefined attribute in archtitecture dictionary.')
     q_interface = query[key_interface]
-    dst_file = os.path.join(os.path.dirname(__file__), q_interface, q_interface + '.py')
+
+    # the result only depends on the interface and the query, so identical queries share one cached result
+    cache_dir = get_interface_cache_dir() if use_cache and input_dir is None and check_interface_cache(q_interface) else None
+    if cache_dir is not None:
+        cache_key = hash_interface_query(q_interface, query)
+        query_result = read_interface_cache(cache_dir, cache_key)
+        with interface_lock:
+            interface_cache_stats['hit' if query_result is not None else 'miss'] += 1
+        if query_result is not None:
+            logger.info(f'Find cached result of module <{module}> in interface <{q_interface}>.')
+            return query_result
 
     # find proper query interface code
-    spec = importlib.util.spec_from_file_location('query_' + str(module) + '_' + str(q_interface), dst_file)
-    module_py = importlib.util.module_from_spec(spec)
-    sys.modules[spec.name] = module_py
-    spec.loader.exec_module(module_py)
+    module_py = load_interface(q_interface)
     
     # actual query
     del query[key_interface]
     query_result = module_py.query(module, q_interface, query, input_dir, output_dir)
 
+    if cache_dir is not None:
+        write_interface_cache(cache_dir, cache_key, query_result)
+
     return query_result
     
 
+def query_interface_batch(module_list: list, query_list: list, input_dir=None, output_dir=None, use_cache: bool=True, max_workers: int=None) -> list:
+    """
+    query many modules in one call, with the optional query_batch function of each interface, e.g., csv_cmos
+    interfaces without query_batch, e.g., cacti7, are queried concurrently in a thread pool of max_workers, with max_workers of 1 being sequential
+    the results are in the order of the queries, and results of an input dir are not cached, same as query_interface
+    """
+    assert len(module_list) == len(query_list), logger.error(f'Invalid batch query: <{len(module_list)}> modules and <{len(query_list)}> queries.')
+    result_list = [None] * len(query_list)
+
+    # queries not in the cache, grouped by interface
+    cache_dir = get_interface_cache_dir() if use_cache and input_dir is None else None
+    interface_index_dict = OrderedDict()
+    interface_hash_dict = OrderedDict()
+    cache_key_list = [None] * len(query_list)
+    for index, query in enumerate(query_list):
+        assert key_interface in query, logger.error(f'Invalid query: <{query}>. Must contain <{key_interface}>. Possible undefined attribute in archtitecture dictionary.')
+        q_interface = query[key_interface]
+        if cache_dir is not None and check_interface_cache(q_interface):
+            if q_interface not in interface_hash_dict:
+                interface_hash_dict[q_interface] = hash_interface(q_interface)
+            cache_key_list[index] = hash_interface_query(q_interface, query, interface_hash=interface_hash_dict[q_interface])
+
+    # all cached results are read at once
+    cache_index_list = [index for index, cache_key in enumerate(cache_key_list) if cache_key is not None]
+    cache_result_list = read_interface_cache_batch(cache_dir, [cache_key_list[index] for index in cache_index_list]) if len(cache_index_list) > 0 else []
+    for index, query_result in zip(cache_index_list, cache_result_list):
+        result_list[index] = query_result
+    with interface_lock:
+        interface_cache_stats['hit'] += sum(query_result is not None for query_result in cache_result_list)
+        interface_cache_stats['miss'] += sum(query_result is None for query_result in cache_result_list)
+
+    for index, query in enumerate(query_list):
+        if result_list[index] is not None:
+            logger.info(f'Find cached result of module <{module_list[index]}> in interface <{query[key_interface]}>.')
+            continue
+        interface_index_dict.setdefault(query[key_interface], []).append(index)
+
+    for q_interface, index_list in interface_index_dict.items():
+        module_py = load_interface(q_interface)
+        interface_module_list = [module_list[index] for index in index_list]
+        interface_query_list = []
+        for index in index_list:
+            query = copy.deepcopy(query_list[index])
+            del query[key_interface]
+            interface_query_list.append(query)
+
+        if hasattr(module_py, 'query_batch'):
+            interface_result_list = module_py.query_batch(interface_module_list, q_interface, interface_query_list, input_dir, output_dir)
+            logger.info(f'Query <{len(index_list)}> modules in one batch in interface <{q_interface}>.')
+        elif max_workers == 1 or len(index_list) == 1:
+            interface_result_list = [module_py.query(module, q_interface, query, input_dir, output_dir) for module, query in zip(interface_module_list, interface_query_list)]
+        else:
+            # queries of external tools block on subprocesses, so threads overlap them; results are collected in query order
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(module_py.query, module, q_interface, query, input_dir, output_dir) for module, query in zip(interface_module_list, interface_query_list)]
+                interface_result_list = [future.result() for future in futures]
+            logger.info(f'Query <{len(index_list)}> modules concurrently in interface <{q_interface}>.')
+
+        for index, query_result in zip(index_list, interface_result_list):
+            result_list[index] = query_result
+            if cache_key_list[index] is not None:
+                write_interface_cache(cache_dir, cache_key_list[index], query_result)
+
+    return result_list
+
+
+def build_interface(name: str=None, rebuild: bool=False) -> None:
+    """
+    Build the binaries of an interface with its optional build function, e.g., CACTI7.
+    If name is none, all interfaces are built.
+    """
+    if name is None:
+        interface_root = os.path.dirname(__file__)
+        names = sorted(d for d in os.listdir(interface_root) if os.path.isfile(os.path.join(interface_root, d, d + '.py')))
+    else:
+        names = [name]
+
+    for interface_name in names:
+        module_py = load_interface(interface_name)
+        if hasattr(module_py, 'build'):
+            module_py.build(rebuild=rebuild)
+            logger.success(f'Build interface <{interface_name}>.')
+
+
+def prefetch_interface(query_list: list, output_dir: str, max_workers: int=None) -> None:
+    """
+    Prefetch the results of many queries, e.g., all modules in a sweep, with the optional prefetch function of each interface.
+    Interfaces without a prefetch function, but with a query_batch function, are prefetched in one batch.
+    Prefetched results are kept in the interface cache, and are shared by all runs.
+    """
+    interface_query_dict = OrderedDict()
+    for query in query_list:
+        assert key_interface in query, logger.error(f'Invalid query: <{query}>. Must contain <{key_interface}>.')
+        interface_query = copy.deepcopy(query)
+        del interface_query[key_interface]
+        interface_query_dict.setdefault(query[key_interface], []).append(interface_query)
+
+    for name, interface_query_list in interface_query_dict.items():
+        module_py = load_interface(name)
+        if hasattr(module_py, 'prefetch'):
+            module_py.prefetch(interface_query_list, output_dir, max_workers=max_workers)
+            logger.success(f'Prefetch <{len(interface_query_list)}> queries in interface <{name}>.')
+        elif hasattr(module_py, 'query_batch') and get_interface_cache_dir() is not None:
+            # one vectorized call for the queries of all runs, with the results in the interface cache
+            batch_query_list = [query for query in query_list if query[key_interface] == name]
+            query_interface_batch(['prefetch'] * len(batch_query_list), batch_query_list, output_dir=output_dir)
+            logger.success(f'Prefetch <{len(interface_query_list)}> queries in interface <{name}>.')
+
+
+def load_interface(name: str, reload: bool=False):
+    """
+    Load the backend of an interface once, and reuse it for all queries until the interface file is modified.
+    If reload is true, the backend is imported again, e.g., after editing the interface.
+    """
+    interface_file = os.path.join(os.path.dirname(__file__), name, name + '.py')
+    assert os.path.isfile(interface_file), logger.error(f'Invalid interface <{name}>; missing <{interface_file}>.')
+    interface_mtime = os.path.getmtime(interface_file)
+
+    with interface_lock:
+        if reload or name not in interface_registry or interface_registry[name][0] != interface_mtime:
+            spec = importlib.util.spec_from_file_location('archx_interface_' + str(name), interface_file)
+            module_py = importlib.util.module_from_spec(spec)
+            sys.modules[spec.name] = module_py
+            spec.loader.exec_module(module_py)
+            interface_registry[name] = (interface_mtime, module_py)
+            logger.info(f'Load interface <{name}> from <{interface_file}>.')
+        return interface_registry[name][1]
+
+
+def reload_interface(name: str=None) -> None:
+    """
+    Drop loaded interface backends, so the next query imports them again.
+    If name is none, all interfaces are dropped.
+    """
+    with interface_lock:
+        names = list(set(interface_registry.keys()) | set(interface_hash_registry.keys())) if name is None else [name]
+        for interface_name in names:
+            interface_hash_registry.pop(interface_name, None)
+            if interface_registry.pop(interface_name, None) is not None:
+                sys.modules.pop('archx_interface_' + str(interface_name), None)
+                logger.info(f'Reload interface <{interface_name}>.')
+
+
+def get_interface_cache_dir() -> str:
+    """
+    Get the directory of the interface cache from the environment variable, or the default directory.
+    Return none if the cache is disabled.
+    """
+    cache_dir = os.environ.get(key_cache_env, default_cache_dir)
+    if cache_dir.strip().lower() in disabled_cache_dir:
+        return None
+    return os.path.abspath(os.path.expanduser(cache_dir))
+
+
+def check_interface_cache(name: str) -> bool:
+    # interfaces with results that depend on earlier queries, e.g., a surrogate model, set cache_result to false and are not cached
+    return getattr(load_interface(name), 'cache_result', True)
+
+
+def get_interface_files(interface_dir: str) -> tuple:
+    """
+    List the source and data files of an interface, excluding python caches and build outputs, and return them with a manifest of the modification time of the files and directories.
+    Directories are in the manifest, so added or removed files change the manifest.
+    """
+    file_list = []
+    manifest = OrderedDict()
+    for root, dirs, files in os.walk(interface_dir):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        manifest[root] = os.path.getmtime(root)
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            if file.startswith('.') or file.endswith(('.pyc', '.o', '.d')) or (os.access(file_path, os.X_OK) and not file.endswith('.py')):
+                continue
+            file_list.append(file_path)
+            manifest[file_path] = os.path.getmtime(file_path)
+    return file_list, manifest
+
+
+def check_interface_manifest(manifest: OrderedDict) -> bool:
+    # a manifest is valid if no listed file or directory is modified or removed, which only checks the modification time of each path
+    try:
+        return all(os.path.getmtime(path) == mtime for path, mtime in manifest.items())
+    except OSError:
+        return False
+
+
+def hash_interface(name: str) -> str:
+    """
+    Hash the source and data files of an interface, excluding python caches and build outputs.
+    The hash is computed once per process and interface, and is reused while the manifest of the interface is valid.
+    Otherwise, the interface is listed again, and only hashed again if its files or their modification time change.
+    """
+    with interface_lock:
+        if name in interface_hash_registry and check_interface_manifest(interface_hash_registry[name][0]):
+            return interface_hash_registry[name][2]
+
+    interface_dir = os.path.join(os.path.dirname(__file__), name)
+    interface_file = os.path.join(interface_dir, name + '.py')
+    assert os.path.isfile(interface_file), logger.error(f'Invalid interface <{name}>; missing <{interface_file}>.')
+    file_list, manifest = get_interface_files(interface_dir)
+    file_manifest = OrderedDict((file_path, manifest[file_path]) for file_path in file_list)
+
+    with interface_lock:
+        if name not in interface_hash_registry or interface_hash_registry[name][1] != file_manifest:
+            interface_hash = hashlib.sha256()
+            for file_path in file_list:
+                interface_hash.update(os.path.relpath(file_path, interface_dir).encode())
+                with open(file_path, 'rb') as f:
+                    interface_hash.update(hashlib.sha256(f.read()).digest())
+            interface_hash_registry[name] = (manifest, file_manifest, interface_hash.hexdigest())
+            logger.info(f'Hash <{len(file_list)}> files of interface <{name}>.')
+        else:
+            interface_hash_registry[name] = (manifest, file_manifest, interface_hash_registry[name][2])
+        return interface_hash_registry[name][2]
+
+
+def hash_interface_query(name: str, query: OrderedDict, interface_hash: str=None) -> str:
+    # canonical query with sorted keys
+    # the hash of the interface can be passed in, so a batch of queries checks the interface files once
+    if interface_hash is None:
+        interface_hash = hash_interface(name)
+    query_key = json.dumps([name, interface_hash, query], sort_keys=True, default=str)
+    return hashlib.sha256(query_key.encode()).hexdigest()
+
+
+def connect_interface_cache(cache_dir: str, table: str=None) -> sqlite3.Connection:
+    """
+    Get the connection of this thread to the interface cache, which is opened and set up once per thread and cache dir, and shall not be closed.
+    The table statement, e.g., a table of an interface, is run once per connection.
+    A forked process opens its own connections, since a connection can not be shared across processes.
+    """
+    connection_dict = getattr(interface_connection_local, 'connection_dict', None)
+    if connection_dict is None or interface_connection_local.pid != os.getpid():
+        connection_dict = interface_connection_local.connection_dict = OrderedDict()
+        interface_connection_local.pid = os.getpid()
+
+    # a removed cache file, e.g., a cleared cache, is created again
+    cache_path = os.path.join(cache_dir, cache_file)
+    if cache_dir not in connection_dict or not os.path.exists(cache_path):
+        if cache_dir in connection_dict:
+            connection_dict[cache_dir][0].close()
+        os.makedirs(cache_dir, exist_ok=True)
+        connection = sqlite3.connect(cache_path, timeout=60)
+        # write-ahead logging allows concurrent runs to read and write the cache
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS result (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        connection_dict[cache_dir] = (connection, set())
+
+    connection, table_set = connection_dict[cache_dir]
+    if table is not None and table not in table_set:
+        connection.execute(table)
+        table_set.add(table)
+    return connection
+
+
+def read_interface_cache(cache_dir: str, cache_key: str) -> OrderedDict:
+    row = connect_interface_cache(cache_dir).execute('SELECT value FROM result WHERE key = ?', (cache_key,)).fetchone()
+    if row is None:
+        return None
+    return json.loads(row[0], object_pairs_hook=OrderedDict)
+
+
+def read_interface_cache_batch(cache_dir: str, cache_key_list: list) -> list:
+    # cached results of many keys with one statement per chunk, in the order of the keys, and none if a key is not cached
+    connection = connect_interface_cache(cache_dir)
+    value_dict = OrderedDict()
+    unique_key_list = list(OrderedDict.fromkeys(cache_key_list))
+    for start in range(0, len(unique_key_list), cache_read_chunk):
+        chunk = unique_key_list[start:start + cache_read_chunk]
+        statement = 'SELECT key, value FROM result WHERE key IN (' + ', '.join(['?'] * len(chunk)) + ')'
+        value_dict.update(connection.execute(statement, chunk).fetchall())
+    return [json.loads(value_dict[cache_key], object_pairs_hook=OrderedDict) if cache_key in value_dict else None for cache_key in cache_key_list]
+
+
+def write_interface_cache(cache_dir: str, cache_key: str, query_result: OrderedDict) -> None:
+    value = json.dumps(query_result, default=lambda x: x.item() if hasattr(x, 'item') else str(x))
+    connection = connect_interface_cache(cache_dir)
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO result (key, value) VALUES (?, ?)', (cache_key, value))
+
+
+def get_interface_cache_stats() -> OrderedDict:
+    # hit and miss count of the interface cache in this process
+    with interface_lock:
+        return OrderedDict(interface_cache_stats)
+
+
 def register_interface(name: str, interface_dir: str) -> None:
     assert name != key_interface, logger.error(f'Invalid interface name: <{name}>.')
     src_dir = get_path(interface_dir)
@@ -48,6 +366,7 @@ def unregister_interface(name: str) -> None:
     dst_dir = os.path.join(os.path.dirname(__file__), name)
     if os.path.isdir(dst_dir):
         shutil.rmtree(dst_dir)
+        reload_interface(name)
         logger.success(f'Unregister interface <{name}> to <{dst_dir}>.')
     else:
         logger.warning(f'Interface <{name}> does not exist at <{dst_dir}>.')
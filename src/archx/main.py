@@ -1,4 +1,4 @@
-import pyfiglet, argparse, time, os, sys
+import pyfiglet, argparse, time, os, sys, shlex, tempfile
 import pandas as pd
 import subprocess
 import shutil
@@ -6,12 +6,12 @@ import shutil
 from loguru import logger
 
 from archx.architecture import create_architecture_dict, save_architecture_dict
-from archx.event import create_event_graph, save_event_graph
-from archx.metric import create_metric_dict, create_event_metrics, save_metric_dict
+from archx.event import create_event_graph, save_event_graph, load_event_graph, hash_event_graph, get_event_dependency
+from archx.metric import create_metric_dict, create_event_metrics, create_module_metrics_delta, save_metric_dict, get_metric_table
 from archx.workload import create_workload_dict, save_workload_dict
-from archx.performance import simulate_performance_all_events
+from archx.performance import simulate_performance_all_events, simulate_performance_delta, get_memo_dir, get_memo_stats
 from archx.utils import bcolors, write_yaml, read_yaml
-from archx.interface import register_interface, unregister_interface, copy_interface
+from archx.interface import register_interface, unregister_interface, copy_interface, get_interface_cache_dir, get_interface_cache_stats, prefetch_interface, build_interface
 from archx.programming.graph.agraph import AGraph, _generate_runs, _gui
 
 def parse_commandline_args():
@@ -32,14 +32,23 @@ def parse_commandline_args():
                         help = 'Path to event yaml.')
     parser.add_argument('-c', '--checkpoint', type=str, default=None,
                         help = 'Path to checkpoint, which requires <.gt> format.')
+    parser.add_argument('-b', '--base_checkpoint', type=str, default=None,
+                        help = 'Path to the checkpoint of a previous run with the same events and metrics, saved with <-td>; only modules and events whose dependencies changed are simulated again.')
     parser.add_argument('-l', '--log_level', type=str, default='INFO',
                         help = 'Level of logger.')
     parser.add_argument('-d', '--delete', action='store_true', default=False,
                         help = 'Delete run directory if it exists.')
     parser.add_argument('-s', '--save_yaml', action='store_true', default=False, help = 'Save yaml files in run directory.')
+    parser.add_argument('-td', '--track_dependency', action='store_true', default=False,
+                        help = 'Record the module queries and the architecture and workload keys read by performance models in the checkpoint, so it can be the base checkpoint of later runs via <-b>.')
+    parser.add_argument('-pm', '--memoize_performance', action='store_true', default=False,
+                        help = 'Reuse results of performance models when the architecture and workload keys they read are unchanged.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help = 'Number of concurrent module queries and performance models; default to a thread pool per interface for queries and sequential performance models, and 1 for sequential queries.')
     parser.add_argument('-ireg', '--register_interface', action='store_true', default=False, help = 'Register a new interface.')
     parser.add_argument('-iureg', '--unregister_interface', action='store_true', default=False, help = 'Unregister a new interface.')
     parser.add_argument('-icopy', '--copy_interface', action='store_true', default=False, help = 'Copy an existing interface.')
+    parser.add_argument('-ibuild', '--build_interfaces', action='store_true', default=False, help = 'Build the binaries of all interfaces, or the interface via <-iname>.')
     parser.add_argument('-iname', '--interface_name', type=str, default=None, help = 'Name of the interface.')
     parser.add_argument('-idir', '--interface_dir', type=str, default=None, help = 'Directory of the interface.')
 
@@ -62,6 +71,32 @@ def parse_commandline_args():
     return parser.parse_args()
 
 
+def _prefetch_runs(execute_path: str, max_workers: int=None) -> None:
+    """
+    Collect the queries of all modules in the architectures of a runs file, and prefetch them in the interface cache.
+    """
+    architecture_path_list = []
+    with open(execute_path, 'r') as f:
+        for line in f:
+            run_args = shlex.split(line)
+            if '-a' in run_args and run_args.index('-a') + 1 < len(run_args):
+                architecture_path = run_args[run_args.index('-a') + 1]
+                if architecture_path not in architecture_path_list:
+                    architecture_path_list.append(architecture_path)
+
+    query_list = []
+    for architecture_path in architecture_path_list:
+        architecture_dict = create_architecture_dict(architecture_path)
+        for module in architecture_dict:
+            query_list.append(architecture_dict[module]['query'])
+
+    prefetch_dir = tempfile.mkdtemp(prefix='archx_prefetch_')
+    try:
+        prefetch_interface(query_list, output_dir=prefetch_dir, max_workers=max_workers)
+    finally:
+        shutil.rmtree(prefetch_dir, ignore_errors=True)
+
+
 def main():
     args = parse_commandline_args()
     
@@ -74,7 +109,7 @@ def main():
     print(bcolors.UNDERLINE + bcolors.Green + ascii_banner + bcolors.ENDC)
 
     # check not all interface options are selected
-    assert (args.register_interface + args.unregister_interface + args.copy_interface <= 1), logger.error('Only one interface option can be selected at a time: <-regi>, <-uregi>, or <-copyi>.')
+    assert (args.register_interface + args.unregister_interface + args.copy_interface + args.build_interfaces <= 1), logger.error('Only one interface option can be selected at a time: <-regi>, <-uregi>, <-copyi>, or <-ibuild>.')
     
     if args.delete:
         # delete run directory if it exists
@@ -99,6 +134,10 @@ def main():
         assert args.interface_dir is not None, logger.error(f'Interface directory is required for copying via <-idir>.')
         copy_interface(args.interface_name, args.interface_dir)
         exit(0)
+    # build interface
+    elif args.build_interfaces:
+        build_interface(args.interface_name, rebuild=True)
+        exit(0)
 
 
     # validate run dir exists and path is valid
@@ -140,12 +179,33 @@ def main():
         
         logger.success(f'\n----------------------------------------------\nStep 4: Creat event graph\n----------------------------------------------')
         event_graph = create_event_graph(args.event_yaml)
+        base_graph = None
+        if args.base_checkpoint is not None:
+            base_graph = load_event_graph(args.base_checkpoint)
+            base_metric_table = get_metric_table(base_graph)
+            if hash_event_graph(base_graph) != hash_event_graph(event_graph) or [(metric, base_metric_table[metric]['unit']) for metric in base_metric_table] != [(metric, metric_dict[metric]['unit']) for metric in metric_dict]:
+                logger.warning(f'Ignore base checkpoint <{args.base_checkpoint}>, whose events or metrics differ.')
+                base_graph = None
+            else:
+                if not any(get_event_dependency(base_graph).values()):
+                    logger.warning(f'Find no dependencies in base checkpoint <{args.base_checkpoint}>, which is saved without <-td>; all modules and events are simulated again.')
+                # performance models of the events yaml replace those of the base checkpoint
+                for v in event_graph.vertices():
+                    base_graph.vp.performance[v] = event_graph.vp.performance[v]
+                event_graph = base_graph
 
         logger.success(f'\n----------------------------------------------\nStep 5: Create metrics for all events and modules\n----------------------------------------------')
-        event_graph = create_event_metrics(event_graph, architecture_dict, metric_dict, run_dir=args.run_dir)
+        if base_graph is None:
+            event_graph = create_event_metrics(event_graph, architecture_dict, metric_dict, run_dir=args.run_dir, max_workers=args.jobs, track=args.track_dependency)
+        else:
+            event_graph = create_module_metrics_delta(event_graph, architecture_dict, run_dir=args.run_dir, max_workers=args.jobs)
         
         logger.success(f'\n----------------------------------------------\nStep 6: Simulate performance\n----------------------------------------------')
-        event_graph = simulate_performance_all_events(event_graph, architecture_dict, workload_dict)
+        # dependencies are recorded if requested, so the checkpoint can be the base of later runs, and a delta run keeps recording them
+        if base_graph is None:
+            event_graph = simulate_performance_all_events(event_graph, architecture_dict, workload_dict, max_workers=1 if args.jobs is None else args.jobs, memoize=args.memoize_performance, track=args.track_dependency)
+        else:
+            event_graph = simulate_performance_delta(event_graph, architecture_dict, workload_dict, max_workers=1 if args.jobs is None else args.jobs, memoize=args.memoize_performance)
         
         logger.success(f'\n----------------------------------------------\nStep 7: Save event graph and log\n----------------------------------------------')
         save_event_graph(event_graph=event_graph, save_path=args.checkpoint)
@@ -157,6 +217,11 @@ def main():
             write_yaml(args.run_dir + '/event.yaml', read_yaml(args.event_yaml))
             logger.success(f'Save dictionaries to <{args.run_dir}>.')
 
+        interface_cache_stats = get_interface_cache_stats()
+        logger.success(f'Interface cache <{get_interface_cache_dir()}>: <{interface_cache_stats["hit"]}> hits and <{interface_cache_stats["miss"]}> misses.')
+        if args.memoize_performance:
+            memo_stats = get_memo_stats()
+            logger.success(f'Performance cache <{get_memo_dir()}>: <{memo_stats["hit"]}> hits and <{memo_stats["miss"]}> misses.')
         logger.success(f'Save log to <{output_log}>.')
     elif args.compile:
         # frontend programming compile mode
@@ -186,6 +251,9 @@ def main():
                 execute_path = args.run_dir + '/runs.txt'
                 assert os.path.isfile(execute_path), logger.error(f'Invalid execute runs file <{execute_path}>.')
 
+            # run each unique interface query once for all runs
+            _prefetch_runs(execute_path, max_workers=args.jobs)
+
             # call run_archx.sh with runs file
             script_path = os.path.join(os.path.dirname(__file__), 'bin', 'run_archx.sh')
             command = f'bash {script_path} {execute_path} {tabular_mode}'
@@ -221,6 +289,9 @@ def main():
         execute_path = args.execute
         assert os.path.isfile(execute_path), logger.error(f'Invalid execute runs file <{execute_path}>.')
 
+        # run each unique interface query once for all runs
+        _prefetch_runs(execute_path, max_workers=args.jobs)
+
         # call run_archx.sh with runs file
         script_path = os.path.join(os.path.dirname(__file__), 'bin', 'run_archx.sh')
         command = f'bash {script_path} {execute_path} {tabular_mode}'
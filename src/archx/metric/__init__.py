@@ -1 +1 @@
-from .metric import create_metric_dict, save_metric_dict, create_event_metrics, create_module_metrics, aggregate_event_count, aggregate_event_metric, query_module_metric, aggregate_tag_metric, load_metric_dict
+from .metric import create_metric_dict, save_metric_dict, create_event_metrics, create_module_metrics, create_module_metrics_delta, aggregate_event_count, aggregate_event_metric, aggregate_event_metrics, query_module_metric, aggregate_tag_metric, aggregate_tag_metrics, load_metric_dict, aggregate_breakdown_metric, aggregate_batch_metrics, update_edge_count, update_module_metric, get_metric_table, share_metric_table, MetricQuery
@@ -1,9 +1,18 @@
+import copy
+import json
+import weakref
+import threading
 import graph_tool.all as gt
+import numpy as np
+import pandas as pd
 from collections import OrderedDict
 
 from loguru import logger
 
-from archx.interface import query_interface
+from archx.event import load_event_graph, get_graph_cache, graph_cache_lock, index_event_graph, get_event_node, get_module_nodes, get_tag_nodes, mark_event_dirty, check_event_count, get_event_plan, get_event_dependency
+from archx.event.event import key_subtotal, key_path_count, key_plan_data, key_breakdown
+from archx.interface import query_interface_batch
+from archx.interface.interface import key_interface, hash_interface_query
 from archx.utils import read_yaml, write_yaml, get_path, create_dir, get_prod
 
 
@@ -15,8 +24,19 @@ key_metric = 'metric'
 key_instance = 'instance'
 key_factor = 'factor'
 key_aggregation = 'aggregation'
+key_topological_sort = 'topological_sort'
+key_operation = 'operation'
+key_module = 'module'
+key_reachable = 'reachable'
+key_edge = 'edge'
+key_count = 'count'
+key_parallel = 'parallel'
+key_performance = 'performance'
 single_op_metric_format = '{\'' + key_value + '\': ' + 'float' + ', \'' + key_unit + '\': ' + 'str' + '}'
 
+# ids of event graphs sharing one metric table, which a graph replaces with its own copy before its first write
+shared_metric_graph = {}
+
 
 def create_metric_dict(metric_file: str) -> OrderedDict:
     """
@@ -59,68 +79,303 @@ def load_metric_dict(ckpt_path: str) -> OrderedDict:
     return metric_dict
 
 
-def create_event_metrics(event_graph: gt.Graph, architecture_dict: OrderedDict, metric_dict: OrderedDict, run_dir: str=None) -> gt.Graph:
+def create_event_metrics(event_graph: gt.Graph, architecture_dict: OrderedDict, metric_dict: OrderedDict, run_dir: str=None, max_workers: int=None, track: bool=False) -> gt.Graph:
     """
     Update the event graph, add metrics to each node.
+    If track is true, the query of each module is recorded in the graph for delta simulation.
     """
 
-    # add event metric to vertex properties
-    metric_property = event_graph.new_vertex_property('object')
-    event_graph.vp.metric = metric_property
+    # add event metric to vertex properties, one array per metric
+    event_graph = create_metric_properties(event_graph, metric_dict)
 
     # add tag to vertex properties
     tag_property = event_graph.new_vertex_property('object')
     event_graph.vp.tag = tag_property
 
-    # initialize all metrics to 0.0
+    # all metrics are initialized to 0.0
     for v in event_graph.vertices():
-        event_graph.vp.metric[v] = OrderedDict({})
-        for metric in metric_dict:
-            event_graph.vp.metric[v][metric] = OrderedDict({key_value: 0.0, key_unit: metric_dict[metric][key_unit]})
         event_name = event_graph.vp.event[v]
         logger.info(f'Create metrics for event <{event_name}>.')
 
     logger.success(f'Create metrics for all events.')
 
-    event_graph = create_module_metrics(event_graph, architecture_dict, run_dir)
+    event_graph = create_module_metrics(event_graph, architecture_dict, run_dir, max_workers=max_workers, track=track)
 
     return event_graph
 
 
-def create_module_metrics(event_graph: gt.Graph, architecture_dict: OrderedDict, run_dir: str=None) -> gt.Graph:
+def create_module_metrics(event_graph: gt.Graph, architecture_dict: OrderedDict, run_dir: str=None, max_workers: int=None, module_name_list: list=None, track: bool=False) -> gt.Graph:
     """
     This function queries the interface for each architecture modules in the event graph
+    Queries are issued concurrently with up to max_workers threads, and the results are set in the order of the modules
+    If module_name_list is given, only these modules are queried, and other modules keep their metrics
+    If track is true, the query of each module is recorded in the graph for delta simulation
     """
 
     create_dir(run_dir)
     full_path = get_path(run_dir)
 
     # all modules have out degree of 0
-    for v in gt.find_vertex(event_graph, 'out', 0):
-        module_name = event_graph.vp.event[v]
+    module_node_list = get_module_nodes(event_graph)
+    if module_name_list is not None:
+        module_node_list = [v for v in module_node_list if event_graph.vp.event[v] in module_name_list]
+    module_name_list = [event_graph.vp.event[v] for v in module_node_list]
+    for module_name in module_name_list:
         assert module_name in architecture_dict, logger.error(f'Invalid module <{module_name}>.')
         assert 'query' in architecture_dict[module_name], logger.error(f'Missing query information for module <{module_name}>.')
         assert 'class' in architecture_dict[module_name]['query'], logger.error(f'Missing class information in query for module <{module_name}>.')
-        
+
+    # modules of the same interface are queried in one batch
+    result_list = query_interface_batch(module_name_list, [architecture_dict[module_name]['query'] for module_name in module_name_list], output_dir=full_path, max_workers=max_workers)
+
+    module_dependency = get_event_dependency(event_graph)[key_module] if track else None
+    for v, module_name, result in zip(module_node_list, module_name_list, result_list):
         module_class = architecture_dict[module_name]['query']['class']
-        query = architecture_dict[module_name]['query']
-        result = query_interface(module_name, query, output_dir=full_path)
 
         # if query generates new results, update metric with new results
-        event_graph.vp.metric[v] = OrderedDict({k: result.get(k, event_graph.vp.metric[v][k]) for k in event_graph.vp.metric[v]})
+        # metrics missing in the results are reset, in case the module had results before
+        metric_table = get_metric_table(event_graph)
+        for metric in metric_table:
+            if metric in result:
+                set_module_metric(event_graph, v, metric, result[metric])
+            else:
+                event_graph.vp[get_metric_property_name(metric)][v] = 0.
+                for operation in metric_table[metric][key_operation]:
+                    event_graph.vp[get_metric_property_name(metric, operation)][v] = np.nan
+                metric_table[metric][key_module].pop(int(v), None)
         
         # get number of instances for an architecture module
-        event_graph.vp.metric[v][key_instance] = get_prod(architecture_dict[module_name][key_instance])
+        event_graph.vp[key_instance][v] = get_prod(architecture_dict[module_name][key_instance])
+        mark_event_dirty(event_graph, v, edge_changed=False)
 
         event_graph.vp.tag[v] = architecture_dict[module_name]['tag']
+        if track:
+            module_dependency[module_name] = hash_module_query(architecture_dict, module_name)
 
         logger.info(f'Create metrics for module <{module_name}> with class <{module_class}>.')
     
+    # tags of modules are indexed for tag aggregation
+    index_event_graph(event_graph)
+
     logger.success(f'Create metrics for all modules.')
     
     return event_graph
 
 
+def create_module_metrics_delta(event_graph: gt.Graph, architecture_dict: OrderedDict, run_dir: str=None, max_workers: int=None) -> gt.Graph:
+    """
+    Query only the modules whose query, instance or tag changed since the dependencies recorded in the event graph, e.g., a loaded base checkpoint.
+    Other modules keep their metrics.
+    """
+    module_dependency = get_event_dependency(event_graph)[key_module]
+    module_node_list = get_module_nodes(event_graph)
+    module_name_list = []
+    for v in module_node_list:
+        module_name = event_graph.vp.event[v]
+        if module_name not in architecture_dict or module_dependency.get(module_name) != hash_module_query(architecture_dict, module_name):
+            module_name_list.append(module_name)
+
+    logger.success(f'Query <{len(module_name_list)}> of <{len(module_node_list)}> modules, which changed since the recorded dependencies.')
+
+    return create_module_metrics(event_graph, architecture_dict, run_dir, max_workers=max_workers, module_name_list=module_name_list, track=True)
+
+
+def hash_module_query(architecture_dict: OrderedDict, module_name: str) -> str:
+    # metrics of a module depend on the interface and its query, the number of instances and the tags
+    query = architecture_dict[module_name].get('query', OrderedDict())
+    if key_interface not in query:
+        return None
+    return json.dumps([hash_interface_query(query[key_interface], query), architecture_dict[module_name].get(key_instance), architecture_dict[module_name].get('tag')], sort_keys=True, default=str)
+
+
+def create_metric_properties(event_graph: gt.Graph, metric_dict: OrderedDict) -> gt.Graph:
+    """
+    Store metrics as struct of arrays, i.e., one double vertex property per metric, indexed by node.
+    A multi-operation module has nan in the metric, and its values are in one vertex property per operation.
+    The unit and operations of each metric are kept in a table as graph property, together with the units of each module.
+    """
+    metric_table = OrderedDict()
+    for metric in metric_dict:
+        event_graph.vp[get_metric_property_name(metric)] = event_graph.new_vertex_property('double', val=0.)
+        metric_table[metric] = OrderedDict({key_unit: metric_dict[metric][key_unit], key_operation: [], key_module: OrderedDict()})
+
+    event_graph.vp[key_instance] = event_graph.new_vertex_property('double', val=1.)
+    event_graph.gp[key_metric] = event_graph.new_graph_property('object', metric_table)
+    with graph_cache_lock:
+        shared_metric_graph.pop(id(event_graph), None)
+
+    return event_graph
+
+
+def get_metric_property_name(metric: str, operation: str=None) -> str:
+    # vertex property of a metric, or an operation in a metric
+    if operation is None:
+        return f'{key_metric}:{metric}'
+    return f'{key_metric}:{metric}:{operation}'
+
+
+def get_metric_table(event_graph: gt.Graph, write: bool=False) -> OrderedDict:
+    """
+    Get the table of units and operations of all metrics.
+    Checkpoints with metrics in per-node dictionaries are converted on the first access.
+    If write is true, a table shared with other graphs is copied first, see share_metric_table.
+    """
+    if key_metric not in event_graph.gp:
+        with graph_cache_lock:
+            if key_metric not in event_graph.gp:
+                assert key_metric in event_graph.vp, logger.error(f'Missing metrics in event graph; create event metrics before query.')
+                convert_event_metrics(event_graph)
+    if write:
+        with graph_cache_lock:
+            if shared_metric_graph.pop(id(event_graph), False):
+                event_graph.gp[key_metric] = event_graph.new_graph_property('object', copy.deepcopy(event_graph.gp[key_metric]))
+    return event_graph.gp[key_metric]
+
+
+def share_metric_table(event_graph: gt.Graph, event_graph_list: list) -> list:
+    """
+    Let copies of an event graph share one copy of its metric table, instead of one copy per graph.
+    A graph copies the shared table before its first write, e.g., update_module_metric, so writes never reach other graphs.
+    """
+    metric_table = copy.deepcopy(get_metric_table(event_graph))
+    with graph_cache_lock:
+        for batch_graph in event_graph_list:
+            batch_graph.gp[key_metric] = batch_graph.new_graph_property('object', metric_table)
+            if id(batch_graph) not in shared_metric_graph:
+                # drop the mark together with the graph
+                weakref.finalize(batch_graph, shared_metric_graph.pop, id(batch_graph), None)
+            shared_metric_graph[id(batch_graph)] = True
+    return event_graph_list
+
+
+def convert_event_metrics(event_graph: gt.Graph) -> gt.Graph:
+    """
+    Convert metrics in per-node dictionaries to struct of arrays.
+    """
+    metric_property = event_graph.vp[key_metric]
+    vertices = list(event_graph.vertices())
+    assert len(vertices) > 0, logger.error(f'Invalid event graph without events.')
+
+    # events hold the unit of the metric dict, modules may hold the unit of their interface
+    unit_vertices = [v for v in vertices if v.out_degree() != 0] + [v for v in vertices if v.out_degree() == 0]
+    metric_dict = OrderedDict()
+    for metric in metric_property[vertices[0]]:
+        if metric == key_instance:
+            continue
+        for v in unit_vertices:
+            if key_unit in metric_property[v][metric]:
+                metric_dict[metric] = OrderedDict({key_unit: metric_property[v][metric][key_unit]})
+                break
+        assert metric in metric_dict, logger.error(f'Missing unit in metric <{metric}>.')
+
+    create_metric_properties(event_graph, metric_dict)
+
+    for v in vertices:
+        if v.out_degree() == 0:
+            for metric in metric_dict:
+                set_module_metric(event_graph, v, metric, metric_property[v][metric])
+            event_graph.vp[key_instance][v] = metric_property[v].get(key_instance, 1.)
+
+    del event_graph.vp[key_metric]
+    logger.success(f'Convert metrics <{list(metric_dict.keys())}> of event graph to arrays.')
+
+    return event_graph
+
+
+def set_module_metric(event_graph: gt.Graph, module_node: gt.Vertex, metric: str, module_metric: OrderedDict) -> None:
+    """
+    Set the metric of a module from a query result, which is either a single operation or a dictionary of operations.
+    single operation: {'value': float, 'unit': str}
+    multi-operation: {'read': {'value': float, 'unit': str}, 'write': {'value': float, 'unit': str}}
+    """
+    metric_table = get_metric_table(event_graph, write=True)[metric]
+    v = int(module_node)
+
+    # clear previous operations of this module
+    for operation in metric_table[key_operation]:
+        event_graph.vp[get_metric_property_name(metric, operation)][v] = np.nan
+
+    if (key_value in module_metric) & (key_unit in module_metric):
+        assert len(module_metric) == 2, logger.error(f'Invalid metric <{metric}> for event <{event_graph.vp.event[v]}>; legal metric: {single_op_metric_format}.')
+        event_graph.vp[get_metric_property_name(metric)][v] = module_metric[key_value]
+        metric_table[key_module][v] = module_metric[key_unit]
+    else:
+        event_graph.vp[get_metric_property_name(metric)][v] = np.nan
+        module_unit = OrderedDict()
+        for operation, operation_metric in module_metric.items():
+            assert key_value in operation_metric, logger.error(f'Invalid operation <{operation}> in metric <{metric}> for module <{event_graph.vp.event[v]}>; legal metric: {single_op_metric_format}.')
+            if operation not in metric_table[key_operation]:
+                event_graph.vp[get_metric_property_name(metric, operation)] = event_graph.new_vertex_property('double', val=np.nan)
+                metric_table[key_operation].append(operation)
+            event_graph.vp[get_metric_property_name(metric, operation)][v] = operation_metric[key_value]
+            module_unit[operation] = operation_metric[key_unit]
+        metric_table[key_module][v] = module_unit
+
+    # cached values of all events reaching this module are outdated
+    mark_event_dirty(event_graph, event_graph.vertex(v), edge_changed=False)
+
+
+def get_module_metric(event_graph: gt.Graph, module_node: gt.Vertex, metric: str) -> OrderedDict:
+    """
+    Get the metric of a module in the format of the query result.
+    """
+    metric_table = get_metric_table(event_graph)[metric]
+    v = int(module_node)
+    module_unit = metric_table[key_module].get(v, metric_table[key_unit])
+
+    is_single_operation, legal_ops = check_single_operation(event_graph=event_graph, metric=metric, event_node=module_node)
+    if is_single_operation:
+        return OrderedDict({key_value: float(event_graph.vp[get_metric_property_name(metric)][v]), key_unit: module_unit})
+
+    module_metric = OrderedDict()
+    for operation in legal_ops:
+        module_metric[operation] = OrderedDict({key_value: float(event_graph.vp[get_metric_property_name(metric, operation)][v]), key_unit: module_unit[operation]})
+    return module_metric
+
+
+def get_metric_unit(event_graph: gt.Graph, event_node: gt.Vertex, metric: str) -> str:
+    # unit of a single-operation metric, a module may have the unit of its interface
+    metric_table = get_metric_table(event_graph)[metric]
+    return metric_table[key_module].get(int(event_node), metric_table[key_unit])
+
+
+def update_edge_count(event_graph: gt.Graph, event: str, subevent: str, count: float) -> gt.Graph:
+    """
+    Update the count of a subevent in an event.
+    The event and all its ancestors are marked dirty, so the next aggregation only recomputes them.
+    """
+    event_node = get_event_node(event_graph, event)
+    assert event_node is not None, logger.error(f'Invalid event <{event}>.')
+    subevent_node = get_event_node(event_graph, subevent)
+    assert subevent_node is not None, logger.error(f'Invalid event <{subevent}>.')
+    edge = event_graph.edge(event_node, subevent_node)
+    assert edge is not None, logger.error(f'Invalid subevent <{subevent}> in event <{event}>.')
+
+    event_graph.ep.count[edge] = count
+    mark_event_dirty(event_graph, event_node)
+
+    logger.success(f'Update count of subevent <{subevent}> in event <{event}> to <{count}>.')
+
+    return event_graph
+
+
+def update_module_metric(event_graph: gt.Graph, module: str, metric: str, module_metric: OrderedDict) -> gt.Graph:
+    """
+    Update the metric of a module, in the format of the query result.
+    All events reaching the module are marked dirty, so the next aggregation only recomputes them.
+    """
+    assert metric in get_metric_table(event_graph), logger.error(f'Invalid metric <{metric}>.')
+    module_node = get_event_node(event_graph, module)
+    assert module_node is not None, logger.error(f'Invalid module <{module}>.')
+    assert module_node.out_degree() == 0, logger.error(f'Invalid event <{module}>; this function requires a module.')
+
+    set_module_metric(event_graph, module_node, metric, module_metric)
+
+    logger.success(f'Update metric <{metric}> for module <{module}>.')
+
+    return event_graph
+
+
 def query_module_metric(event_graph: gt.Graph, metric_dict: str, metric: str, module: str=None, operation: str=None) -> OrderedDict:
     """
     Query the metric of a module or an operation in the module.
@@ -129,22 +384,18 @@ def query_module_metric(event_graph: gt.Graph, metric_dict: str, metric: str, mo
     assert key_aggregation in metric_dict[metric], logger.error(f'Missing aggregation in metric <{metric}>.')
     assert metric_dict[metric][key_aggregation] in legal_aggregation, logger.error(f'Invalid aggregation <{metric_dict[metric][key_aggregation]}> for metric <{metric}>; legal values: {legal_aggregation}.')
     
+    get_metric_table(event_graph)
+
     # get the module node
-    module_node = gt.find_vertex(event_graph, event_graph.vp.event, module)
-    assert len(module_node) == 1, logger.error(f'Invalid module <{module}>.')
-    module_node = module_node[0]
+    module_node = get_event_node(event_graph, module)
+    assert module_node is not None, logger.error(f'Invalid module <{module}>.')
     assert module_node.out_degree() == 0, logger.error(f'Invalid event <{module}>; this function requires a module.')
 
-    module_metric = event_graph.vp.metric[module_node][metric]
+    module_metric = get_module_metric(event_graph, module_node, metric)
 
     # if a module has multiple operations, check if the operation is legal
     # this only works for certain modules, e.g., sram has multiple operations (read, write)
-    legal_ops = []
-
-    if (key_value not in module_metric) & (key_unit not in module_metric):
-        for key in module_metric:
-            legal_ops.append(key)
-
+    _, legal_ops = check_single_operation(event_graph=event_graph, metric=metric, event_node=module_node)
     
     if len(legal_ops) == 0:
         # single-operation module
@@ -170,32 +421,19 @@ def aggregate_event_count(event_graph: gt.Graph, workload: str=None, event: str=
     # find the number of event underworkload
 
     # get the event node
-    event_node = gt.find_vertex(event_graph, event_graph.vp.event, event)
-    assert len(event_node) > 0, logger.error(f'Invalid event <{event}>.')
-    event_node = event_node[0]
+    event_node = get_event_node(event_graph, event)
+    assert event_node is not None, logger.error(f'Invalid event <{event}>.')
 
     # validate event in workload
     if workload is not None and workload != event:
         # get the workload node
-        workload_node = gt.find_vertex(event_graph, event_graph.vp.event, workload)
-        assert len(workload_node) > 0, logger.error(f'Invalid workload <{workload}>.')
-        workload_node = workload_node[0]
-        paths = []
-        for path in gt.all_paths(event_graph, workload_node, event_node):
-            paths.append(path)
-        assert len(paths) > 0, logger.error(f'Invalid event <{event}> in workload <{workload}>.')
-
+        workload_node = get_event_node(event_graph, workload)
+        assert workload_node is not None, logger.error(f'Invalid workload <{workload}>.')
         # get the event count from workload to event
-        total_event_count = 0.
-        for path in gt.all_paths(event_graph, workload_node, event_node):
-            path_event_count = 1.
-            # calculate total event count based on the path
-            for idx in range(len(path)-1):
-                edge = event_graph.edge(path[idx], path[idx+1])
-                path_event_count *= event_graph.ep.count[edge]
-                logger.debug(f'  Path (<{event_graph.vp.event[edge.source()]}> -> <{event_graph.vp.event[edge.target()]}>) updates event count to <{path_event_count}>.')
-            total_event_count += path_event_count
-            logger.debug(f'  Total event count (<{workload}> -> <{event}>) is increased by <{path_event_count}>.')
+        _, workload_reachable = topological_sort_reachable(event_graph, start_node=workload_node)
+        assert int(event_node) in workload_reachable, logger.error(f'Invalid event <{event}> in workload <{workload}>.')
+        path_count = aggregate_path_count(event_graph=event_graph, start_node=workload_node)
+        total_event_count = float(path_count[int(event_node), 0])
         # get the metric value from event to all its subevents
         logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{total_event_count}>.')
 
@@ -216,335 +454,646 @@ def aggregate_event_metric(event_graph: gt.Graph, metric_dict: str, metric: str,
     If workload is none, the metric will be aggregated to the event.
     If workload is not none, the metric will be aggregated to the workload.
     """
-    assert metric in metric_dict, logger.error(f'Invalid metric <{metric}>.')
-    assert key_aggregation in metric_dict[metric], logger.error(f'Missing aggregation in metric <{metric}>.')
-    assert metric_dict[metric][key_aggregation] in legal_aggregation, logger.error(f'Invalid aggregation <{metric_dict[metric][key_aggregation]}> for metric <{metric}>; legal values: {legal_aggregation}.')
-    
-    metric_cfg = metric_dict[metric]
+    event_metrics = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=[metric], workload=workload, event=event)
+    return event_metrics[metric]
+
+
+def aggregate_event_metrics(event_graph: gt.Graph, metric_dict: str, metrics: list=None, workload: str=None, event: str=None) -> OrderedDict:
+    """
+    Aggregate multiple metrics for an event in one traversal, and return the metrics in an OrderedDict.
+    The topological order, reachable events and path count are shared by all metrics.
+    If metrics is none, all metrics in the metric dict will be aggregated.
+    The event graph is only read, and cached subtotals are recomputed while holding the lock of each metric, so concurrent calls return consistent values.
+    """
+    if metrics is None:
+        metrics = list(metric_dict.keys())
+
+    for metric in metrics:
+        assert metric in metric_dict, logger.error(f'Invalid metric <{metric}>.')
+        assert key_aggregation in metric_dict[metric], logger.error(f'Missing aggregation in metric <{metric}>.')
+        assert metric_dict[metric][key_aggregation] in legal_aggregation, logger.error(f'Invalid aggregation <{metric_dict[metric][key_aggregation]}> for metric <{metric}>; legal values: {legal_aggregation}.')
+    get_metric_table(event_graph)
     
     # get the event node
-    event_node = gt.find_vertex(event_graph, event_graph.vp.event, event)
-    assert len(event_node) > 0, logger.error(f'Invalid event <{event}>.')
-    event_node = event_node[0]
+    event_node = get_event_node(event_graph, event)
+    assert event_node is not None, logger.error(f'Invalid event <{event}>.')
 
     # validate event in workload
     if workload is not None and workload != event:
         # get the workload node
-        workload_node = gt.find_vertex(event_graph, event_graph.vp.event, workload)
-        assert len(workload_node) > 0, logger.error(f'Invalid workload <{workload}>.')
-        workload_node = workload_node[0]
-        paths = []
-        for path in gt.all_paths(event_graph, workload_node, event_node):
-            paths.append(path)
-        assert len(paths) > 0, logger.error(f'Invalid event <{event}> in workload <{workload}>.')
-
-    # reset the metric values of all events to 0.0
-    for v in event_graph.vertices():
-        # module metric is not reset
-        if v.out_degree() != 0:
-            if event_graph.vp.metric[v][metric][key_value] != 0:
-                logger.debug(f'  Reset metric <{metric}> in event <{event_graph.vp.event[v]}> to 0.')
-            event_graph.vp.metric[v][metric][key_value] = 0.
-
-    # output metric
-    event_metric = OrderedDict({key_value: 0.0, key_unit: metric_cfg[key_unit]})
-
-    aggregation = metric_cfg[key_aggregation]
+        workload_node = get_event_node(event_graph, workload)
+        assert workload_node is not None, logger.error(f'Invalid workload <{workload}>.')
+        _, workload_reachable = topological_sort_reachable(event_graph, start_node=workload_node)
+        assert int(event_node) in workload_reachable, logger.error(f'Invalid event <{event}> in workload <{workload}>.')
+        # path count from workload to all its subevents, which is shared by all metrics
+        path_count = aggregate_path_count(event_graph=event_graph, start_node=workload_node, metrics=metrics)
+
+    # output metrics
+    event_metrics = OrderedDict()
+    aggregation_metrics = OrderedDict({aggregation: [] for aggregation in legal_aggregation})
+    for metric in metrics:
+        event_metrics[metric] = OrderedDict({key_value: 0.0, key_unit: metric_dict[metric][key_unit]})
+        aggregation_metrics[metric_dict[metric][key_aggregation]].append(metric)
 
     # module aggregation mode: only sum all leaf nodes from current node
-    if aggregation == 'module':
+    if len(aggregation_metrics['module']) > 0:
         # the input can be either a module or an event, i.e., no limitations on the output degree of event_node
         # factor has no impact on aggregation in the module mode
-        if workload is not None:
-            logger.warning(f'Ignore workload <{workload}> in aggregation <{aggregation}>.')
+        module_sum = aggregate_module(graph=event_graph, start_node=event_node, metrics=aggregation_metrics['module'], top_event=event)
 
-        module_sum = 0.
-        evaluated = []
-
-        module_sum += aggregate_module(graph=event_graph, current_node=event_node, sum=0, metric=metric, evaluated=evaluated, top_event=event)
-        
-        event_metric[key_value] = module_sum
-        if workload is None:
-            logger.debug(f'  Total value (<{event}>) = <{event_metric[key_value]}> <{event_metric[key_unit]}>.')
-        else:
-            logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metric[key_value]}> <{event_metric[key_unit]}>.')
+        for metric in aggregation_metrics['module']:
+            if workload is not None:
+                logger.warning(f'Ignore workload <{workload}> in aggregation <module>.')
+            event_metrics[metric][key_value] = module_sum[metric]
+            if workload is None:
+                logger.debug(f'  Total value (<{event}>) = <{event_metrics[metric][key_value]}> <{event_metrics[metric][key_unit]}>.')
+            else:
+                logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metrics[metric][key_value]}> <{event_metrics[metric][key_unit]}>.')
 
     # summation aggregation mode: sum all child nodes from current node
-    elif aggregation == 'summation':
-        # check if the event is a single-operation module
-        is_single_operation, legal_ops = check_single_operation(event_graph=event_graph, metric=metric, event_node=event_node)
-
+    if len(aggregation_metrics['summation']) > 0:
+        # if event is a module, summation aggregation requires single-operation module, since no operation is specified in multi-operation module
         if workload is None or workload == event:
-            # if event is a module, summation aggregation requires single-operation module, since no operation is specified in multi-operation module
-            if event_node.out_degree() == 0:
-                assert is_single_operation, logger.error(f'Invalid module <{event}> for aggregation <{aggregation}>; this aggregation does not support multi-operation module.')
-            
-            event_graph = aggregate_summation(event_graph=event_graph, start_node=event_node, metric=metric)
-            event_metric[key_value] = event_graph.vp.metric[event_node][metric][key_value]
-            if workload is None:
-                logger.debug(f'  Total value (<{event}>) = <{event_metric[key_value]}> <{event_metric[key_unit]}>.')
-            else:
-                logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metric[key_value]}> <{event_metric[key_unit]}>.')
+            for metric in aggregation_metrics['summation']:
+                # check if the event is a single-operation module
+                is_single_operation, _ = check_single_operation(event_graph=event_graph, metric=metric, event_node=event_node)
+                if event_node.out_degree() == 0:
+                    assert is_single_operation, logger.error(f'Invalid module <{event}> for aggregation <summation>; this aggregation does not support multi-operation module.')
 
-        else:
+        # get the metric value from event to all its subevents
+        summation_value = aggregate_summation(event_graph=event_graph, start_node=event_node, metrics=aggregation_metrics['summation'])
+
+        for metric_index, metric in enumerate(aggregation_metrics['summation']):
+            single_value = float(summation_value[int(event_node), metric_index])
+
+            if workload is None or workload == event:
+                event_metrics[metric][key_value] = single_value
+                if workload is None:
+                    logger.debug(f'  Total value (<{event}>) = <{event_metrics[metric][key_value]}> <{event_metrics[metric][key_unit]}>.')
+                else:
+                    logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metrics[metric][key_value]}> <{event_metrics[metric][key_unit]}>.')
+                continue
+
+            # check if the event is a single-operation module
+            is_single_operation, legal_ops = check_single_operation(event_graph=event_graph, metric=metric, event_node=event_node)
             is_multi_operation_module = (not is_single_operation) & (event_node.out_degree() == 0)
 
             if is_multi_operation_module:
-                legal_op_count_dict = OrderedDict()
+                legal_op_count_dict = aggregate_operation_count(event_graph=event_graph, path_count=path_count, reachable=workload_reachable, event_node=event_node, metrics=metrics, metric=metric, legal_ops=legal_ops)
                 legal_op_metric_dict = OrderedDict()
                 for legal_op in legal_ops:
-                    legal_op_count_dict[legal_op] = 0.
-                    legal_op_metric_dict[legal_op] = 0.
-
-                for path in gt.all_paths(event_graph, workload_node, event_node):
-                    path_event_count = 1.
-                    path_event_factor = 1.
-                    # calculate total event count based on the path
-                    for idx in range(len(path)-1):
-                        edge = event_graph.edge(path[idx], path[idx+1])
-                        path_event_count *= event_graph.ep.count[edge]
-                        if metric in event_graph.ep.factor[edge]:
-                            path_event_factor *= event_graph.ep.factor[edge][metric]
-                        logger.debug(f'  Path (<{event_graph.vp.event[edge.source()]}> -> <{event_graph.vp.event[edge.target()]}>) updates event count to <{path_event_count}> and event factor to <{path_event_factor}>.')
-                    operation = event_graph.ep.operation[edge].get(metric).lower()
-                    legal_op_metric_dict[operation] = get_metric_value(event_graph=event_graph, edge=edge, metric=metric)
-                    delta_event_count = path_event_count * path_event_factor
-                    legal_op_count_dict[operation] += delta_event_count
-                    logger.debug(f'  Total event count (<{event}> : <{operation}>) is increased by <{delta_event_count}> = count <{path_event_count}> * factor <{path_event_factor}>.')
+                    legal_op_metric_dict[legal_op] = event_graph.vp[get_metric_property_name(metric, legal_op)][event_node]
 
                 for legal_op in legal_ops:
                     op_metric_value = legal_op_metric_dict[legal_op] * legal_op_count_dict[legal_op]
-                    event_metric[key_value] += op_metric_value
-                    logger.debug(f'  Total value (<{event}> : <{legal_op}>) = <{op_metric_value}> <{event_metric[key_unit]}> = single value <{legal_op_metric_dict[legal_op]}> * count <{legal_op_count_dict[legal_op]}>.')
-                logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metric[key_value]}> <{event_metric[key_unit]}>.')
+                    event_metrics[metric][key_value] += op_metric_value
+                    logger.debug(f'  Total value (<{event}> : <{legal_op}>) = <{op_metric_value}> <{event_metrics[metric][key_unit]}> = single value <{legal_op_metric_dict[legal_op]}> * count <{legal_op_count_dict[legal_op]}>.')
+                logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metrics[metric][key_value]}> <{event_metrics[metric][key_unit]}>.')
 
             else:
                 # get the event count from workload to event
-                total_event_count = 0.
-                for path in gt.all_paths(event_graph, workload_node, event_node):
-                    path_event_count = 1.
-                    path_event_factor = 1.
-                    # calculate total event count based on the path
-                    for idx in range(len(path)-1):
-                        edge = event_graph.edge(path[idx], path[idx+1])
-                        path_event_count *= event_graph.ep.count[edge]
-                        if metric in event_graph.ep.factor[edge]:
-                            path_event_factor *= event_graph.ep.factor[edge][metric]
-                        logger.debug(f'  Path (<{event_graph.vp.event[edge.source()]}> -> <{event_graph.vp.event[edge.target()]}>) updates event count to <{path_event_count}> and event factor to <{path_event_factor}>.')
-                    delta_event_count = path_event_count * path_event_factor
-                    total_event_count += delta_event_count
-                    logger.debug(f'  Total event count (<{workload}> -> <{event}>) is increased by <{delta_event_count}> = count <{path_event_count}> * factor <{path_event_factor}>.')
-                # get the metric value from event to all its subevents
-                event_graph = aggregate_summation(event_graph=event_graph, start_node=event_node, metric=metric)
-                event_metric[key_value] = event_graph.vp.metric[event_node][metric][key_value] * total_event_count
-                logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metric[key_value]}> <{event_metric[key_unit]}> = single value <{event_graph.vp.metric[event_node][metric][key_value]}> * count <{total_event_count}>.')
+                total_event_count = float(path_count[int(event_node), metrics.index(metric)])
+                logger.debug(f'  Total event count (<{workload}> -> <{event}>) = <{total_event_count}>.')
+                event_metrics[metric][key_value] = single_value * total_event_count
+                logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metrics[metric][key_value]}> <{event_metrics[metric][key_unit]}> = single value <{single_value}> * count <{total_event_count}>.')
 
     # specified aggregation mode: parallel/sequential is taken into account
-    elif aggregation == 'specified':
+    if len(aggregation_metrics['specified']) > 0:
         # for specified mode, the input can not be a module, i.e., the output degree shall be large than 0
-        assert event_node.out_degree() > 0, logger.error(f'Invalid module <{event}> for aggregation <{aggregation}>; this aggregation requires an event.')
-        
-        if workload is None or workload == event:
-            total_event_count = 1.
-        else:
-            # get the event count from workload to event
-            total_event_count = 0.
-            for path in gt.all_paths(event_graph, workload_node, event_node):
-                path_event_count = 1.
-                path_event_factor = 1.
-                # calculate total event count based on the path
-                for idx in range(len(path)-1):
-                    edge = event_graph.edge(path[idx], path[idx+1])
-                    path_event_count *= event_graph.ep.count[edge]
-                    if metric in event_graph.ep.factor[edge]:
-                        path_event_factor *= event_graph.ep.factor[edge][metric]
-                    logger.debug(f'  Path (<{event_graph.vp.event[edge.source()]}> -> <{event_graph.vp.event[edge.target()]}>) updates event count to <{path_event_count}> and event factor to <{path_event_factor}>.')
-                delta_event_count = path_event_count * path_event_factor
-                total_event_count += delta_event_count
-                logger.debug(f'  Total event count (<{workload}> -> <{event}>) is increased by <{delta_event_count}> = count <{path_event_count}> * factor <{path_event_factor}>.')
-        
-        event_graph = aggregate_specified(event_graph=event_graph, start_node=event_node, metric=metric)
-        event_metric[key_value] = event_graph.vp.metric[event_node][metric][key_value] * total_event_count
-        if workload is None:
-            logger.debug(f'  Total value (<{event}>) = <{event_metric[key_value]}> <{event_metric[key_unit]}> = single value <{event_graph.vp.metric[event_node][metric][key_value]}>.')
-        else:
-            logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metric[key_value]}> <{event_metric[key_unit]}> = single value <{event_graph.vp.metric[event_node][metric][key_value]}> * count <{total_event_count}>.')
+        assert event_node.out_degree() > 0, logger.error(f'Invalid module <{event}> for aggregation <specified>; this aggregation requires an event.')
+
+        specified_value = aggregate_specified(event_graph=event_graph, start_node=event_node, metrics=aggregation_metrics['specified'])
+
+        for metric_index, metric in enumerate(aggregation_metrics['specified']):
+            single_value = float(specified_value[int(event_node), metric_index])
+
+            if workload is None or workload == event:
+                total_event_count = 1.
+            else:
+                # get the event count from workload to event
+                total_event_count = float(path_count[int(event_node), metrics.index(metric)])
+                logger.debug(f'  Total event count (<{workload}> -> <{event}>) = <{total_event_count}>.')
+
+            event_metrics[metric][key_value] = single_value * total_event_count
+            if workload is None:
+                logger.debug(f'  Total value (<{event}>) = <{event_metrics[metric][key_value]}> <{event_metrics[metric][key_unit]}> = single value <{single_value}>.')
+            else:
+                logger.debug(f'  Total value (<{workload}> -> <{event}>) = <{event_metrics[metric][key_value]}> <{event_metrics[metric][key_unit]}> = single value <{single_value}> * count <{total_event_count}>.')
     
-    if workload is not None:
-        logger.success(f'Aggregate metric <{metric}> for event <{event}> in workload <{workload}> with aggregation <{aggregation}>.')
-    else:
-        logger.success(f'Aggregate metric <{metric}> for event <{event}> with aggregation <{aggregation}>.')
-
-    return event_metric
-
-
-def aggregate_module(graph: gt.Graph, current_node: gt.Vertex, sum: float, metric: str, evaluated: list, top_event: str) -> float:
-    # leaf nodes will return their own value
-    if current_node.out_degree() == 0:
-        if current_node not in evaluated:
-            key_list = list(graph.vp.metric[current_node][metric].keys())
-            key_list.sort()
-            expected_key_list = [key_value, key_unit]
-            expected_key_list.sort()
-            assert key_list == expected_key_list, logger.error(f'Invalid metric <{metric}> for module <{graph.vp.event[current_node]}>.')
-            evaluated.append(current_node)
-            logger.info(f'Aggregate metric <{metric}> for module <{graph.vp.event[current_node]}> in event <{top_event}>.')
-            total_metric_value = graph.vp.metric[current_node][metric][key_value] * graph.vp.metric[current_node][key_instance]
-            logger.debug(f'  Total value (<{top_event}> -> <{graph.vp.event[current_node]}>) = <{total_metric_value}> <{graph.vp.metric[current_node][metric][key_unit]}> = single value <{graph.vp.metric[current_node][metric][key_value]}> * instance <{graph.vp.metric[current_node][key_instance]}>.')
-            return sum + total_metric_value
+    for metric in metrics:
+        if workload is not None:
+            logger.success(f'Aggregate metric <{metric}> for event <{event}> in workload <{workload}> with aggregation <{metric_dict[metric][key_aggregation]}>.')
         else:
-            logger.info(f'Ignore repeated module <{graph.vp.event[current_node]}>.')
-            return 0
-    
-    # non-leaf nodes will aggregate their children
-    else:
-        temp_sum = 0.
-        for child in current_node.out_neighbors():
-            logger.debug(f'  Check subevent <{graph.vp.event[current_node]}> -> <{graph.vp.event[child]}>.')
-            temp_sum += aggregate_module(graph, child, sum, metric, evaluated, graph.vp.event[current_node])
-        return temp_sum
+            logger.success(f'Aggregate metric <{metric}> for event <{event}> with aggregation <{metric_dict[metric][key_aggregation]}>.')
 
+    return event_metrics
 
-def aggregate_summation(event_graph: gt.Graph, start_node: gt.Vertex, metric: str) -> gt.Graph:
-    # topological sort for aggregation, from module to start event
-    topo_order = topological_sort_reverse(event_graph, start_node=start_node)
 
-    # aggregate metric upwards through the graph
-    for v in topo_order:
-        if event_graph.vertex(v).out_degree() == 0:
-            logger.info(f'Aggregate metric <{metric}> for module <{event_graph.vp.event[v]}>.')
+def aggregate_batch_metrics(event_graphs: list, metric_dict: str, metrics: list=None, workload: str=None, event: str=None, configs: list=None) -> pd.DataFrame:
+    """
+    Aggregate multiple metrics for an event in a batch of event graphs with identical structure, e.g., checkpoints of a sweep, and return a table indexed by config with one column per metric.
+    Counts, factors and metrics of all graphs are stacked with one column per config, and each metric is aggregated once for all configs with the shared event plan.
+    If configs is none, graphs are indexed by their position in the batch.
+    """
+    if metrics is None:
+        metrics = list(metric_dict.keys())
+    if configs is None:
+        configs = list(range(len(event_graphs)))
+
+    assert len(event_graphs) > 0, logger.error(f'Invalid empty batch of event graphs.')
+    assert len(configs) == len(event_graphs), logger.error(f'Invalid configs <{configs}> for <{len(event_graphs)}> event graphs.')
+    for metric in metrics:
+        assert metric in metric_dict, logger.error(f'Invalid metric <{metric}>.')
+        assert key_aggregation in metric_dict[metric], logger.error(f'Missing aggregation in metric <{metric}>.')
+        assert metric_dict[metric][key_aggregation] in legal_aggregation, logger.error(f'Invalid aggregation <{metric_dict[metric][key_aggregation]}> for metric <{metric}>; legal values: {legal_aggregation}.')
+
+    # all graphs share the plan of the first graph
+    plan = get_event_plan(event_graphs[0])
+    for config, event_graph in zip(configs, event_graphs):
+        assert get_event_plan(event_graph)['hash'] == plan['hash'], logger.error(f'Invalid event graph for config <{config}>; batch aggregation requires identical structure.')
+        get_metric_table(event_graph)
+
+    # get the event node, which has the same index in all graphs
+    event_node = get_event_node(event_graphs[0], event)
+    assert event_node is not None, logger.error(f'Invalid event <{event}>.')
+    reachable_mask = get_reachable_mask(event_graphs[0], start_node=event_node)
+    is_module = plan['level'][int(event_node)] == 0
+
+    # validate event in workload
+    if workload is not None and workload != event:
+        workload_node = get_event_node(event_graphs[0], workload)
+        assert workload_node is not None, logger.error(f'Invalid workload <{workload}>.')
+        workload_mask = get_reachable_mask(event_graphs[0], start_node=workload_node)
+        assert workload_mask[int(event_node)], logger.error(f'Invalid event <{event}> in workload <{workload}>.')
+
+    # stack the edge count of all configs
+    count = np.stack([get_plan_data(event_graph)[key_count] for event_graph in event_graphs], axis=1)
+
+    batch_metrics = OrderedDict()
+    for metric in metrics:
+        aggregation = metric_dict[metric][key_aggregation]
+        is_multi_operation = np.stack([get_multi_operation_mask(event_graph, metric=metric) for event_graph in event_graphs], axis=1)
+        module_value = np.stack([event_graph.vp[get_metric_property_name(metric)].a for event_graph in event_graphs], axis=1)
+        factor = np.stack([get_plan_data(event_graph, metric=metric)[key_factor] for event_graph in event_graphs], axis=1)
+
+        # module aggregation mode: only sum all leaf nodes from current node
+        if aggregation == 'module':
+            if workload is not None:
+                logger.warning(f'Ignore workload <{workload}> in aggregation <module>.')
+            module_node = plan['module'][reachable_mask[plan['module']]]
+            for config, is_multi_config in zip(configs, is_multi_operation[module_node].T):
+                assert not is_multi_config.any(), logger.error(f'Invalid metric <{metric}> for module <{event_graphs[0].vp.event[module_node[is_multi_config][0]]}> in config <{config}>.')
+            instance = np.stack([event_graph.vp[key_instance].a for event_graph in event_graphs], axis=1)
+            batch_metrics[metric] = (module_value[module_node] * instance[module_node]).sum(axis=0)
+            logger.success(f'Aggregate metric <{metric}> for event <{event}> in <{len(configs)}> configs with aggregation <{aggregation}>.')
+            continue
+
+        node_value = np.zeros((len(plan['level']), len(configs)))
+        if aggregation == 'summation':
+            if (workload is None or workload == event) and is_module:
+                assert not is_multi_operation[int(event_node)].any(), logger.error(f'Invalid module <{event}> for aggregation <summation>; this aggregation does not support multi-operation module.')
+            edge_mask = reachable_mask[plan['edge_source']]
+            edge_value = np.stack([get_edge_value(event_graph, metric=metric, edge_mask=edge_mask) for event_graph in event_graphs], axis=1)
+            node_value[plan['module']] = module_value[plan['module']]
+            execute_summation_plan(plan=plan, count=count, factor=factor, edge_value=edge_value, node_value=node_value, node_mask=reachable_mask)
         else:
-            logger.info(f'Aggregate metric <{metric}> for event <{event_graph.vp.event[v]}>.')
-
-        for e in event_graph.vertex(v).in_edges():
-            # only calculate if the parent event is on the path (in topo_order)
-            if e.source() in topo_order:
-                # the count of subevents in event
-                subevent_count = event_graph.ep.count[e]
-                if metric in event_graph.ep.factor[e]:
-                    event_factor = event_graph.ep.factor[e][metric]
-                else:
-                    event_factor = 1.
-                # get the metric value of target node
-                edge_target_metric = get_metric_value(event_graph=event_graph, edge=e, metric=metric)
-                # update the metric value of source node
-                total_metric_value = subevent_count * edge_target_metric * event_factor
-                event_graph.vp.metric[e.source()][metric][key_value] += total_metric_value
-                logger.debug(f'  Total value (<{event_graph.vp.event[e.source()]}> -> <{event_graph.vp.event[e.target()]}>) = <{total_metric_value}> <{event_graph.vp.metric[e.source()][metric][key_unit]}> = single value <{edge_target_metric}> * count <{subevent_count}> * factor <{event_factor}>.')
+            # for specified mode, the input can not be a module
+            assert not is_module, logger.error(f'Invalid module <{event}> for aggregation <specified>; this aggregation requires an event.')
+            for event_graph in event_graphs:
+                check_specified_metric(event_graph, metric=metric, node_mask=reachable_mask)
+            is_parallel = np.stack([get_plan_data(event_graph)[key_parallel] for event_graph in event_graphs], axis=1)
+            leaf_value = np.stack([get_plan_data(event_graph, metric=metric)[key_performance] for event_graph in event_graphs], axis=1)
+            execute_specified_plan(plan=plan, count=count, factor=factor, is_parallel=is_parallel, leaf_value=leaf_value, node_value=node_value, node_mask=reachable_mask)
 
-    return event_graph
+        if workload is None or workload == event:
+            batch_metrics[metric] = node_value[int(event_node)]
+        else:
+            # path count from workload to event for all configs
+            path_count = np.zeros_like(node_value)
+            path_count[int(workload_node)] = 1.
+            execute_path_count_plan(plan=plan, count=count, factor=factor, path_count=path_count)
+            batch_metrics[metric] = node_value[int(event_node)] * path_count[int(event_node)]
+
+            # multi-operation module is split by the operation on the last edge of each path
+            if aggregation == 'summation' and is_module and is_multi_operation[int(event_node)].any():
+                edge_mask = (plan['edge_target'] == int(event_node)) & workload_mask[plan['edge_source']]
+                edge_value = np.stack([get_edge_value(event_graph, metric=metric, edge_mask=edge_mask) for event_graph in event_graphs], axis=1)
+                edge_index = np.flatnonzero(edge_mask)
+                op_metric_value = (path_count[plan['edge_source'][edge_index]] * count[edge_index] * factor[edge_index] * edge_value[edge_index]).sum(axis=0)
+                batch_metrics[metric] = np.where(is_multi_operation[int(event_node)], op_metric_value, batch_metrics[metric])
 
+        if workload is not None:
+            logger.success(f'Aggregate metric <{metric}> for event <{event}> in workload <{workload}> in <{len(configs)}> configs with aggregation <{aggregation}>.')
+        else:
+            logger.success(f'Aggregate metric <{metric}> for event <{event}> in <{len(configs)}> configs with aggregation <{aggregation}>.')
 
-def aggregate_specified(event_graph: gt.Graph, start_node: gt.Vertex, metric: str) -> gt.Graph:
-    # topological sort for aggregation, from module to start event
-    # start from the event connected to modules and ignore modules
-    topo_order = topological_sort_reverse(event_graph, start_node=start_node)
+    batch_df = pd.DataFrame(batch_metrics, index=configs, columns=metrics)
+    batch_df.index.name = 'config'
+    return batch_df
 
-    # aggregate metric upwards through the graph
-    for v in topo_order:
-        event_name = event_graph.vp.event[v]
-        if event_graph.vertex(v).out_degree() == 0:
-            logger.info(f'Ignore module <{event_name}>.')
-        else:
-            logger.info(f'Aggregate metric <{metric}> for event <{event_name}>.')
 
-            parallel_max = 0.
-            sequential_acc = 0.
+def aggregate_module(graph: gt.Graph, start_node: gt.Vertex, metrics: list, top_event: str) -> OrderedDict:
+    # all modules reachable from the top event are aggregated once
+    plan = get_event_plan(graph)
+    reachable_mask = get_reachable_mask(graph, start_node=start_node)
+    module_node = plan['module'][reachable_mask[plan['module']]]
+    logger.info(f'Aggregate metric <{metrics}> for <{len(module_node)}> modules in event <{top_event}>.')
 
-            connect_leaf_only = True
-            connect_leaf_any = False
+    module_sum = OrderedDict()
+    for metric in metrics:
+        is_multi_operation = get_multi_operation_mask(graph, metric=metric)
+        if is_multi_operation[module_node].any():
+            invalid_node = module_node[is_multi_operation[module_node]][0]
+            assert False, logger.error(f'Invalid metric <{metric}> for module <{graph.vp.event[invalid_node]}>.')
+        total_metric_value = graph.vp[get_metric_property_name(metric)].a[module_node] * graph.vp[key_instance].a[module_node]
+        module_sum[metric] = float(total_metric_value.sum())
+        logger.debug(f'  Total value (<{top_event}>) = <{module_sum[metric]}> = sum of single value * instance over modules.')
 
-            for e in event_graph.vertex(v).out_edges():
-                edge_target_event = event_graph.vp.event[e.target()]
-                if e.target().out_degree() == 0:
-                    assert key_value in event_graph.vp.metric[e.target()][metric], logger.error(f'Invalid metric <{metric}> for event <{edge_target_event}>; legal metric: {single_op_metric_format}.')
-                    connect_leaf_any = True
-                    logger.debug(f'  Ignore module <{edge_target_event}>.')
-                
-                else:
-                    connect_leaf_only = False
-                    metric_mode = event_graph.ep.aggregation[e]
-                    if metric in event_graph.ep.factor[e]:
-                        event_factor = event_graph.ep.factor[e][metric]
-                    else:
-                        event_factor = 1.
-                    metric_value = event_graph.vp.metric[e.target()][metric][key_value] * event_graph.ep.count[e] * event_factor
-                    logger.debug(f'  Total value (<{edge_target_event}>) = <{metric_value}> <{event_graph.vp.metric[e.target()][metric][key_unit]}> = single value <{event_graph.vp.metric[e.target()][metric][key_value]}> * count <{event_graph.ep.count[e]}> * factor <{event_factor}>.')
-
-                    if metric_mode == 'parallel':
-                        if metric_value > parallel_max:
-                            logger.debug(f'  Update parallel maximum metric value to <{metric_value}>, based on event <{edge_target_event}>.')
-                            parallel_max = metric_value
-                    else:
-                        logger.debug(f'  Update sequential accumulated metric value by <{metric_value}>, based on event <{edge_target_event}>.')
-                        sequential_acc += metric_value
-            
-            # the final value is the sum of sequential acc and maximum parallel
-            event_graph.vp.metric[v][metric][key_value] = sequential_acc + parallel_max
-
-            # report design errors in the performance model
-            # case1: if an event is only connected to modules, it should have a performance model with metric defined
-            if connect_leaf_only is True:
-                assert event_graph.vp[metric][v] is not None, logger.error(f'  Missing metric <{metric}> in event <{event_graph.vp.event[v]}>, since it is only connected to modules; check the performance model.')
-                event_graph.vp.metric[v][metric][key_value] = event_graph.vp[metric][v][key_value]
-            
-            # case2: if an event is connected to no modules, it should not have a performance model with metric defined
-            if connect_leaf_any is False:
-                assert event_graph.vp[metric][v] is None, logger.error(f'  Invalid metric <{metric}> in event <{event_graph.vp.event[v]}>, since it is connected to no modules; check the performance model.')
-            
-            logger.debug(f'  Total value (<{event_graph.vp.event[v]}>) = <{event_graph.vp.metric[v][metric][key_value]}> <{event_graph.vp.metric[v][metric][key_unit]}>.')
+    return module_sum
 
-    return event_graph
+
+def aggregate_summation(event_graph: gt.Graph, start_node: gt.Vertex, metrics: list) -> np.ndarray:
+    """
+    Sum the metrics from all reachable nodes up to the start node, and return the values in a buffer indexed by node index and metric.
+    A single-operation module holds its own value, and a multi-operation module holds nan, since its value depends on the operation on each edge.
+    The value of a node only depends on its subevents, so values are cached per graph and only dirty nodes are recomputed with the event plan.
+    """
+    plan = get_event_plan(event_graph)
+    reachable_mask = get_reachable_mask(event_graph, start_node=start_node)
+    edge_data = get_plan_data(event_graph)
+
+    subtotals = [get_subtotal_cache(event_graph, metric=metric, aggregation='summation') for metric in metrics]
+
+    metric_value_list = []
+    for metric, (metric_value, is_clean, subtotal_lock) in zip(metrics, subtotals):
+        # concurrent queries of the same metric wait for the recomputation, and read a copy of the values
+        with subtotal_lock:
+            node_mask = reachable_mask & ~is_clean
+            if node_mask.any():
+                logger.info(f'Aggregate metric <{metric}> for <{int(node_mask.sum())}> nodes.')
+
+                # modules hold their own value
+                metric_value[plan['module']] = event_graph.vp[get_metric_property_name(metric)].a[plan['module']]
+
+                # multi-operation modules take the value of the operation on each edge
+                edge_value = get_edge_value(event_graph, metric=metric, edge_mask=node_mask[plan['edge_source']])
+
+                execute_summation_plan(plan=plan, count=edge_data[key_count], factor=get_plan_data(event_graph, metric=metric)[key_factor], edge_value=edge_value, node_value=metric_value, node_mask=node_mask)
+                is_clean[node_mask] = True
+            metric_value_list.append(metric_value.copy())
+
+    return np.stack(metric_value_list, axis=1)
+
+
+def aggregate_specified(event_graph: gt.Graph, start_node: gt.Vertex, metrics: list) -> np.ndarray:
+    """
+    Aggregate the metrics with parallel maximum and sequential summation up to the start node, and return the values in a buffer indexed by node index and metric.
+    Modules are ignored and hold 0.
+    The value of a node only depends on its subevents, so values are cached per graph and only dirty nodes are recomputed with the event plan.
+    """
+    plan = get_event_plan(event_graph)
+    reachable_mask = get_reachable_mask(event_graph, start_node=start_node)
+    edge_data = get_plan_data(event_graph)
+
+    subtotals = [get_subtotal_cache(event_graph, metric=metric, aggregation='specified') for metric in metrics]
+
+    metric_value_list = []
+    for metric, (metric_value, is_clean, subtotal_lock) in zip(metrics, subtotals):
+        # concurrent queries of the same metric wait for the recomputation, and read a copy of the values
+        with subtotal_lock:
+            node_mask = reachable_mask & ~is_clean
+            if node_mask.any():
+                logger.info(f'Aggregate metric <{metric}> for <{int(node_mask.sum())}> nodes.')
+
+                metric_data = get_plan_data(event_graph, metric=metric)
+                check_specified_metric(event_graph, metric=metric, node_mask=node_mask)
+
+                metric_value[plan['module']] = 0.
+                execute_specified_plan(plan=plan, count=edge_data[key_count], factor=metric_data[key_factor], is_parallel=edge_data[key_parallel], leaf_value=metric_data[key_performance], node_value=metric_value, node_mask=node_mask)
+                is_clean[node_mask] = True
+            metric_value_list.append(metric_value.copy())
+
+    return np.stack(metric_value_list, axis=1)
+
+
+def check_specified_metric(event_graph: gt.Graph, metric: str, node_mask: np.ndarray) -> None:
+    """
+    Report design errors in the performance model for the specified aggregation of all events in the node mask.
+    """
+    plan = get_event_plan(event_graph)
+    metric_data = get_plan_data(event_graph, metric=metric)
+    event_mask = node_mask & (plan['level'] > 0)
+
+    # modules connected to events shall be single-operation
+    edge_mask = event_mask[plan['edge_source']] & (plan['level'][plan['edge_target']] == 0)
+    is_multi_operation = get_multi_operation_mask(event_graph, metric=metric)
+    invalid_edge = np.flatnonzero(edge_mask & is_multi_operation[plan['edge_target']])
+    assert len(invalid_edge) == 0, logger.error(f'Invalid metric <{metric}> for event <{event_graph.vp.event[plan["edge_target"][invalid_edge[0]]]}>; legal metric: {single_op_metric_format}.')
+
+    # case1: if an event is only connected to modules, it should have a performance model with metric defined
+    is_missing = np.isnan(metric_data[key_performance])
+    invalid_node = np.flatnonzero(event_mask & ~plan['has_event_child'] & is_missing)
+    assert len(invalid_node) == 0, logger.error(f'  Missing metric <{metric}> in event <{event_graph.vp.event[invalid_node[0]]}>, since it is only connected to modules; check the performance model.')
+
+    # case2: if an event is connected to no modules, it should not have a performance model with metric defined
+    invalid_node = np.flatnonzero(event_mask & ~plan['has_module_child'] & ~is_missing)
+    assert len(invalid_node) == 0, logger.error(f'  Invalid metric <{metric}> in event <{event_graph.vp.event[invalid_node[0]]}>, since it is connected to no modules; check the performance model.')
+
+
+def execute_summation_plan(plan: OrderedDict, count: np.ndarray, factor: np.ndarray, edge_value: np.ndarray, node_value: np.ndarray, node_mask: np.ndarray) -> np.ndarray:
+    """
+    Sum count * factor * value of subevents for all nodes in the node mask, level by level from module to top event.
+    Arrays are indexed by edge or node in the first dimension, and may hold multiple configurations in trailing dimensions.
+    An edge value overrides the value of its target node, unless it is nan.
+    Values of nodes in the node mask are updated in place.
+    """
+    edge_source, edge_target, edge_level_ptr = plan['edge_source'], plan['edge_target'], plan['edge_level_ptr']
+
+    for level in range(1, len(edge_level_ptr) - 1):
+        edge_index = np.arange(edge_level_ptr[level], edge_level_ptr[level + 1])
+        edge_index = edge_index[node_mask[edge_source[edge_index]]]
+        if len(edge_index) == 0:
+            continue
+
+        source = edge_source[edge_index]
+        target_value = edge_value[edge_index]
+        target_value = np.where(np.isnan(target_value), node_value[edge_target[edge_index]], target_value)
+
+        node_value[np.unique(source)] = 0.
+        np.add.at(node_value, source, count[edge_index] * target_value * factor[edge_index])
+
+    return node_value
+
+
+def execute_specified_plan(plan: OrderedDict, count: np.ndarray, factor: np.ndarray, is_parallel: np.ndarray, leaf_value: np.ndarray, node_value: np.ndarray, node_mask: np.ndarray) -> np.ndarray:
+    """
+    Aggregate the maximum of parallel subevents plus the sum of sequential subevents for all nodes in the node mask, level by level from module to top event.
+    Edges to modules are ignored, and an event only connected to modules takes its leaf value from the performance model.
+    Arrays are indexed by edge or node in the first dimension, and may hold multiple configurations in trailing dimensions, including the parallel flag.
+    Values of nodes in the node mask are updated in place.
+    """
+    edge_source, edge_target, edge_level_ptr, level = plan['edge_source'], plan['edge_target'], plan['edge_level_ptr'], plan['level']
+    sequential_acc = np.zeros_like(node_value)
+    parallel_max = np.zeros_like(node_value)
+
+    for current_level in range(1, len(edge_level_ptr) - 1):
+        edge_index = np.arange(edge_level_ptr[current_level], edge_level_ptr[current_level + 1])
+        edge_index = edge_index[node_mask[edge_source[edge_index]]]
+        if len(edge_index) == 0:
+            continue
+
+        source_node = np.unique(edge_source[edge_index])
+        sequential_acc[source_node] = 0.
+        parallel_max[source_node] = 0.
+
+        # only edges to events are aggregated, and parallel edges add 0 to sequential acc and vice versa
+        edge_index = edge_index[level[edge_target[edge_index]] > 0]
+        source = edge_source[edge_index]
+        edge_metric_value = node_value[edge_target[edge_index]] * count[edge_index] * factor[edge_index]
+        np.fmax.at(parallel_max, source, np.where(is_parallel[edge_index], edge_metric_value, 0.))
+        np.add.at(sequential_acc, source, np.where(is_parallel[edge_index], 0., edge_metric_value))
+
+        # the final value is the sum of sequential acc and maximum parallel
+        node_value[source_node] = sequential_acc[source_node] + parallel_max[source_node]
+        leaf_node = source_node[~plan['has_event_child'][source_node]]
+        node_value[leaf_node] = leaf_value[leaf_node]
+
+    return node_value
+
+
+def execute_path_count_plan(plan: OrderedDict, count: np.ndarray, factor: np.ndarray, path_count: np.ndarray) -> np.ndarray:
+    """
+    Propagate count * factor of each edge from source to target, level by level from top event to module.
+    Arrays are indexed by edge or node in the first dimension, and may hold multiple configurations or metrics in trailing dimensions.
+    The path count is updated in place.
+    """
+    edge_source, edge_target, edge_level_ptr = plan['edge_source'], plan['edge_target'], plan['edge_level_ptr']
+
+    for level in reversed(range(1, len(edge_level_ptr) - 1)):
+        edge_index = np.arange(edge_level_ptr[level], edge_level_ptr[level + 1])
+        np.add.at(path_count, edge_target[edge_index], path_count[edge_source[edge_index]] * count[edge_index] * factor[edge_index])
+
+    return path_count
+
+
+def get_plan_data(event_graph: gt.Graph, metric: str=None) -> OrderedDict:
+    """
+    Gather edge properties as arrays in the edge order of the event plan.
+    If metric is none, return the count and whether each edge is parallel.
+    Otherwise, return the factor and operation of each edge, and the value of each node from the performance model, which is nan if not defined.
+    Arrays are cached per graph until mark_event_dirty reports changed edges, or check_event_count finds changed counts, and shall not be modified.
+    Direct writes to the factor or aggregation of edges are not detected, so call mark_event_dirty afterwards.
+    """
+    check_event_count(event_graph)
+    plan = get_event_plan(event_graph)
+    plan_data_cache = get_graph_cache(event_graph, key_plan_data)
+
+    with graph_cache_lock:
+        if None not in plan_data_cache:
+            edge_dict = {int(event_graph.edge_index[e]): e for e in event_graph.edges()}
+            edges = [edge_dict[edge_index] for edge_index in plan['edge']]
+            plan_data_cache[None] = OrderedDict({
+                key_edge: edges,
+                key_count: np.array([event_graph.ep.count[e] for e in edges], dtype=float),
+                key_parallel: np.array([event_graph.ep.aggregation[e] == 'parallel' for e in edges], dtype=bool),
+            })
+        if metric is None:
+            return plan_data_cache[None]
+
+        if metric not in plan_data_cache:
+            edges = plan_data_cache[None][key_edge]
+            is_module = plan['level'][plan['edge_target']] == 0
+            operation = [event_graph.ep.operation[e].get(metric) if is_module[edge_index] else None for edge_index, e in enumerate(edges)]
+            performance = np.full(event_graph.num_vertices(), np.nan)
+            if metric in event_graph.vp:
+                for v in event_graph.vertices():
+                    if event_graph.vp[metric][v] is not None:
+                        performance[int(v)] = event_graph.vp[metric][v][key_value]
+            plan_data_cache[metric] = OrderedDict({
+                key_factor: np.array([get_edge_factor(event_graph=event_graph, edge=e, metric=metric) for e in edges], dtype=float),
+                key_operation: np.array([op.lower() if isinstance(op, str) else None for op in operation], dtype=object),
+                key_performance: performance,
+            })
+        return plan_data_cache[metric]
+
+
+def get_multi_operation_mask(event_graph: gt.Graph, metric: str) -> np.ndarray:
+    # a multi-operation module has nan in the metric, and a value in any of its operations
+    is_multi_operation = np.isnan(event_graph.vp[get_metric_property_name(metric)].a)
+    operations = get_metric_table(event_graph)[metric][key_operation]
+    if len(operations) == 0:
+        return np.zeros(event_graph.num_vertices(), dtype=bool)
+    has_operation = np.stack([~np.isnan(event_graph.vp[get_metric_property_name(metric, operation)].a) for operation in operations]).any(axis=0)
+    return is_multi_operation & has_operation
+
+
+def get_edge_value(event_graph: gt.Graph, metric: str, edge_mask: np.ndarray) -> np.ndarray:
+    """
+    Get the value of the operation on each edge in the edge mask to a multi-operation module, which is nan for other edges.
+    """
+    plan = get_event_plan(event_graph)
+    is_multi_operation = get_multi_operation_mask(event_graph, metric=metric)
+    operation = get_plan_data(event_graph, metric=metric)[key_operation]
+
+    edge_value = np.full(len(plan['edge']), np.nan)
+    for edge_index in np.flatnonzero(edge_mask & is_multi_operation[plan['edge_target']]):
+        target_node = plan['edge_target'][edge_index]
+        _, legal_ops = check_single_operation(event_graph=event_graph, metric=metric, event_node=target_node)
+        assert operation[edge_index] in legal_ops, logger.error(f'Invalid operation <{operation[edge_index]}> for metric <{metric}> in module <{event_graph.vp.event[target_node]}>; legal values: {legal_ops}.')
+        edge_value[edge_index] = event_graph.vp[get_metric_property_name(metric, operation[edge_index])][target_node]
+
+    return edge_value
+
+
+def get_subtotal_cache(event_graph: gt.Graph, metric: str, aggregation: str) -> tuple:
+    """
+    Get the cached value of a metric for all nodes, whether each value is clean, and the lock to hold while reading or recomputing the values.
+    Values are marked dirty with mark_event_dirty, after edges or metrics change, and all values are dirty if check_event_count finds changed counts.
+    Factors written directly to the edge properties are not tracked, and require mark_event_dirty to refresh the cache.
+    """
+    check_event_count(event_graph)
+    subtotal_cache = get_graph_cache(event_graph, key_subtotal)
+    with graph_cache_lock:
+        if (metric, aggregation) not in subtotal_cache:
+            subtotal_cache[(metric, aggregation)] = (np.zeros(event_graph.num_vertices()), np.zeros(event_graph.num_vertices(), dtype=bool), threading.Lock())
+        return subtotal_cache[(metric, aggregation)]
 
 
 def topological_sort_reverse(graph: gt.Graph, start_node: gt.Vertex) -> list:
-    # topological sort with dfs
-    # output is not deterministic due to use of dfs
-    topo_order = list(gt.topological_sort(graph))
-
-    # remove redundant nodes from the start event
-    to_remove = []
-    for v in topo_order:
-        if v != start_node:
-            node_list = gt.shortest_path(graph, start_node, v)[0]
-            if len(node_list) == 0:
-                to_remove.append(v)
-    for v in to_remove:
-        topo_order.remove(v)
-    
-    topo_order.reverse()
+    # topological sort from module to start event, only including nodes reachable from the start event
+    topo_order, _ = topological_sort_reachable(graph, start_node=start_node)
+    return list(topo_order)
+
+
+def topological_sort_reachable(graph: gt.Graph, start_node: gt.Vertex) -> tuple:
+    """
+    Return the reverse topological order (from module to start event) of all nodes reachable from the start node, and the set of reachable nodes, both as node indices.
+    Reachability is labeled with a single traversal from the start node.
+    The result is cached per graph and start node, and shall not be modified.
+    """
+    topo_cache = get_graph_cache(graph, key_topological_sort)
+
+    # concurrent queries compute each order once
+    with graph_cache_lock:
+        if int(start_node) not in topo_cache:
+            # topological sort of the full graph is shared by all start nodes
+            if None not in topo_cache:
+                topo_cache[None] = gt.topological_sort(graph)
+            
+            # remove redundant nodes from the start event
+            reachable_mask = get_reachable_mask(graph, start_node=start_node)
+            topo_order = topo_cache[None][reachable_mask[topo_cache[None]]]
+            topo_order = tuple(int(v) for v in reversed(topo_order))
+            topo_cache[int(start_node)] = (topo_order, frozenset(topo_order))
 
-    return topo_order
+        return topo_cache[int(start_node)]
+
+
+def get_reachable_mask(graph: gt.Graph, start_node: gt.Vertex) -> np.ndarray:
+    """
+    Return whether each node is reachable from the start node, labeled with a single traversal from the start node.
+    The mask is cached per graph and start node, and shall not be modified.
+    """
+    reachable_cache = get_graph_cache(graph, key_reachable)
+    with graph_cache_lock:
+        if int(start_node) not in reachable_cache:
+            reachable_property = gt.label_out_component(graph, graph.vertex(int(start_node)))
+            reachable_cache[int(start_node)] = reachable_property.a.astype(bool)
+        return reachable_cache[int(start_node)]
+
+
+def aggregate_path_count(event_graph: gt.Graph, start_node: gt.Vertex, metrics: list=None) -> np.ndarray:
+    """
+    Dynamic programming for the path count from the start node to all reachable nodes, in a buffer indexed by node index and metric.
+    The path count of a node is the sum over all paths from the start node of the product of edge count and factor of the metric.
+    This is identical to enumerating all paths, but only visits each edge once with the event plan.
+    Unreachable nodes hold 0.
+    If metrics is none, factor is ignored and the buffer holds a single path count per node.
+    The buffer is cached per graph until edges change, and shall not be modified.
+    """
+    if metrics is None:
+        metrics = [None]
+
+    # path count is cached until edges change
+    check_event_count(event_graph)
+    path_count_cache = get_graph_cache(event_graph, key_path_count)
+    path_count_key = (int(start_node), tuple(metrics))
+    with graph_cache_lock:
+        if path_count_key in path_count_cache:
+            return path_count_cache[path_count_key]
+
+    plan = get_event_plan(event_graph)
+    count = get_plan_data(event_graph)[key_count]
+    factor = np.stack([get_plan_data(event_graph, metric=metric)[key_factor] if metric is not None else np.ones(len(count)) for metric in metrics], axis=1)
+
+    path_count = np.zeros((event_graph.num_vertices(), len(metrics)))
+    path_count[int(start_node)] = 1.
+
+    # propagate path count downwards through the graph, from start event to module
+    execute_path_count_plan(plan=plan, count=count[:, None], factor=factor, path_count=path_count)
+    logger.debug(f'  Path count from <{event_graph.vp.event[start_node]}> to <{int((path_count[:, 0] > 0).sum())}> nodes.')
+
+    # concurrent queries may compute the same path count, and the first one is kept
+    with graph_cache_lock:
+        return path_count_cache.setdefault(path_count_key, path_count)
+
+
+def aggregate_operation_count(event_graph: gt.Graph, path_count: np.ndarray, reachable: frozenset, event_node: gt.Vertex, metrics: list, metric: str, legal_ops: list) -> OrderedDict:
+    """
+    Split the path count of a multi-operation module by the operation on the last edge of each path.
+    """
+    metric_index = metrics.index(metric)
+
+    legal_op_count_dict = OrderedDict()
+    for legal_op in legal_ops:
+        legal_op_count_dict[legal_op] = 0.
+
+    for e in event_node.in_edges():
+        # only count the parent event on the path (reachable from workload)
+        if int(e.source()) in reachable:
+            operation = event_graph.ep.operation[e].get(metric).lower()
+            assert operation in legal_ops, logger.error(f'Invalid operation <{operation}> for metric <{metric}> in module <{event_graph.vp.event[event_node]}>; legal values: {legal_ops}.')
+            delta_event_count = path_count[int(e.source()), metric_index] * event_graph.ep.count[e] * get_edge_factor(event_graph=event_graph, edge=e, metric=metric)
+            legal_op_count_dict[operation] += float(delta_event_count)
+            logger.debug(f'  Total event count (<{event_graph.vp.event[event_node]}> : <{operation}>) is increased by <{delta_event_count}>, based on event <{event_graph.vp.event[e.source()]}>.')
+
+    return legal_op_count_dict
+
+
+def get_edge_factor(event_graph: gt.Graph, edge: gt.Edge, metric: str=None) -> float:
+    if metric is not None and metric in event_graph.ep.factor[edge]:
+        return event_graph.ep.factor[edge][metric]
+    else:
+        return 1.
 
 
 def get_metric_value(event_graph: gt.Graph, edge: gt.Edge, metric: str) -> float:
     target_event_node = edge.target()
     edge_target_event = event_graph.vp.event[target_event_node]
-    event_metric = event_graph.vp.metric[target_event_node][metric]
 
     is_single_operation, legal_ops = check_single_operation(event_graph=event_graph, metric=metric, event_node=target_event_node)
     
     if is_single_operation:
         # event or single-operation module
-        return event_metric[key_value]
+        return event_graph.vp[get_metric_property_name(metric)][target_event_node]
     else:
-        # multi-operation module
-        # example event metric:
+        # multi-operation module, with one value per operation
+        # example module metric:
         # OrderedDict([('read', OrderedDict([('value', 0.474466), ('unit', 'nJ')])), ('write', OrderedDict([('value', 0.499877), ('unit', 'nJ')]))])
         operation = event_graph.ep.operation[edge].get(metric).lower()
         assert operation in legal_ops, logger.error(f'Invalid operation <{operation}> for metric <{metric}> in module <{edge_target_event}>; legal values: {legal_ops}.')
-        return event_metric[operation][key_value]
+        return event_graph.vp[get_metric_property_name(metric, operation)][target_event_node]
     
 
-def check_single_operation(event_graph: gt.Graph, metric: str, event_node: gt.Edge) -> bool:
+def check_single_operation(event_graph: gt.Graph, metric: str, event_node: gt.Vertex) -> bool:
+    # a multi-operation module has nan in the metric, and a value in each of its operations
     is_single_operation = False
     legal_ops = []
 
-    if (key_value not in event_graph.vp.metric[event_node][metric]) | (key_unit not in event_graph.vp.metric[event_node][metric]):
-        for key in event_graph.vp.metric[event_node][metric]:
-            legal_ops.append(key)
-    else:
-        assert len(event_graph.vp.metric[event_node][metric]) == 2, logger.error(f'Invalid metric <{metric}> for event <{event_graph.vp.event[event_node]}>; legal metric: {single_op_metric_format}.')
+    if np.isnan(event_graph.vp[get_metric_property_name(metric)][event_node]):
+        for operation in get_metric_table(event_graph)[metric][key_operation]:
+            if not np.isnan(event_graph.vp[get_metric_property_name(metric, operation)][event_node]):
+                legal_ops.append(operation)
 
     if len(legal_ops) == 0:
         is_single_operation = True
@@ -557,35 +1106,219 @@ def aggregate_tag_metric(event_graph: gt.Graph, metric_dict: str, metric: str, w
     if workload is none, the metric will be aggregated to the tag.
     if workload is not none, the metric will be aggregated to the workload.
     """
-    
-    assert tag is not None, logger.error(f'Missing tag in aggregation of metric <{metric}>.')
-    assert metric in metric_dict, logger.error(f'Invalid metric <{metric}>.')
-    assert key_aggregation in metric_dict[metric], logger.error(f'Missing aggregation in metric <{metric}>.')
-    assert metric_dict[metric][key_aggregation] != 'specified', logger.error(f'Invalid aggregation <{metric_dict[metric][key_aggregation]}> for tag <{tag}>; legal values: {legal_aggregation_tag}.')
+    tag_metrics = aggregate_tag_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=[metric], workload=workload, tag=tag)
+    return tag_metrics[metric]
+
+
+def aggregate_tag_metrics(event_graph: gt.Graph, metric_dict: str, metrics: list=None, workload: str=None, tag: str=None) -> OrderedDict:
+    """
+    Aggregate multiple metrics according to a tag, and return the metrics in an OrderedDict.
+    The contribution of each module with the tag is its value, times the path count from the workload to the module if workload is not none.
+    This is identical to summing the module columns of aggregate_breakdown_metric, without building the full table.
+    If metrics is none, all non-specified metrics in the metric dict will be aggregated.
+    """
+    if metrics is None:
+        metrics = [metric for metric in metric_dict if metric_dict[metric].get(key_aggregation) != 'specified']
+
+    assert tag is not None, logger.error(f'Missing tag in aggregation of metric <{metrics}>.')
+    for metric in metrics:
+        assert metric in metric_dict, logger.error(f'Invalid metric <{metric}>.')
+        assert key_aggregation in metric_dict[metric], logger.error(f'Missing aggregation in metric <{metric}>.')
+        assert metric_dict[metric][key_aggregation] != 'specified', logger.error(f'Invalid aggregation <{metric_dict[metric][key_aggregation]}> for tag <{tag}>; legal values: {legal_aggregation_tag}.')
 
     # find all modules with the tag
-    tag_nodes = []
-    for v in gt.find_vertex(event_graph, 'out', 0):
-        if tag in event_graph.vp.tag[v]:
-            tag_nodes.append(v)
+    tag_nodes = np.array([int(v) for v in get_tag_nodes(event_graph, tag)], dtype=int)
     assert len(tag_nodes) > 0, logger.error(f'Invalid tag <{tag}>.')
+    get_metric_table(event_graph)
+
+    if workload is not None:
+        workload_node = get_event_node(event_graph, workload)
+        assert workload_node is not None, logger.error(f'Invalid workload <{workload}>.')
+        reachable_mask = get_reachable_mask(event_graph, start_node=workload_node)
+        for v in tag_nodes:
+            assert reachable_mask[v], logger.error(f'Invalid event <{event_graph.vp.event[v]}> in workload <{workload}>.')
+
+    # the metric of a tag is the sum of the contribution of the modules with the tag, without a full breakdown
+    plan = get_event_plan(event_graph)
+    tag_metrics = OrderedDict()
+    for metric in metrics:
+        tag_metrics[metric] = OrderedDict({key_value: 0.0, key_unit: metric_dict[metric][key_unit]})
+        aggregation = metric_dict[metric][key_aggregation]
+        module_value = event_graph.vp[get_metric_property_name(metric)].a[tag_nodes].astype(float)
+
+        if aggregation == 'module':
+            # factor and workload have no impact on aggregation in the module mode
+            if workload is not None:
+                logger.warning(f'Ignore workload <{workload}> in aggregation <module>.')
+            module_value = module_value * event_graph.vp[key_instance].a[tag_nodes]
+        elif workload is not None:
+            # a module contributes its value times the path count from the workload
+            path_count = aggregate_path_count(event_graph=event_graph, start_node=workload_node, metrics=[metric])[:, 0]
+
+            # a multi-operation module contributes the value of the operation on each last edge
+            is_multi_operation = get_multi_operation_mask(event_graph, metric=metric)
+            edge_mask = np.isin(plan['edge_target'], tag_nodes) & reachable_mask[plan['edge_source']]
+            edge_value = get_edge_value(event_graph, metric=metric, edge_mask=edge_mask)
+            edge_contribution = np.where(np.isnan(edge_value), 0., edge_value) * path_count[plan['edge_source']] * get_plan_data(event_graph)[key_count] * get_plan_data(event_graph, metric=metric)[key_factor]
+            multi_operation_value = np.zeros(event_graph.num_vertices())
+            np.add.at(multi_operation_value, plan['edge_target'], edge_contribution)
+
+            module_value = np.where(is_multi_operation[tag_nodes], multi_operation_value[tag_nodes], module_value * path_count[tag_nodes])
+
+        for v, value in zip(tag_nodes, module_value):
+            module_name = event_graph.vp.event[v]
+            assert not np.isnan(value), logger.error(f'Invalid module <{module_name}> for aggregation <{aggregation}>; this aggregation does not support multi-operation module.')
+            tag_metrics[metric][key_value] += float(value)
+            logger.debug(f'  Total value (module <{module_name}>) = <{value}> <{tag_metrics[metric][key_unit]}>.')
+
+    for metric in metrics:
+        logger.debug(f'  Total value (tag <{tag}>) = <{tag_metrics[metric][key_value]}> <{tag_metrics[metric][key_unit]}>.')
 
-    tag_metric = OrderedDict({key_value: 0.0, key_unit: metric_dict[metric][key_unit]})
+        if workload is None:
+            logger.success(f'Aggregate metric <{metric}> for tag <{tag}>.')
+        else:
+            logger.success(f'Aggregate metric <{metric}> for tag <{tag}> in workload <{workload}>.')
 
-    # for each module with the tag, aggregate the metric
-    for tag_node in tag_nodes:
-        module_name = event_graph.vp.event[tag_node]
-        module_metric = aggregate_event_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=module_name)
-        assert tag_metric[key_unit] == module_metric[key_unit], logger.error(f'Inconsistent unit in metric <{metric}> for module <{module_name}> with tag <{tag}>.')
-        tag_metric[key_value] += module_metric[key_value]
-        logger.debug(f'  Total value (module <{module_name}>) = <{module_metric[key_value]}> <{module_metric[key_unit]}>.')
-    
-    logger.debug(f'  Total value (tag <{tag}>) = <{tag_metric[key_value]}> <{tag_metric[key_unit]}>.')
+    return tag_metrics
+
+
+def aggregate_breakdown_metric(event_graph: gt.Graph, metric_dict: str, metric: str, workload: str=None) -> pd.DataFrame:
+    """
+    Break down a metric into the contribution of every module to every event, and return a table with events as rows and modules as columns.
+    The table is built level by level with the event plan, from module to top event, so all breakdowns share a single pass over the edges.
+    If workload is none, each row is the contribution to a single occurrence of the event, and rows include all events and modules.
+    If workload is not none, each row is the contribution to the event in the workload, and rows only include events and modules in the workload.
+    The row sum of an event is the metric of this event from aggregate_event_metric, and the sum of module columns is the metric of a tag.
+    A multi-operation module has no value without workload, and is marked as nan in the summation mode.
+    The table is cached per graph, metric and workload until mark_event_dirty is called or counts change, and a copy is returned.
+    """
+    assert metric in metric_dict, logger.error(f'Invalid metric <{metric}>.')
+    assert key_aggregation in metric_dict[metric], logger.error(f'Missing aggregation in metric <{metric}>.')
+    aggregation = metric_dict[metric][key_aggregation]
+    assert aggregation in legal_aggregation_tag, logger.error(f'Invalid aggregation <{aggregation}> for breakdown of metric <{metric}>; legal values: {legal_aggregation_tag}.')
+    get_metric_table(event_graph)
+
+    check_event_count(event_graph)
+    breakdown_cache = get_graph_cache(event_graph, key_breakdown)
+    breakdown_key = (metric, aggregation, workload)
+    with graph_cache_lock:
+        if breakdown_key in breakdown_cache:
+            return breakdown_cache[breakdown_key].copy()
+
+    # all modules have out degree of 0, each module is a column
+    plan = get_event_plan(event_graph)
+    module_nodes = np.array([int(v) for v in get_module_nodes(event_graph)], dtype=np.int64)
+    module_column = np.full(event_graph.num_vertices(), -1, dtype=np.int64)
+    module_column[module_nodes] = np.arange(len(module_nodes))
+    module_names = [event_graph.vp.event[v] for v in module_nodes]
+
+    # contribution of modules to a single occurrence of each node
+    breakdown = np.zeros((event_graph.num_vertices(), len(module_nodes)))
+    module_value = event_graph.vp[get_metric_property_name(metric)].a[module_nodes]
+    if aggregation == 'module':
+        # factor has no impact on aggregation in the module mode
+        module_value = module_value * event_graph.vp[key_instance].a[module_nodes]
+    breakdown[module_nodes, np.arange(len(module_nodes))] = module_value
+
+    edge_source, edge_target, edge_level_ptr = plan['edge_source'], plan['edge_target'], plan['edge_level_ptr']
+    event_nodes = np.flatnonzero(plan['level'] > 0)
+    logger.info(f'Break down metric <{metric}> for <{len(event_nodes)}> events.')
+
+    if aggregation == 'module':
+        # modules reachable from each node, propagated upwards level by level, and each reachable module is counted once
+        reachable = np.zeros((event_graph.num_vertices(), len(module_nodes)), dtype=bool)
+        reachable[module_nodes, np.arange(len(module_nodes))] = True
+        for level in range(1, len(edge_level_ptr) - 1):
+            edge_index = np.arange(edge_level_ptr[level], edge_level_ptr[level + 1])
+            np.logical_or.at(reachable, edge_source[edge_index], reachable[edge_target[edge_index]])
+        breakdown[event_nodes] = np.where(reachable[event_nodes], module_value, 0.)
+    else:
+        # aggregate contribution upwards level by level, where a multi-operation module depends on the operation of the edge
+        edge_weight = get_plan_data(event_graph)[key_count] * get_plan_data(event_graph, metric=metric)[key_factor]
+        is_multi_operation = get_multi_operation_mask(event_graph, metric=metric)[edge_target]
+        edge_value = get_edge_value(event_graph, metric=metric, edge_mask=is_multi_operation)
+        for level in range(1, len(edge_level_ptr) - 1):
+            edge_index = np.arange(edge_level_ptr[level], edge_level_ptr[level + 1])
+            single_index = edge_index[~is_multi_operation[edge_index]]
+            np.add.at(breakdown, edge_source[single_index], edge_weight[single_index, None] * breakdown[edge_target[single_index]])
+            multi_index = edge_index[is_multi_operation[edge_index]]
+            np.add.at(breakdown, (edge_source[multi_index], module_column[edge_target[multi_index]]), edge_weight[multi_index] * edge_value[multi_index])
+
+    rows = np.arange(event_graph.num_vertices())
+
+    if workload is not None:
+        workload_node = get_event_node(event_graph, workload)
+        assert workload_node is not None, logger.error(f'Invalid workload <{workload}>.')
+        workload_reachable = get_reachable_mask(event_graph, start_node=workload_node)
+        rows = np.flatnonzero(workload_reachable)
+
+        if aggregation == 'module':
+            logger.warning(f'Ignore workload <{workload}> in aggregation <module>.')
+        else:
+            # scale each event by its count in the workload, and each module by its count on the last edge in the workload
+            path_count = aggregate_path_count(event_graph=event_graph, start_node=workload_node, metrics=[metric])
+            workload_breakdown = breakdown[int(workload_node)]
+            breakdown = breakdown * path_count
+            workload_module = module_nodes[workload_reachable[module_nodes]]
+            breakdown[workload_module, module_column[workload_module]] = workload_breakdown[module_column[workload_module]]
 
-    if workload is None:
-        logger.success(f'Aggregate metric <{metric}> for tag <{tag}>.')
+    breakdown_df = pd.DataFrame(breakdown[rows], index=[event_graph.vp.event[v] for v in rows], columns=module_names)
+
+    if workload is not None:
+        logger.success(f'Break down metric <{metric}> for workload <{workload}> with aggregation <{aggregation}>.')
     else:
-        logger.success(f'Aggregate metric <{metric}> for tag <{tag}> in workload <{workload}>.')
+        logger.success(f'Break down metric <{metric}> with aggregation <{aggregation}>.')
+
+    # concurrent queries may build the same table, and the first one is kept
+    with graph_cache_lock:
+        return breakdown_cache.setdefault(breakdown_key, breakdown_df).copy()
+
+
+class MetricQuery:
+    """
+    Query metrics of a loaded checkpoint, which can be shared by multiple threads.
+    Aggregation only reads the event graph, and cached values are recomputed while holding a lock per metric, so concurrent queries do not interfere.
+    Counts shall be changed with update_edge_count, and factors followed by mark_event_dirty, and not while queries are running.
+    The topological order of the graph is warmed up once when the query is created.
+
+    Example:
+        metric_query = MetricQuery.load(event_graph_path, metric_dict_path)
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(lambda event: metric_query.aggregate_event_metric('runtime', workload, event), events))
+    """
+    def __init__(self, event_graph: gt.Graph, metric_dict: OrderedDict) -> None:
+        # convert checkpoints with metrics in per-node dictionaries before sharing
+        get_metric_table(event_graph)
+        self.event_graph = event_graph
+        self.metric_dict = metric_dict
+
+        # the full topological order is shared by all start events
+        with graph_cache_lock:
+            topo_cache = get_graph_cache(event_graph, key_topological_sort)
+            if None not in topo_cache:
+                topo_cache[None] = gt.topological_sort(event_graph)
+
+    @classmethod
+    def load(cls, event_graph_path: str, metric_dict_path: str) -> 'MetricQuery':
+        return cls(event_graph=load_event_graph(event_graph_path), metric_dict=load_metric_dict(metric_dict_path))
+
+    def query_module_metric(self, metric: str, module: str=None, operation: str=None) -> OrderedDict:
+        return query_module_metric(event_graph=self.event_graph, metric_dict=self.metric_dict, metric=metric, module=module, operation=operation)
+
+    def aggregate_event_count(self, workload: str=None, event: str=None) -> float:
+        return aggregate_event_count(event_graph=self.event_graph, workload=workload, event=event)
+
+    def aggregate_event_metric(self, metric: str, workload: str=None, event: str=None) -> OrderedDict:
+        return aggregate_event_metric(event_graph=self.event_graph, metric_dict=self.metric_dict, metric=metric, workload=workload, event=event)
+
+    def aggregate_event_metrics(self, metrics: list=None, workload: str=None, event: str=None) -> OrderedDict:
+        return aggregate_event_metrics(event_graph=self.event_graph, metric_dict=self.metric_dict, metrics=metrics, workload=workload, event=event)
+
+    def aggregate_tag_metric(self, metric: str, workload: str=None, tag: str=None) -> OrderedDict:
+        return aggregate_tag_metric(event_graph=self.event_graph, metric_dict=self.metric_dict, metric=metric, workload=workload, tag=tag)
 
-    return tag_metric
+    def aggregate_tag_metrics(self, metrics: list=None, workload: str=None, tag: str=None) -> OrderedDict:
+        return aggregate_tag_metrics(event_graph=self.event_graph, metric_dict=self.metric_dict, metrics=metrics, workload=workload, tag=tag)
 
+    def aggregate_breakdown_metric(self, metric: str, workload: str=None) -> pd.DataFrame:
+        return aggregate_breakdown_metric(event_graph=self.event_graph, metric_dict=self.metric_dict, metric=metric, workload=workload)
@@ -1 +1 @@
-from .performance import simulate_performance_one_event, simulate_performance_all_events
+from .performance import simulate_performance_one_event, simulate_performance_all_events, simulate_performance_delta, simulate_performance_workloads, batch_performance, load_performance, reload_performance, memoize_performance, get_memo_dir, get_memo_stats
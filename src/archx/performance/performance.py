@@ -1,9 +1,16 @@
-import importlib, sys
+import sys, os, copy, hashlib, threading, json, types, sqlite3, functools
+import importlib.util
+import numpy as np
 import graph_tool.all as gt
 
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from loguru import logger
 
+from archx.event import get_event_node, mark_event_dirty, get_event_dependency
+from archx.event.event import key_event, key_dependency
+from archx.workload import stack_workload_dict
+from archx.metric import share_metric_table
 from archx.utils import get_path
 
 
@@ -15,15 +22,69 @@ key_unit = 'unit'
 key_subevent = 'subevent'
 key_count = 'count'
 key_factor = 'factor'
+key_performance = 'performance'
+key_record = 'record'
+key_metric = 'metric'
+key_batch_performance = 'batch_performance'
+
+# performance files loaded once per process, keyed by path, with the modification time of the file
+performance_registry = OrderedDict()
+performance_lock = threading.RLock()
+
+# architecture and workload of a worker process, set once by the pool initializer
+performance_worker_input = OrderedDict()
+
+# memoized results of performance models, keyed by the code of the model function, with the hash of the values of the keys the model read
+# the keys each model read are kept per model, so a call reads them and looks up its result once
+# results are cached across processes and run directories, unless the cache dir is set to off
+key_memo_env = 'ARCHX_PERFORMANCE_CACHE'
+default_memo_dir = os.path.join('~', '.cache', 'archx', 'performance')
+disabled_memo_dir = ['', 'off', 'none', '0']
+memo_file = 'performance.db'
+memo_path_registry = OrderedDict()
+memo_registry = OrderedDict()
+memo_connection_local = threading.local()
+performance_hash_registry = OrderedDict()
+memo_stats = OrderedDict({'hit': 0, 'miss': 0})
+memo_state = OrderedDict({'enabled': False})
+
+
+def load_performance(file_path: str, reload: bool=False):
+    """
+    Load a performance file once, and reuse it for all events in the file until the file is modified.
+    If reload is true, the file is executed again.
+    """
+    full_path = get_path(file_path)
+    performance_mtime = os.path.getmtime(full_path)
+
+    with performance_lock:
+        if reload or full_path not in performance_registry or performance_registry[full_path][0] != performance_mtime:
+            module_name = 'archx_performance_' + hashlib.sha256(full_path.encode()).hexdigest()[:16]
+            spec = importlib.util.spec_from_file_location(module_name, full_path)
+            module_py = importlib.util.module_from_spec(spec)
+            sys.modules[spec.name] = module_py
+            spec.loader.exec_module(module_py)
+            performance_registry[full_path] = (performance_mtime, module_py)
+            logger.info(f'Load performance model from <{full_path}>.')
+        return performance_registry[full_path][1]
+
+
+def reload_performance(file_path: str=None) -> None:
+    """
+    Drop loaded performance files, so the next simulation executes them again.
+    If file_path is none, all performance files are dropped.
+    """
+    with performance_lock:
+        path_list = list(performance_registry.keys()) if file_path is None else [get_path(file_path, check_exist=False)]
+        for full_path in path_list:
+            if performance_registry.pop(full_path, None) is not None:
+                sys.modules.pop('archx_performance_' + hashlib.sha256(full_path.encode()).hexdigest()[:16], None)
+                logger.info(f'Reload performance model <{full_path}>.')
 
 
 def import_function_from_path(file_path: str, function: str) -> callable:
     full_path = get_path(file_path)
-    
-    spec = importlib.util.spec_from_file_location(function, full_path)
-    module_py = importlib.util.module_from_spec(spec)
-    sys.modules[spec.name] = module_py
-    spec.loader.exec_module(module_py)
+    module_py = load_performance(full_path)
 
     # get the specified function dynamically
     if hasattr(module_py, function) and callable(getattr(module_py, function)):
@@ -34,21 +95,497 @@ def import_function_from_path(file_path: str, function: str) -> callable:
         exit()
     
 
-def simulate_performance_one_event(event_graph: gt.Graph, architecture_dict: OrderedDict, workload_dict: OrderedDict, event_name: str) -> gt.Graph:
-    # run performance model for a single event node
-    v = gt.find_vertex(event_graph, event_graph.vp.event, event_name)
-    assert len(v) > 0, logger.error(f'Invalid event <{event_name}>.')
+def evaluate_performance(performance_path: str, event_name: str, architecture_dict: OrderedDict, workload_dict: OrderedDict) -> OrderedDict:
+    """
+    Run the performance model of an event, which only reads the architecture and workload dictionaries.
+    """
+    performance_model = import_function_from_path(performance_path, function=event_name)
+    return performance_model(architecture_dict=architecture_dict, workload_dict=workload_dict)
+
+
+def init_performance_worker(architecture_dict: OrderedDict, workload_dict: OrderedDict, memoize: bool=False, track: bool=False) -> None:
+    performance_worker_input['architecture'] = architecture_dict
+    performance_worker_input['workload'] = workload_dict
+    performance_worker_input['memoize'] = memoize
+    performance_worker_input['track'] = track
+
+
+def evaluate_performance_worker(performance_path: str, event_name: str) -> tuple:
+    # return the performance dict, the records of the keys read and written if tracked, and the memo hits and misses of this call
+    # memo stats of a worker process are not visible to the parent, so they are returned with the result
+    previous_stats = get_memo_stats()
+    if performance_worker_input['memoize'] or performance_worker_input['track']:
+        performance_dict, record_list = evaluate_performance_dependency(performance_path, event_name, performance_worker_input['architecture'], performance_worker_input['workload'], memoize=performance_worker_input['memoize'])
+    else:
+        performance_dict, record_list = evaluate_performance(performance_path, event_name, performance_worker_input['architecture'], performance_worker_input['workload']), None
+    current_stats = get_memo_stats()
+    return performance_dict, record_list, OrderedDict({key: current_stats[key] - previous_stats[key] for key in current_stats})
+
+
+class TrackingDict(OrderedDict):
+    """
+    A view of a dictionary that records the keys read and written by a performance model.
+    Each record is a kind, the path of keys from the root, and the json value:
+    value for a leaf value or a whole dictionary, contains for a key lookup, keys for the number of keys, and write for a written value.
+    Reads under a path written by the same model are not recorded, since the model sets them itself.
+    Nested dictionaries are tracking views of the same records.
+    Iterating or copying a view reads the whole dictionary, since c code, e.g., json.dumps, reads the values without the view.
+    Unbound methods of dict, e.g., dict.items(d), bypass the view and are not recorded.
+    """
+    def __init__(self, raw_dict: OrderedDict, path: tuple, record_dict: OrderedDict):
+        super().__init__()
+        for key, value in raw_dict.items():
+            OrderedDict.__setitem__(self, key, value)
+        self._raw_dict = raw_dict
+        self._path = path
+        self._record_dict = record_dict
+        self._child_dict = {}
+
+    def _record(self, kind: str, path: tuple, value_json: str) -> None:
+        if kind == 'write':
+            self._record_dict[(kind, path)] = value_json
+        elif not any(('write', path[:i]) in self._record_dict for i in range(1, len(path) + 1)):
+            self._record_dict.setdefault((kind, path), value_json)
+
+    def _read(self, kind: str, path: tuple, value) -> None:
+        # only the first read of a path is dumped, later reads see the same value
+        if (kind, path) not in self._record_dict:
+            self._record(kind, path, dump_memo_value(value))
+
+    def _child(self, key):
+        value = self._raw_dict[key]
+        if isinstance(value, dict):
+            if key not in self._child_dict:
+                self._child_dict[key] = TrackingDict(value, self._path + (key,), self._record_dict)
+            return self._child_dict[key]
+        self._read('value', self._path + (key,), value)
+        return value
+
+    def __getitem__(self, key):
+        if key not in self._raw_dict:
+            self._read('contains', self._path + (key,), False)
+            raise KeyError(key)
+        return self._child(key)
+
+    def get(self, key, default=None):
+        if key not in self._raw_dict:
+            self._read('contains', self._path + (key,), False)
+            return default
+        return self._child(key)
+
+    def __contains__(self, key):
+        self._read('contains', self._path + (key,), key in self._raw_dict)
+        return key in self._raw_dict
+
+    def __iter__(self):
+        self._read('value', self._path, self._raw_dict)
+        return iter(list(self._raw_dict.keys()))
+
+    def __len__(self):
+        self._read('keys', self._path, list(self._raw_dict.keys()))
+        return len(self._raw_dict)
+
+    def keys(self):
+        return list(iter(self))
+
+    def values(self):
+        return [self._child(key) for key in iter(self)]
+
+    def items(self):
+        return [(key, self._child(key)) for key in iter(self)]
+
+    def __eq__(self, other):
+        self._read('value', self._path, self._raw_dict)
+        return self._raw_dict == other
+
+    __hash__ = None
+
+    def __copy__(self):
+        self._read('value', self._path, self._raw_dict)
+        return copy.copy(self._raw_dict)
+
+    def __deepcopy__(self, memo):
+        self._read('value', self._path, self._raw_dict)
+        return copy.deepcopy(self._raw_dict, memo)
+
+    def __reduce__(self):
+        # pickled views are plain copies of the dictionary
+        self._read('value', self._path, self._raw_dict)
+        return (type(self._raw_dict), (list(self._raw_dict.items()),))
+
+    def copy(self):
+        return self.__copy__()
+
+    def __setitem__(self, key, value):
+        # writes go to the dictionary, and are replayed when the result is reused
+        self._raw_dict[key] = value
+        OrderedDict.__setitem__(self, key, value)
+        self._child_dict.pop(key, None)
+        self._record('write', self._path + (key,), dump_memo_value(value))
+
+    def __delitem__(self, key):
+        raise TypeError(f'Invalid delete of <{key}> in a memoized performance model.')
+
+
+def dump_memo_value(value) -> str:
+    return json.dumps(value, sort_keys=True, default=lambda x: x.item() if hasattr(x, 'item') else str(x))
+
+
+def get_memo_scalar(value):
+    # numpy scalars in results are stored as python numbers
+    if hasattr(value, 'item') and hasattr(value, 'dtype') and value.ndim == 0:
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def read_memo_record(root_dict: OrderedDict, kind: str, path: list) -> str:
+    """
+    Read the json value of a record from the current dictionaries, or none if the path does not exist.
+    """
+    value = root_dict
+    for key in path[:-1] if kind == 'contains' else path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    if kind == 'contains':
+        return dump_memo_value(isinstance(value, dict) and path[-1] in value)
+    elif kind == 'keys':
+        return dump_memo_value(list(value.keys())) if isinstance(value, dict) else None
+    return dump_memo_value(value)
+
+
+def propagate_memo_record(kwargs: OrderedDict, record_list: list) -> None:
+    """
+    Replay the writes of a reused result, and pass all records to the caller, if the arguments are tracking views of a memoized caller.
+    """
+    for kind, path, record_value in record_list:
+        argument = kwargs[path[0]]
+        if kind == 'write':
+            # a tracking view of the caller records the write itself
+            value = argument
+            for key in path[1:-1]:
+                value = value[key]
+            value[path[-1]] = json.loads(record_value, object_pairs_hook=OrderedDict)
+        elif isinstance(argument, TrackingDict):
+            argument._record(kind, argument._path + tuple(path[1:]), record_value)
+
+
+def get_memo_dir() -> str:
+    """
+    Get the directory of the performance cache from the environment variable, or the default directory.
+    Return none if the cache is disabled.
+    """
+    memo_dir = os.environ.get(key_memo_env, default_memo_dir)
+    if memo_dir.strip().lower() in disabled_memo_dir:
+        return None
+    return os.path.abspath(os.path.expanduser(memo_dir))
+
+
+def connect_memo(memo_dir: str) -> sqlite3.Connection:
+    """
+    Get the connection of this thread to the performance cache, which is opened once per thread and cache dir, and shall not be closed.
+    A forked process opens its own connections, since a connection can not be shared across processes.
+    """
+    connection_dict = getattr(memo_connection_local, 'connection_dict', None)
+    if connection_dict is None or memo_connection_local.pid != os.getpid():
+        connection_dict = memo_connection_local.connection_dict = OrderedDict()
+        memo_connection_local.pid = os.getpid()
+
+    # a removed cache file, e.g., a cleared cache, is created again
+    memo_path = os.path.join(memo_dir, memo_file)
+    if memo_dir not in connection_dict or not os.path.exists(memo_path):
+        if memo_dir in connection_dict:
+            connection_dict[memo_dir].close()
+        os.makedirs(memo_dir, exist_ok=True)
+        connection = sqlite3.connect(memo_path, timeout=60)
+        # write-ahead logging allows concurrent runs to read and write the cache
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS memo_path (key TEXT NOT NULL, path_hash TEXT NOT NULL, path TEXT NOT NULL, PRIMARY KEY (key, path_hash))')
+        connection.execute('CREATE TABLE IF NOT EXISTS memo_value (key TEXT NOT NULL, read_hash TEXT NOT NULL, record TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (key, read_hash))')
+        connection_dict[memo_dir] = connection
+    return connection_dict[memo_dir]
+
+
+def hash_memo_read(path_list: list, value_list: list) -> str:
+    # hash of the keys a function read and their json values
+    return hashlib.sha256(json.dumps([path_list, value_list]).encode()).hexdigest()
+
+
+def hash_function_code(function: callable) -> str:
+    """
+    Hash the code of a function, without its name and line numbers, so functions with the same code share memoized results.
+    """
+    def dump_code(code: types.CodeType) -> list:
+        const_list = [dump_code(const) if isinstance(const, types.CodeType) else repr(const) for const in code.co_consts]
+        return [code.co_code.hex(), const_list, list(code.co_names), list(code.co_varnames), list(code.co_freevars)]
+    return hashlib.sha256(json.dumps([dump_code(function.__code__), repr(function.__defaults__), repr(function.__kwdefaults__)]).encode()).hexdigest()
+
+
+def hash_module_source(module_py: types.ModuleType) -> str:
+    """
+    Hash the source file of a module and the source files it uses, e.g., imported mapping functions in the zoo.
+    Files of the python installation are excluded.
+    """
+    install_dir_list = [os.path.realpath(d) + os.sep for d in set([sys.prefix, sys.base_prefix, sys.exec_prefix])]
+    source_list = [os.path.realpath(module_py.__file__)]
+    module_list = [module_py]
+    while len(module_list) > 0:
+        module_value_list = []
+        for value in list(vars(module_list.pop()).values()):
+            module_value = value if isinstance(value, types.ModuleType) else sys.modules.get(getattr(value, '__module__', None) or '')
+            source_file = getattr(module_value, '__file__', None)
+            if source_file is None or not source_file.endswith('.py'):
+                continue
+            source_file = os.path.realpath(source_file)
+            if source_file not in source_list and not any(source_file.startswith(d) for d in install_dir_list):
+                source_list.append(source_file)
+                module_list.append(module_value)
+
+    source_hash = hashlib.sha256()
+    for source_file in sorted(source_list):
+        with open(source_file, 'rb') as f:
+            source_hash.update(hashlib.sha256(f.read()).digest())
+    return source_hash.hexdigest()
+
+
+def hash_performance(file_path: str) -> str:
+    """
+    Hash the source of a performance file and the source files it uses.
+    The hash is computed once per process, until the file is modified.
+    """
+    full_path = get_path(file_path)
+    performance_mtime = os.path.getmtime(full_path)
+
+    with performance_lock:
+        if full_path not in performance_hash_registry or performance_hash_registry[full_path][0] != performance_mtime:
+            performance_hash_registry[full_path] = (performance_mtime, hash_module_source(load_performance(full_path)))
+        return performance_hash_registry[full_path][1]
+
+
+def call_memo(memo_key: str, name: str, function: callable, kwargs: OrderedDict) -> tuple:
+    """
+    Call a function with dictionary arguments, and reuse its result if all keys it read before have the same values.
+    Return the result and the records of the keys it read and wrote.
+    The keys read by the function are recorded with tracking views of the dictionary arguments.
+    Each list of keys the function read before is read again, and the hash of their values looks up the result.
+    Results are reused within a run, and across runs via the performance cache.
+    """
+    root_dict = OrderedDict()
+    for key, value in kwargs.items():
+        root_dict[key] = value._raw_dict if isinstance(value, TrackingDict) else value
+
+    # lists of keys the same function read, from this process and the performance cache
+    memo_dir = get_memo_dir()
+    with performance_lock:
+        path_dict = OrderedDict(memo_path_registry.get(memo_key, {}))
+    if memo_dir is not None:
+        for path_hash, path in connect_memo(memo_dir).execute('SELECT path_hash, path FROM memo_path WHERE key = ?', (memo_key,)):
+            path_dict.setdefault(path_hash, json.loads(path))
+
+    for path_list in path_dict.values():
+        read_hash = hash_memo_read(path_list, [read_memo_record(root_dict, kind, path) for kind, path in path_list])
+        with performance_lock:
+            memo = memo_registry.get((memo_key, read_hash))
+        if memo is None and memo_dir is not None:
+            row = connect_memo(memo_dir).execute('SELECT record, value FROM memo_value WHERE key = ? AND read_hash = ?', (memo_key, read_hash)).fetchone()
+            memo = None if row is None else (json.loads(row[0]), row[1])
+        if memo is not None:
+            record_list, value = memo
+            with performance_lock:
+                memo_stats['hit'] += 1
+            propagate_memo_record(kwargs, record_list)
+            logger.info(f'Reuse memoized performance of <{name}>.')
+            return json.loads(value, object_pairs_hook=OrderedDict), record_list
+
+    result, record_list = call_tracking(function, kwargs)
+    try:
+        value = json.dumps(result, default=get_memo_scalar)
+    except TypeError:
+        # results that do not round trip through json are not memoized
+        logger.warning(f'Skip memoized performance of <{name}>; the result is not json serializable.')
+        return result, record_list
+
+    # the values read are recorded before the function wrote its arguments
+    path_list = [[kind, path] for kind, path, record_value in record_list if kind != 'write']
+    path_json = json.dumps(path_list)
+    path_hash = hashlib.sha256(path_json.encode()).hexdigest()
+    read_hash = hash_memo_read(path_list, [record_value for kind, path, record_value in record_list if kind != 'write'])
+    with performance_lock:
+        memo_stats['miss'] += 1
+        memo_path_registry.setdefault(memo_key, OrderedDict())[path_hash] = path_list
+        memo_registry[(memo_key, read_hash)] = (record_list, value)
+    if memo_dir is not None:
+        connection = connect_memo(memo_dir)
+        with connection:
+            connection.execute('INSERT OR IGNORE INTO memo_path (key, path_hash, path) VALUES (?, ?, ?)', (memo_key, path_hash, path_json))
+            connection.execute('INSERT OR IGNORE INTO memo_value (key, read_hash, record, value) VALUES (?, ?, ?, ?)', (memo_key, read_hash, json.dumps(record_list), value))
+    return json.loads(value, object_pairs_hook=OrderedDict), record_list
+
+
+def call_tracking(function: callable, kwargs: OrderedDict) -> tuple:
+    """
+    Call a function with tracking views of its dictionary arguments, and return the result and the records of the keys it read and wrote.
+    Arguments other than dictionaries are read as a whole.
+    """
+    record_dict = OrderedDict()
+    tracking_kwargs = OrderedDict()
+    for key, value in kwargs.items():
+        value = value._raw_dict if isinstance(value, TrackingDict) else value
+        if isinstance(value, dict):
+            tracking_kwargs[key] = TrackingDict(value, (key,), record_dict)
+        else:
+            tracking_kwargs[key] = value
+            record_dict[('value', (key,))] = dump_memo_value(value)
+    result = function(**tracking_kwargs)
+
+    # records are passed to the caller, if the arguments are tracking views of a memoized caller
+    record_list = [[kind, list(path), record_value] for (kind, path), record_value in record_dict.items()]
+    for kind, path, record_value in record_list:
+        if isinstance(kwargs[path[0]], TrackingDict):
+            kwargs[path[0]]._record(kind, kwargs[path[0]]._path + tuple(path[1:]), record_value)
+    return result, record_list
+
+
+def check_memo_record(root_dict: OrderedDict, record_list: list) -> bool:
+    # true if all keys read before have the same values
+    return all(read_memo_record(root_dict, kind, path) == record_value for kind, path, record_value in record_list if kind != 'write')
+
+
+def evaluate_performance_dependency(performance_path: str, event_name: str, architecture_dict: OrderedDict, workload_dict: OrderedDict, memoize: bool=False) -> tuple:
+    """
+    Run the performance model of an event, and return the result and the records of the architecture and workload keys it read and wrote.
+    If memoize is true, the result is reused if all keys it read before have the same values.
+    """
+    performance_model = import_function_from_path(performance_path, function=event_name)
+    kwargs = OrderedDict({'architecture_dict': architecture_dict, 'workload_dict': workload_dict})
+    if not memoize:
+        return call_tracking(performance_model, kwargs)
+
+    # events with the same model code, e.g., projections of a layer, share results
+    memo_key = hashlib.sha256(json.dumps([hash_performance(performance_path), hash_function_code(performance_model)]).encode()).hexdigest()
+    previous_enabled = memo_state['enabled']
+    memo_state['enabled'] = True
+    try:
+        return call_memo(memo_key, event_name, performance_model, kwargs)
+    finally:
+        memo_state['enabled'] = previous_enabled
+
+
+def evaluate_performance_memo(performance_path: str, event_name: str, architecture_dict: OrderedDict, workload_dict: OrderedDict) -> OrderedDict:
+    """
+    Run the performance model of an event, and reuse its result if all keys it read before have the same values.
+    Functions decorated with memoize_performance are memoized as well.
+    """
+    return evaluate_performance_dependency(performance_path, event_name, architecture_dict, workload_dict, memoize=True)[0]
+
+
+def memoize_performance(function: callable) -> callable:
+    """
+    Decorator of helper functions of performance models, e.g., mapping in the zoo, that are shared by many events.
+    When performance models are memoized, the result is reused for the same values of the arguments and keys read.
+    All arguments shall be passed as keyword arguments to be memoized.
+    """
+    @functools.wraps(function)
+    def memoized_function(*args, **kwargs):
+        if not memo_state['enabled'] or len(args) > 0:
+            return function(*args, **kwargs)
+        module_py = sys.modules[function.__module__]
+        with performance_lock:
+            if function.__module__ not in performance_hash_registry:
+                performance_hash_registry[function.__module__] = (None, hash_module_source(module_py))
+            source_hash = performance_hash_registry[function.__module__][1]
+        memo_key = hashlib.sha256(json.dumps([source_hash, hash_function_code(function)]).encode()).hexdigest()
+        return call_memo(memo_key, function.__qualname__, function, OrderedDict(kwargs))[0]
+    return memoized_function
+
+
+def batch_performance(function: callable) -> callable:
+    """
+    Decorator of performance models written with numpy operations, which run once for a batch of workloads.
+    Values of the workload dict that differ across the batch are numpy arrays with one element per workload.
+    Counts and metric values in the returned performance dict are either numpy arrays with one element per workload, or scalars shared by all workloads.
+    """
+    setattr(function, key_batch_performance, True)
+    return function
+
+
+def split_performance_dict(performance_dict: OrderedDict, batch_size: int) -> list:
+    """
+    Split the performance dict of a batched performance model to one performance dict per workload.
+    """
+    return [get_batch_value(performance_dict, index, batch_size) for index in range(batch_size)]
+
+
+def get_batch_value(value, index: int, batch_size: int):
+    # value of one workload in a batch, where numpy arrays have one element per workload
+    if isinstance(value, dict):
+        return OrderedDict((key, get_batch_value(sub_value, index, batch_size)) for key, sub_value in value.items())
+    if isinstance(value, np.ndarray) and value.ndim > 0:
+        assert value.shape[0] == batch_size, logger.error(f'Invalid batched value of shape <{value.shape}> for <{batch_size}> workloads.')
+        return value[index].item() if value.ndim == 1 else value[index]
+    return value
+
+
+def evaluate_performance_batch(performance_path: str, event_name: str, architecture_dict: OrderedDict, workload_dict_list: list, batch_workload_dict: OrderedDict=None) -> list:
+    """
+    Run the performance model of an event for a batch of workloads, and return one performance dict per workload.
+    A model decorated with batch_performance runs once with the stacked workload dict.
+    Other models run once per group of workloads with the same values of the keys the model read.
+    """
+    performance_model = import_function_from_path(performance_path, function=event_name)
+    if getattr(performance_model, key_batch_performance, False):
+        if batch_workload_dict is None:
+            batch_workload_dict = stack_workload_dict(workload_dict_list)
+        performance_dict = performance_model(architecture_dict=architecture_dict, workload_dict=batch_workload_dict)
+        return split_performance_dict(performance_dict, len(workload_dict_list))
+
+    performance_dict_list = []
+    result_list = []
+    for workload_dict in workload_dict_list:
+        root_dict = OrderedDict({'architecture_dict': architecture_dict, 'workload_dict': workload_dict})
+        for performance_dict, record_list in result_list:
+            if check_memo_record(root_dict, record_list):
+                propagate_memo_record(root_dict, record_list)
+                break
+        else:
+            performance_dict, record_list = call_tracking(performance_model, root_dict)
+            result_list.append((performance_dict, record_list))
+        performance_dict_list.append(performance_dict)
+    logger.info(f'Evaluate event <{event_name}> <{len(result_list)}> times for <{len(workload_dict_list)}> workloads.')
+    return performance_dict_list
+
+
+def get_memo_stats() -> OrderedDict:
+    # hit and miss count of memoized performance models in this process, including the process pool of simulate_performance_events
+    with performance_lock:
+        return OrderedDict(memo_stats)
+
+
+def simulate_performance_one_event(event_graph: gt.Graph, architecture_dict: OrderedDict, workload_dict: OrderedDict, event_name: str, performance_dict: OrderedDict=None, memoize: bool=False, record_list: list=None) -> gt.Graph:
+    # run performance model for a single event node, unless the performance dict is already evaluated
+    # if memoize is true, the result of the model is reused when the keys it read are unchanged
+    # the keys read and written by the model are recorded as dependencies of the event, if known
+    v = get_event_node(event_graph, event_name)
+    assert v is not None, logger.error(f'Invalid event <{event_name}>.')
 
-    v = v[0]
     performance_path = event_graph.vp.performance[v]
     if performance_path is None or performance_path == 'None':
         assert v.out_degree() == 0, logger.error(f'Missing performance model for event <{event_name}>.')
         logger.info(f'Module <{event_name}> has no performance model.')
     else:
         # if the current node is not a leaf node, update edges with performance model
-        performance_model = import_function_from_path(performance_path, function=event_name)
-        performance_dict = performance_model(architecture_dict=architecture_dict, workload_dict=workload_dict)
+        if performance_dict is None:
+            if memoize:
+                performance_dict, record_list = evaluate_performance_dependency(performance_path, event_name, architecture_dict, workload_dict, memoize=True)
+            else:
+                performance_dict = evaluate_performance(performance_path, event_name, architecture_dict, workload_dict)
         assert performance_dict is not None, logger.error(f'No performance model returned for event <{event_name}>')
+
+        # untracked graphs keep no dependencies, and a stale dependency of a tracked graph is dropped
+        if record_list is not None:
+            get_event_dependency(event_graph)[key_event][event_name] = OrderedDict({key_performance: hash_performance(performance_path), key_record: record_list})
+        elif key_dependency in event_graph.gp:
+            get_event_dependency(event_graph)[key_event].pop(event_name, None)
         # process additional metrics in specified mode
         if len(list(performance_dict.keys())) > 1:
             metric_key_list = list(performance_dict.keys())
@@ -83,26 +620,134 @@ def simulate_performance_one_event(event_graph: gt.Graph, architecture_dict: Ord
             if key_operation in performance_dict[key_subevent][edge_target]:
                 assert e.target().out_degree() == 0, logger.error(f'  Invalid operation between event <{event_name}> and event <{event_graph.vp.event[e.target()]}>; operation should be between event and module.')
                 event_graph.ep.operation[e] = performance_dict[key_subevent][edge_target][key_operation]
+            else:
+                event_graph.ep.operation[e] = OrderedDict({})
             
             # default factor is an empty dict, which is used to scale queried results
             if key_factor in performance_dict[key_subevent][edge_target]:
                 event_graph.ep.factor[e] = performance_dict[key_subevent][edge_target][key_factor]
                 assert isinstance(event_graph.ep.factor[e], dict), logger.error(f'  Invalid factor <{event_graph.ep.factor[e]}> between event <{event_name}> and module <{event_graph.vp.event[e.target()]}>; factor should be a dict.')
+            else:
+                event_graph.ep.factor[e] = OrderedDict({})
 
             logger.debug(f'  Event <{edge_source}> has <{event_graph.ep.count[e]}> subevent <{edge_target}> with specified aggregation <{event_graph.ep.aggregation[e]}>.')
 
+        # cached aggregation of this event and its ancestors is outdated
+        mark_event_dirty(event_graph, v)
+
         logger.success(f'Simulate event <{event_name}> at <{performance_path}>.')
 
     return event_graph
 
 
-def simulate_performance_all_events(event_graph: gt.Graph, architecture_dict: OrderedDict, workload_dict: OrderedDict) -> gt.Graph:
+def simulate_performance_all_events(event_graph: gt.Graph, architecture_dict: OrderedDict, workload_dict: OrderedDict, max_workers: int=1, memoize: bool=False, track: bool=False) -> gt.Graph:
+    """
+    Simulate all events, with performance models evaluated in a process pool of max_workers if max_workers is not 1.
+    Performance models are independent of each other, and their results are applied to the graph in the order of nodes.
+    If memoize is true, results of performance models are reused when the keys they read are unchanged.
+    If track is true, the keys read and written by each model are recorded in the graph for delta simulation.
+    """
+    event_name_list = [event_graph.vp.event[v] for v in event_graph.vertices()]
+    event_graph = simulate_performance_events(event_graph, architecture_dict, workload_dict, event_name_list, max_workers=max_workers, memoize=memoize, track=track)
+
+    logger.success(f'Simulate all events.')
+    
+    return event_graph
+
+
+def simulate_performance_delta(event_graph: gt.Graph, architecture_dict: OrderedDict, workload_dict: OrderedDict, max_workers: int=1, memoize: bool=False) -> gt.Graph:
+    """
+    Simulate only the events whose performance model, or the architecture and workload keys the model read, changed since the dependencies recorded in the event graph, e.g., a loaded base checkpoint.
+    Other events keep their edges, and the keys their models wrote are written again before the changed events are simulated.
+    Dependencies of the simulated events are recorded, so the graph can be the base of the next delta.
+    """
+    event_dependency = get_event_dependency(event_graph)[key_event]
+    root_dict = OrderedDict({'architecture_dict': architecture_dict, 'workload_dict': workload_dict})
+
+    event_name_list = []
+    event_count = 0
+    for v in event_graph.vertices():
+        performance_path = event_graph.vp.performance[v]
+        if performance_path is None or performance_path == 'None':
+            continue
+        event_count += 1
+        event_name = event_graph.vp.event[v]
+        dependency = event_dependency.get(event_name)
+        if dependency is None or dependency[key_performance] != hash_performance(performance_path) or not check_memo_record(root_dict, dependency[key_record]):
+            event_name_list.append(event_name)
+        else:
+            propagate_memo_record(root_dict, dependency[key_record])
+
+    event_graph = simulate_performance_events(event_graph, architecture_dict, workload_dict, event_name_list, max_workers=max_workers, memoize=memoize, track=True)
+
+    logger.success(f'Simulate <{len(event_name_list)}> of <{event_count}> events, which changed since the recorded dependencies.')
+
+    return event_graph
+
+
+def simulate_performance_events(event_graph: gt.Graph, architecture_dict: OrderedDict, workload_dict: OrderedDict, event_name_list: list, max_workers: int=1, memoize: bool=False, track: bool=False) -> gt.Graph:
+    """
+    Simulate the events in the list, in the order of nodes, with performance models evaluated in a process pool of max_workers if max_workers is not 1.
+    """
+    event_name_set = set(event_name_list)
+    result_map = OrderedDict()
+    if max_workers != 1:
+        event_list = []
+        for v in event_graph.vertices():
+            performance_path = event_graph.vp.performance[v]
+            if event_graph.vp.event[v] in event_name_set and performance_path is not None and performance_path != 'None':
+                event_list.append((event_graph.vp.event[v], performance_path))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_performance_worker, initargs=(architecture_dict, workload_dict, memoize, track)) as executor:
+            futures = [(event_name, executor.submit(evaluate_performance_worker, performance_path, event_name)) for event_name, performance_path in event_list]
+            for event_name, future in futures:
+                performance_dict, record_list, worker_stats = future.result()
+                result_map[event_name] = (performance_dict, record_list)
+                with performance_lock:
+                    for key in worker_stats:
+                        memo_stats[key] += worker_stats[key]
+        logger.info(f'Evaluate <{len(event_list)}> performance models in a process pool.')
+
     # Iterate over all event nodes
     for v in event_graph.vertices():
         event_name = event_graph.vp.event[v]
-        event_graph = simulate_performance_one_event(event_graph, architecture_dict, workload_dict, event_name)
-    
-    logger.success(f'Simulate all events.')
-    
+        if event_name not in event_name_set:
+            continue
+        performance_path = event_graph.vp.performance[v]
+        if event_name not in result_map and track and performance_path is not None and performance_path != 'None':
+            result_map[event_name] = evaluate_performance_dependency(performance_path, event_name, architecture_dict, workload_dict, memoize=memoize)
+        performance_dict, record_list = result_map.get(event_name, (None, None))
+        event_graph = simulate_performance_one_event(event_graph, architecture_dict, workload_dict, event_name, performance_dict=performance_dict, memoize=memoize, record_list=record_list)
+
     return event_graph
 
+
+def simulate_performance_workloads(event_graph: gt.Graph, architecture_dict: OrderedDict, workload_dict_list: list) -> list:
+    """
+    Evaluate the performance models of all events once for a batch of workloads, e.g., a workload sweep, see evaluate_performance_batch.
+    Return one copy of the event graph per workload, with the results of the workload written to its edges.
+    Only model evaluation is batched; writing the edges of each copy costs the same as simulate_performance_all_events.
+    The copies have identical structure, and are aggregated at once with aggregate_batch_metrics.
+    The copies share one metric table until a copy updates its module metrics, and record no dependencies.
+    """
+    batch_workload_dict = stack_workload_dict(workload_dict_list)
+    event_graph_list = [event_graph.copy() for _ in workload_dict_list]
+    # graph properties of copies share the same python object as the event graph
+    if key_metric in event_graph.gp:
+        share_metric_table(event_graph, event_graph_list)
+    for batch_graph in event_graph_list:
+        if key_dependency in batch_graph.gp:
+            del batch_graph.gp[key_dependency]
+
+    for v in event_graph.vertices():
+        event_name = event_graph.vp.event[v]
+        performance_path = event_graph.vp.performance[v]
+        if performance_path is None or performance_path == 'None':
+            performance_dict_list = [None] * len(workload_dict_list)
+        else:
+            performance_dict_list = evaluate_performance_batch(performance_path, event_name, architecture_dict, workload_dict_list, batch_workload_dict)
+        for batch_graph, workload_dict, performance_dict in zip(event_graph_list, workload_dict_list, performance_dict_list):
+            simulate_performance_one_event(batch_graph, architecture_dict, workload_dict, event_name, performance_dict=performance_dict)
+
+    logger.success(f'Simulate all events for <{len(workload_dict_list)}> workloads.')
+
+    return event_graph_list
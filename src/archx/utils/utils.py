@@ -1,4 +1,4 @@
-import os, sys, yaml, json
+import os, sys, yaml, json, csv, threading
 import numpy as np
 
 from collections import OrderedDict
@@ -217,6 +217,220 @@ def interpolate_oneD_quadratic(desired_x, known):
     return desired_energy
 
 
+# csv tables read once per process, keyed by file path, with the modification time of the file
+csv_table_registry = OrderedDict()
+# both csv registries are shared by the threads of batch interface queries
+csv_lock = threading.RLock()
+
+
+def read_csv_table(csv_file: str, key: str, text_columns: list=None) -> OrderedDict:
+    """
+    utility function that reads a csv file once per process into a table indexed by the key column, with a list of rows per key
+    :param csv_file: path of the csv file
+    :param key: column to index rows, kept as string
+    :param text_columns: columns kept as string, other columns are converted to float
+    :return table of rows, which is read again if the file is modified, and shall not be modified
+    """
+    csv_file = get_path(csv_file)
+    text_columns = [] if text_columns is None else text_columns
+    with csv_lock:
+        csv_mtime = os.path.getmtime(csv_file)
+        if csv_file in csv_table_registry and csv_table_registry[csv_file][0] == csv_mtime:
+            return csv_table_registry[csv_file][1]
+
+        csv_table = OrderedDict()
+        with open(csv_file) as f:
+            for row in csv.DictReader(f):
+                table_row = OrderedDict()
+                for column, value in row.items():
+                    if column == key or column in text_columns:
+                        table_row[column] = value
+                    else:
+                        try:
+                            table_row[column] = float(value)
+                        except (TypeError, ValueError):
+                            table_row[column] = value
+                csv_table.setdefault(row[key], []).append(table_row)
+
+        csv_table_registry[csv_file] = (csv_mtime, csv_table)
+        return csv_table
+
+
+# grids of csv tables built once per process, keyed by file path and key value, with the modification time of the file
+csv_grid_registry = OrderedDict()
+
+
+def read_csv_grid(csv_file: str, key: str, key_value: str, axis_columns: list, value_columns: list, constant_columns: list=None, text_columns: list=None) -> OrderedDict:
+    """
+    utility function that builds a rectilinear grid from the rows of a key value in a csv table, for N-D interpolation
+    :param csv_file: path of the csv file
+    :param key: column to index rows, kept as string
+    :param key_value: value of the key column of the rows in the grid
+    :param axis_columns: columns of the grid axes, each row is one grid point, and all grid points shall exist
+    :param value_columns: columns of the values at grid points
+    :param constant_columns: columns that shall be the same in all rows
+    :param text_columns: columns kept as string, same as read_csv_table
+    :return grid with sorted axes, values of shape (axis sizes..., values) and constants, which is built again if the file is modified
+    """
+    csv_file = get_path(csv_file)
+    constant_columns = [] if constant_columns is None else constant_columns
+    with csv_lock:
+        csv_mtime = os.path.getmtime(csv_file)
+        grid_key = (csv_file, str(key_value), tuple(axis_columns), tuple(value_columns))
+        if grid_key in csv_grid_registry and csv_grid_registry[grid_key][0] == csv_mtime:
+            return csv_grid_registry[grid_key][1]
+
+        row_list = read_csv_table(csv_file, key, text_columns).get(str(key_value), [])
+        assert len(row_list) > 0, logger.error(f'Invalid <{key}> <{key_value}> in <{csv_file}>.')
+
+        constant = OrderedDict()
+        for column in constant_columns:
+            column_set = set(row[column] for row in row_list)
+            assert len(column_set) == 1, logger.error(f'Invalid <{column}> in <{csv_file}>; all rows of <{key}> <{key_value}> shall have the same value, but get <{column_set}>.')
+            constant[column] = row_list[0][column]
+
+        axis_list = [np.unique(np.array([row[column] for row in row_list], dtype=float)) for column in axis_columns]
+        value = np.full([len(axis) for axis in axis_list] + [len(value_columns)], np.nan)
+        for row in row_list:
+            index = tuple(int(np.searchsorted(axis, row[column])) for axis, column in zip(axis_list, axis_columns))
+            assert np.all(np.isnan(value[index])), logger.error(f'Invalid grid in <{csv_file}>; repeated point <{dict((column, row[column]) for column in axis_columns)}>.')
+            value[index] = [row[column] for column in value_columns]
+        assert not np.any(np.isnan(value)), logger.error(f'Invalid grid in <{csv_file}>; rows of <{key}> <{key_value}> shall cover all combinations of <{axis_columns}>.')
+
+        grid = OrderedDict({'axis': OrderedDict(zip(axis_columns, axis_list)), 'value': value, 'constant': constant})
+        csv_grid_registry[grid_key] = (csv_mtime, grid)
+        return grid
+
+
+def interpolate_grid(grid: OrderedDict, desired_x: np.ndarray, log: bool=False) -> np.ndarray:
+    """
+    utility function that performs N-D piecewise linear interpolation on a rectilinear grid, with linear extrapolation outside the grid
+    each axis is searched in O(log n), and axes with a single value scale the values linearly from the origin
+    :param grid: grid from read_csv_grid
+    :param desired_x: array of shape (queries, axes) with the desired attributes
+    :param log: interpolate log values over log axes, i.e., log-log interpolation
+    :return values of shape (queries, values)
+    """
+    desired_x = np.atleast_2d(np.asarray(desired_x, dtype=float))
+    axis_list = list(grid['axis'].values())
+    value = grid['value'].reshape([len(axis) for axis in axis_list if len(axis) > 1] + [grid['value'].shape[-1]])
+    if log:
+        assert np.all(value > 0) and np.all(desired_x > 0), logger.error(f'Invalid log-log interpolation with non-positive values.')
+        value = np.log(value)
+
+    # the cell and the position in the cell of each query along each axis with many values
+    index_list = []
+    weight_list = []
+    for axis_idx, axis in enumerate(axis_list):
+        if len(axis) == 1:
+            continue
+        axis_x = np.log(axis) if log else axis
+        query_x = np.log(desired_x[:, axis_idx]) if log else desired_x[:, axis_idx]
+        index = np.clip(np.searchsorted(axis_x, query_x, side='right') - 1, 0, len(axis) - 2)
+        index_list.append(index)
+        weight_list.append((query_x - axis_x[index]) / (axis_x[index + 1] - axis_x[index]))
+
+    # blend the values at the corners of the cell
+    result = np.zeros((desired_x.shape[0], value.shape[-1]))
+    for corner in np.ndindex(*([2] * len(index_list))):
+        corner_weight = np.ones(desired_x.shape[0])
+        for offset, weight in zip(corner, weight_list):
+            corner_weight = corner_weight * (weight if offset else 1 - weight)
+        corner_index = tuple(index + offset for index, offset in zip(index_list, corner))
+        result += corner_weight[:, None] * value[corner_index]
+    if log:
+        result = np.exp(result)
+
+    for axis_idx, axis in enumerate(axis_list):
+        if len(axis) == 1:
+            result = result * (desired_x[:, axis_idx] / axis[0])[:, None]
+    return result
+
+
+# columns of csv tables of interfaces that are not attributes, in addition to the value columns
+csv_skip_columns = ['technology', 'frequency', 'interpolation']
+csv_interpolation_list = ['linear', 'quadratic']
+# interpolation of tables with many rows per technology
+csv_grid_interpolation_list = ['linear', 'loglog']
+csv_query_columns = ['class', 'technology', 'frequency']
+
+
+def query_csv_batch(csv_file: str, query_technology, query_frequency: np.ndarray, query_list: list, value_columns: list, value_scale: list) -> np.ndarray:
+    """
+    utility function that evaluates the rows of a technology in a csv table of an interface for many queries at once, e.g., csv_cmos and csv_sc
+    :param csv_file: path of the csv file
+    :param query_technology: technology of all queries
+    :param query_frequency: array of the frequency of each query
+    :param query_list: list of queries, where missing attributes default to 1
+    :param value_columns: columns of dynamic power, leakage power and area, where dynamic power scales with frequency
+    :param value_scale: divisor of each value column, e.g., 1000 for power in uW to mW
+    :return values of shape (queries, value columns), which are the same as interpolating each query by itself
+    """
+    csv_table = read_csv_table(csv_file, key='technology', text_columns=['interpolation'])
+    row_list = csv_table.get(str(query_technology), [])
+    assert len(row_list) > 0, logger.error(f'Invalid technology: <{query_technology}>.')
+    if len(row_list) > 1:
+        # many rows of a technology are grid points of N-D interpolation
+        return query_csv_grid(csv_file, query_technology, query_frequency, query_list, value_columns, value_scale)
+
+    row = row_list[0]
+    skip_columns = csv_skip_columns + list(value_columns)
+    for query in query_list:
+        for attr_key in query:
+            if attr_key not in csv_query_columns:
+                assert attr_key in row, logger.error(f'Invalid query attribute <{attr_key}>.')
+    interpolation = row['interpolation'].lower()
+    if any(attr_key not in skip_columns for attr_key in row):
+        assert interpolation in csv_interpolation_list, logger.error(f'Invalid interpolation <{interpolation}> in <{csv_file}>. Valid options are <{str(csv_interpolation_list)}>.')
+
+    value_list = [np.full(len(query_list), row[column]) / scale for column, scale in zip(value_columns, value_scale)]
+    # frequency scaling (dynamic power)
+    value_list[0] *= (query_frequency / row['frequency'])
+
+    # one array of attribute values for all queries, with a default of 1
+    for attr_key in row:
+        if attr_key not in skip_columns:
+            attr_value = np.array([query.get(attr_key, 1) for query in query_list], dtype=float)
+            for position, value in enumerate(value_list):
+                if interpolation == 'linear':
+                    value_list[position] = interpolate_oneD_linear(attr_value, [{'x': 0, 'y': 0}, {'x': row[attr_key], 'y': value}])
+                elif interpolation == 'quadratic':
+                    value_list[position] = interpolate_oneD_quadratic(attr_value, [{'x': 0, 'y': 0}, {'x': row[attr_key], 'y': value}])
+
+    return np.stack(value_list, axis=1)
+
+
+def query_csv_grid(csv_file: str, query_technology, query_frequency: np.ndarray, query_list: list, value_columns: list, value_scale: list) -> np.ndarray:
+    """
+    utility function that interpolates the rows of a technology in a csv table of an interface as a rectilinear grid of all attributes, with one array of queries
+    all rows of the technology shall have the same frequency and interpolation, i.e., linear or loglog
+    :param value_columns: columns of dynamic power, leakage power and area, same as query_csv_batch
+    :param value_scale: divisor of each value column, same as query_csv_batch
+    :return values of shape (queries, value columns)
+    """
+    csv_table = read_csv_table(csv_file, key='technology', text_columns=['interpolation'])
+    skip_columns = csv_skip_columns + list(value_columns)
+    attr_list = [attr_key for attr_key in csv_table[str(query_technology)][0] if attr_key not in skip_columns]
+    grid = read_csv_grid(csv_file, key='technology', key_value=str(query_technology), axis_columns=attr_list, value_columns=value_columns, constant_columns=['frequency', 'interpolation'], text_columns=['interpolation'])
+    interpolation = grid['constant']['interpolation'].lower()
+    assert interpolation in csv_grid_interpolation_list, logger.error(f'Invalid interpolation <{interpolation}> in <{csv_file}>. Valid options for many rows per technology are <{str(csv_grid_interpolation_list)}>.')
+
+    for query in query_list:
+        for attr_key in query:
+            if attr_key not in csv_query_columns:
+                assert attr_key in attr_list, logger.error(f'Invalid query attribute <{attr_key}>.')
+
+    # missing attributes default to 1, same as tables with one row per technology
+    attr_value = np.array([[query.get(attr_key, 1) for attr_key in attr_list] for query in query_list], dtype=float).reshape(len(query_list), len(attr_list))
+    value = interpolate_grid(grid, attr_value, log=(interpolation == 'loglog'))
+    value = value / np.array(value_scale, dtype=float)
+
+    # frequency scaling (dynamic power)
+    value[:, 0] = value[:, 0] * (query_frequency / grid['constant']['frequency'])
+
+    return value
+
+
 def get_input_tuple(input: tuple | int, size: int=2) -> tuple:
     if isinstance(input, tuple):
         assert len(input) == size, logger.error(f'Invalid size <{str(len(input))}> != <{str(size)}>.')
@@ -1 +1 @@
-from .workload import create_workload_dict, save_workload_dict, load_workload_dict
+from .workload import create_workload_dict, save_workload_dict, load_workload_dict, stack_workload_dict
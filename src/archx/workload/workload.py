@@ -1,3 +1,5 @@
+import numpy as np
+
 from collections import OrderedDict
 from loguru import logger
 
@@ -49,3 +51,22 @@ def load_workload_dict(ckpt_path: str) -> OrderedDict:
     logger.success(f'Load workload dictionary from <{full_path}>.')
     return workload_dict
 
+
+def stack_workload_dict(workload_dict_list: list) -> OrderedDict:
+    """
+    Stack a batch of workloads with the same keys to one workload, e.g., for batched performance models.
+    Values that differ across the batch are stacked to a numpy array with one element per workload, and other values are kept.
+    """
+    assert len(workload_dict_list) > 0, logger.error(f'Invalid empty batch of workloads.')
+    stacked_dict = OrderedDict()
+    for key, value in workload_dict_list[0].items():
+        for workload_dict in workload_dict_list[1:]:
+            assert key in workload_dict, logger.error(f'Missing <{key}> in a batch of workloads; workloads in a batch require the same keys.')
+        value_list = [workload_dict[key] for workload_dict in workload_dict_list]
+        if isinstance(value, dict):
+            stacked_dict[key] = stack_workload_dict(value_list)
+        elif all(batch_value == value for batch_value in value_list):
+            stacked_dict[key] = value
+        else:
+            stacked_dict[key] = np.array(value_list)
+    return stacked_dict
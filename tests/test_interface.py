@@ -1,12 +1,20 @@
 # following two lines are used in testing
-import sys, os, shutil
+import sys, os, shutil, tempfile, pathlib
+import pytest
 
 from loguru import logger
 
-from archx.interface import query_interface, register_interface, unregister_interface, copy_interface
+from archx.interface import query_interface, query_interface_batch, prefetch_interface, load_interface, reload_interface, get_interface_cache_stats, register_interface, unregister_interface, copy_interface
+from archx.interface.interface import hash_interface
 from archx.utils import get_path, create_dir
 
 
+@pytest.fixture(autouse=True)
+def interface_cache(tmp_path, monkeypatch):
+    # results and surrogate samples of tests are kept out of the interface cache of the user
+    monkeypatch.setenv('ARCHX_INTERFACE_CACHE', str(tmp_path / 'cache'))
+
+
 def test_query_interface_csv_cmos():
     module = 'ireg'
     query = {
@@ -55,6 +63,201 @@ def test_query_interface_cacti7_dram():
     logger.info('test_query_interface_cacti7_dram: ', output)
 
 
+def test_query_interface_batch():
+    module_list = ['adder_' + str(width) for width in [8, 16, 32, 64]]
+    query_list = [{
+        'class': 'adder',
+        'interface': 'csv_cmos',
+        'technology': 45,
+        'frequency': 400,
+        'width': width
+    } for width in [8, 16, 32, 64]]
+    output_list = query_interface_batch(module_list, query_list, use_cache=False)
+    for module, query, output in zip(module_list, query_list, output_list):
+        assert output == query_interface(module, query, use_cache=False)
+    logger.info('test_query_interface_batch: ', output_list)
+
+
+def test_query_interface_batch_cache():
+    module_list = ['adder_' + str(width) for width in [8, 16, 32, 64, 8]]
+    query_list = [{
+        'class': 'adder',
+        'interface': 'csv_cmos',
+        'technology': 45,
+        'frequency': 400,
+        'width': width
+    } for width in [8, 16, 32, 64, 8]]
+    output_list = query_interface_batch(module_list, query_list)
+
+    # cached results are read in one batch, in the order of the queries
+    hit_count = get_interface_cache_stats()['hit']
+    assert query_interface_batch(module_list, query_list) == output_list
+    assert get_interface_cache_stats()['hit'] == hit_count + len(query_list)
+
+
+def test_query_interface_batch_concurrent():
+    module_list = ['isram', 'wsram', 'osram']
+    query_list = [{
+        'class': 'sram',
+        'interface': 'cacti7',
+        'technology': 32,
+        'frequency': 400,
+        'width': width,
+        'depth': 512,
+        'bank': 4
+    } for width in [8, 16, 32]]
+    path = get_path('tests')
+    path = path + '/test_interface/'
+    create_dir(path)
+    output_list = query_interface_batch(module_list, query_list, output_dir=path, max_workers=3)
+    assert output_list == query_interface_batch(module_list, query_list, output_dir=path, max_workers=1)
+    logger.info('test_query_interface_batch_concurrent: ', output_list)
+
+
+def test_query_interface_cacti7_surrogate(tmp_path):
+    # samples are seeded into the temporary interface cache, and the surrogate is reloaded to drop samples of earlier queries
+    reload_interface('cacti7_surrogate')
+    surrogate_py = load_interface('cacti7_surrogate')
+
+    # results of the samples are exact power laws, which the log-space surface fits without error
+    def get_result(width, depth, bank):
+        return [1e-4 * width * depth ** 0.5, 2e-4 * width * depth ** 0.5, 1e-3 * width * depth / bank ** 0.5, 1e-6 * width * depth * bank ** 0.1]
+
+    for width in [8, 16, 32]:
+        for depth in [64, 256, 1024]:
+            for bank in [1, 4, 16]:
+                surrogate_py.add_sample(32, (float(width), float(depth), float(bank)), get_result(width, depth, bank))
+
+    module = 'isram'
+    query = {
+        'class': 'sram',
+        'interface': 'cacti7_surrogate',
+        'technology': 32,
+        'frequency': 400,
+        'width': 16,
+        'depth': 512,
+        'bank': 2,
+        'tolerance': 0.15
+    }
+    path = str(tmp_path)
+
+    # inside the sampled range, the surrogate predicts the result, which is not kept in the interface cache
+    cache_stats = get_interface_cache_stats()
+    output = query_interface(module, query, output_dir=path)
+    assert get_interface_cache_stats() == cache_stats
+    assert output['error']['value'] < query['tolerance']
+    for value, expected_value in zip([output['dynamic_energy']['read']['value'], output['dynamic_energy']['write']['value'], output['leakage_power']['value'], output['area']['value']], get_result(16, 512, 2)):
+        assert abs(value / expected_value - 1) < 1e-6
+    logger.info('test_query_interface_cacti7_surrogate: ', output)
+
+    # outside the sampled range, CACTI7 is run and the result becomes a sample
+    query['width'] = 128
+    output = query_interface(module, query, output_dir=path)
+    assert output['error']['value'] == 0
+    assert (128., 512., 2.) in surrogate_py.get_samples(32)
+    logger.info('test_query_interface_cacti7_surrogate: ', output)
+
+
+def test_query_interface_csv_cmos_grid(tmp_path):
+    # many rows of a technology, with power and area growing as width * depth, in a table of the input dir
+    with open(tmp_path / 'test_grid.csv', 'w') as f:
+        f.write('technology,frequency,dynamic_uw,leakage_uw,area_mm2,num_instances,interpolation,width,depth\n')
+        for width in [8, 16, 32]:
+            for depth in [16, 64, 256, 1024]:
+                f.write(f'45,400,{width * depth * 1e-3},{width * depth * 1e-5},{width * depth * 1e-6},1,loglog,{width},{depth}\n')
+    query_list = [{
+        'class': 'test_grid',
+        'interface': 'csv_cmos',
+        'technology': 45,
+        'frequency': 800,
+        'width': width,
+        'depth': depth
+    } for width, depth in [(8, 16), (12, 100), (32, 1024), (64, 2048)]]
+    output_list = query_interface_batch(['grid'] * len(query_list), query_list, input_dir=str(tmp_path))
+    for query, output in zip(query_list, output_list):
+        assert output == query_interface('grid', query, input_dir=str(tmp_path))
+        assert abs(output['area']['value'] / (query['width'] * query['depth'] * 1e-6) - 1) < 1e-9
+        assert abs(output['dynamic_energy']['value'] / (query['width'] * query['depth'] * 1e-3 * 2 / 800) - 1) < 1e-9
+    logger.info('test_query_interface_csv_cmos_grid: ', output_list)
+
+
+def test_load_interface():
+    name = 'csv_cmos'
+    interface = load_interface(name)
+    assert load_interface(name) is interface
+    reload_interface(name)
+    assert load_interface(name) is not interface
+    interface = load_interface(name)
+    assert interface is not load_interface(name, reload=True)
+
+
+def test_hash_interface(tmp_path):
+    name = 'dummy_hash'
+    interface_dir = tmp_path / name
+    interface_dir.mkdir()
+    (interface_dir / (name + '.py')).write_text('def query(name, interface, query, input_dir=None, output_dir=None):\n    return {}\n')
+    (interface_dir / 'data.csv').write_text('width,area\n8,1.0\n')
+    register_interface(name, str(interface_dir))
+    try:
+        # editing a data file changes the hash in the same process
+        interface_hash = hash_interface(name)
+        data_file = os.path.join(os.path.dirname(load_interface(name).__file__), 'data.csv')
+        with open(data_file, 'w') as f:
+            f.write('width,area\n8,2.0\n')
+        os.utime(data_file, (os.path.getatime(data_file), os.path.getmtime(data_file) + 10))
+        assert hash_interface(name) != interface_hash
+
+        # adding a file changes the hash, and an unchanged interface keeps its hash
+        interface_hash = hash_interface(name)
+        with open(os.path.join(os.path.dirname(data_file), 'data_extra.csv'), 'w') as f:
+            f.write('width,area\n16,4.0\n')
+        os.utime(os.path.dirname(data_file), (os.path.getatime(data_file), os.path.getmtime(data_file) + 20))
+        assert hash_interface(name) != interface_hash
+        assert hash_interface(name) == hash_interface(name)
+    finally:
+        unregister_interface(name)
+
+
+def test_interface_cache():
+    module = 'isram'
+    query = {
+        'class': 'sram',
+        'interface': 'cacti7',
+        'technology': 32,
+        'frequency': 400,
+        'width': 16,
+        'depth': 512,
+        'bank': 32
+    }
+    path = get_path('tests')
+    path = path + '/test_interface/'
+    create_dir(path)
+    output = query_interface(module, query, output_dir=path)
+    hit_count = get_interface_cache_stats()['hit']
+    cached_output = query_interface(module, query, output_dir=path)
+    assert get_interface_cache_stats()['hit'] == hit_count + 1
+    assert cached_output == output
+    logger.info('test_interface_cache: ', get_interface_cache_stats())
+
+
+def test_prefetch_interface():
+    query_list = [{
+        'class': 'sram',
+        'interface': 'cacti7',
+        'technology': 32,
+        'frequency': 400,
+        'width': 32,
+        'depth': 256,
+        'bank': 8
+    }] * 4
+    path = get_path('tests')
+    path = path + '/test_interface/'
+    create_dir(path)
+    prefetch_interface(query_list, output_dir=path)
+    output = query_interface('psram', query_list[0], output_dir=path, use_cache=False)
+    logger.info('test_prefetch_interface: ', output)
+
+
 def test_copy_interface():
     name = 'csv_cmos'
     path = 'tests/test_interface/dummy_csv_cmos'
@@ -80,9 +283,19 @@ def test_cleanup():
 
 
 if __name__ == "__main__":
+    os.environ['ARCHX_INTERFACE_CACHE'] = tempfile.mkdtemp()
     test_query_interface_csv_cmos()
     test_query_interface_cacti7_sram()
     test_query_interface_cacti7_dram()
+    test_query_interface_batch()
+    test_query_interface_batch_cache()
+    test_query_interface_batch_concurrent()
+    test_query_interface_cacti7_surrogate(tmp_path=pathlib.Path(tempfile.mkdtemp()))
+    test_query_interface_csv_cmos_grid(tmp_path=pathlib.Path(tempfile.mkdtemp()))
+    test_load_interface()
+    test_hash_interface(tmp_path=pathlib.Path(tempfile.mkdtemp()))
+    test_interface_cache()
+    test_prefetch_interface()
     test_copy_interface()
     test_register_interface()
     test_unregister_interface()
@@ -0,0 +1,92 @@
+# following two lines are used in testing
+import sys, os, shutil, copy
+
+from loguru import logger
+
+import graph_tool.all as gt
+
+from archx.architecture import create_architecture_dict
+from archx.event import create_event_graph
+from archx.metric import create_metric_dict, aggregate_event_metric, create_event_metrics, update_module_metric, get_metric_table
+from archx.workload import create_workload_dict
+from archx.performance import simulate_performance_all_events, simulate_performance_workloads
+from archx.utils import get_path
+
+
+# set up run_name
+run_name = 'mac_1_cycle'
+
+input_root = 'examples/' + run_name + '/input/'
+output_root = 'tests/' + run_name + '_batch/'
+
+arch_input_file = input_root + 'architecture/example.architecture.yaml'
+metric_input_file = input_root + 'metric/example.metric.yaml'
+event_input_file = input_root + 'event/example.event.yaml'
+workload_input_file = input_root + 'workload/example.workload.yaml'
+
+logger.remove()
+logger.add(sys.stderr, level='DEBUG')
+
+logger.info(f'\n----------------------------------------------\nStep 1: Simulate a batch of workloads\n----------------------------------------------\n')
+architecture_dict = create_architecture_dict(arch_input_file)
+metric_dict = create_metric_dict(metric_input_file)
+workload_dict = create_workload_dict(workload_input_file)
+
+workload_dict_list = []
+for m in [8, 16, 32]:
+    batch_workload_dict = copy.deepcopy(workload_dict)
+    batch_workload_dict['gemm16']['configuration']['m'] = m
+    workload_dict_list.append(batch_workload_dict)
+
+event_graph = create_event_graph(event_input_file)
+event_graph = create_event_metrics(event_graph, architecture_dict, metric_dict, run_dir=output_root)
+event_graph_list = simulate_performance_workloads(event_graph, architecture_dict, workload_dict_list)
+
+metrics = ['area', 'leakage_power', 'dynamic_energy', 'cycle_count', 'runtime']
+queries = [('gemm16', 'gemm16'), ('gemm16', 'mac_array'), ('gemm32', 'gemm32'), ('gemm32', 'sram_rd')]
+
+
+def test_batch():
+    logger.info(f'\n----------------------------------------------\nStep 2: Compare batch and separate simulation\n----------------------------------------------\n')
+    for batch_graph, batch_workload_dict in zip(event_graph_list, workload_dict_list):
+        full_graph = create_event_graph(event_input_file)
+        full_graph = create_event_metrics(full_graph, architecture_dict, metric_dict, run_dir=output_root)
+        full_graph = simulate_performance_all_events(full_graph, architecture_dict, batch_workload_dict)
+        for metric in metrics:
+            for workload, event in queries:
+                full_result = aggregate_event_metric(event_graph=full_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+                batch_result = aggregate_event_metric(event_graph=batch_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+                assert full_result == batch_result, logger.error(f'Mismatch of batch <{batch_result}> and separate <{full_result}> simulation.')
+
+
+def test_isolation():
+    logger.info(f'\n----------------------------------------------\nStep 3: Update one graph in the batch\n----------------------------------------------\n')
+    graph_list = [event_graph] + event_graph_list[1:]
+    metric_table_list = [copy.deepcopy(get_metric_table(graph)) for graph in graph_list]
+    result_list = [[aggregate_event_metric(event_graph=graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event) for metric in metrics for workload, event in queries] for graph in event_graph_list[1:]]
+
+    # graphs in the batch share one metric table, which is not the table of the event graph
+    assert all(get_metric_table(graph) is get_metric_table(event_graph_list[0]) for graph in event_graph_list)
+    assert get_metric_table(event_graph) is not get_metric_table(event_graph_list[0])
+
+    # a multi-operation metric adds operations to the metric table of the updated graph only
+    module_metric = {'add': {'value': 1., 'unit': 'pJ'}, 'multiply': {'value': 2., 'unit': 'pJ'}}
+    update_module_metric(event_graph_list[0], module='multiplier', metric='dynamic_energy', module_metric=module_metric)
+    assert set(['add', 'multiply']) <= set(get_metric_table(event_graph_list[0])['dynamic_energy']['operation'])
+    assert get_metric_table(event_graph_list[0]) is not get_metric_table(event_graph_list[1])
+
+    for graph, metric_table in zip(graph_list, metric_table_list):
+        assert get_metric_table(graph) == metric_table, logger.error(f'Metric table of another graph changes with the update.')
+    for graph, results in zip(event_graph_list[1:], result_list):
+        assert results == [aggregate_event_metric(event_graph=graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event) for metric in metrics for workload, event in queries]
+
+
+def test_cleanup():
+    path = get_path(output_root)
+    shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    test_batch()
+    test_isolation()
+    test_cleanup()
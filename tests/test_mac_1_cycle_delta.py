@@ -0,0 +1,183 @@
+# following two lines are used in testing
+import sys, os, shutil, copy, json
+
+from collections import OrderedDict
+from loguru import logger
+
+import graph_tool.all as gt
+
+from archx.architecture import create_architecture_dict
+from archx.event import create_event_graph, save_event_graph, load_event_graph, get_event_dependency, get_event_plan, save_event_plan
+from archx.event.event import plan_registry, plan_suffix, plan_version, key_dependency
+from archx.metric import create_metric_dict, aggregate_event_metric, create_event_metrics, create_module_metrics_delta
+from archx.workload import create_workload_dict
+from archx.performance import simulate_performance_all_events, simulate_performance_delta
+from archx.performance.performance import call_tracking, call_memo, hash_function_code, get_memo_stats, memo_registry, memo_path_registry, key_memo_env
+from archx.utils import get_path
+
+
+# set up run_name
+run_name = 'mac_1_cycle'
+
+input_root = 'examples/' + run_name + '/input/'
+output_root = 'tests/' + run_name + '_delta/'
+
+arch_input_file = input_root + 'architecture/example.architecture.yaml'
+metric_input_file = input_root + 'metric/example.metric.yaml'
+event_input_file = input_root + 'event/example.event.yaml'
+workload_input_file = input_root + 'workload/example.workload.yaml'
+base_checkpoint_file = output_root + 'example.event_graph_base.gt'
+
+logger.remove()
+logger.add(sys.stderr, level='DEBUG')
+
+logger.info(f'\n----------------------------------------------\nStep 1: Simulate base checkpoint with dependencies\n----------------------------------------------\n')
+architecture_dict = create_architecture_dict(arch_input_file)
+metric_dict = create_metric_dict(metric_input_file)
+workload_dict = create_workload_dict(workload_input_file)
+event_graph = create_event_graph(event_input_file)
+event_graph = create_event_metrics(event_graph, architecture_dict, metric_dict, run_dir=output_root, track=True)
+event_graph = simulate_performance_all_events(event_graph, architecture_dict, workload_dict, track=True)
+save_event_graph(event_graph=event_graph, save_path=base_checkpoint_file)
+
+logger.info(f'\n----------------------------------------------\nStep 2: Change gemm16 in workload\n----------------------------------------------\n')
+delta_workload_dict = copy.deepcopy(workload_dict)
+delta_workload_dict['gemm16']['configuration']['m'] = 32
+
+# full simulation as reference
+full_graph = create_event_graph(event_input_file)
+full_graph = create_event_metrics(full_graph, architecture_dict, metric_dict, run_dir=output_root)
+full_graph = simulate_performance_all_events(full_graph, architecture_dict, delta_workload_dict)
+
+# delta simulation from the base checkpoint
+delta_graph = load_event_graph(base_checkpoint_file)
+delta_graph = create_module_metrics_delta(delta_graph, architecture_dict, run_dir=output_root)
+delta_graph = simulate_performance_delta(delta_graph, architecture_dict, delta_workload_dict)
+
+
+def test_dependency():
+    logger.info(f'\n----------------------------------------------\nStep 3: Check dependencies\n----------------------------------------------\n')
+    event_dependency = get_event_dependency(event_graph)['event']
+    assert set(event_dependency.keys()) == set(['gemm16', 'gemm32', 'mac_array', 'sram_rd', 'sram_wr'])
+
+    # gemm16 reads its own workload, and not the workload of gemm32
+    record_path_list = [path for kind, path, value in event_dependency['gemm16']['record']]
+    assert ['workload_dict', 'gemm16', 'configuration', 'm'] in record_path_list
+    assert not any(path[:2] == ['workload_dict', 'gemm32'] for path in record_path_list)
+
+    module_dependency = get_event_dependency(event_graph)['module']
+    assert set(module_dependency.keys()) == set(['multiplier', 'adder', 'sram'])
+
+
+def test_dependency_default():
+    logger.info(f'\n----------------------------------------------\nStep 3: Check no dependencies by default\n----------------------------------------------\n')
+    assert key_dependency not in full_graph.gp
+
+
+def test_dependency_pool():
+    logger.info(f'\n----------------------------------------------\nStep 3: Check dependencies from a process pool\n----------------------------------------------\n')
+    pool_graph = create_event_graph(event_input_file)
+    pool_graph = create_event_metrics(pool_graph, architecture_dict, metric_dict, run_dir=output_root, track=True)
+    pool_graph = simulate_performance_all_events(pool_graph, architecture_dict, workload_dict, max_workers=2, track=True)
+    assert get_event_dependency(pool_graph)['event'] == get_event_dependency(event_graph)['event']
+
+
+def test_tracking_dict():
+    logger.info(f'\n----------------------------------------------\nStep 3: Check copies and dumps of tracked dictionaries\n----------------------------------------------\n')
+    gemm16_record = ['value', ['workload_dict', 'gemm16'], json.dumps(workload_dict['gemm16'], sort_keys=True)]
+
+    # copies are plain dictionaries, and read the whole dictionary
+    result, record_list = call_tracking(lambda workload_dict: copy.deepcopy(workload_dict['gemm16']), {'workload_dict': workload_dict})
+    assert result == workload_dict['gemm16'] and type(result) is type(workload_dict['gemm16'])
+    assert gemm16_record in record_list, logger.error(f'Miss the read of <gemm16> in deepcopy.')
+
+    result, record_list = call_tracking(lambda workload_dict: copy.copy(workload_dict['gemm16']), {'workload_dict': workload_dict})
+    assert result == workload_dict['gemm16'] and type(result) is type(workload_dict['gemm16'])
+    assert gemm16_record in record_list, logger.error(f'Miss the read of <gemm16> in copy.')
+
+    # json dumps the dictionary in c code, which reads the whole dictionary
+    result, record_list = call_tracking(lambda workload_dict: json.dumps(workload_dict['gemm16']), {'workload_dict': workload_dict})
+    assert result == json.dumps(workload_dict['gemm16'])
+    assert gemm16_record in record_list, logger.error(f'Miss the read of <gemm16> in json.dumps.')
+
+
+def test_memo():
+    logger.info(f'\n----------------------------------------------\nStep 3: Check memoized results of models with the same code\n----------------------------------------------\n')
+    def proj_q(workload_dict):
+        return workload_dict['gemm16']['configuration']['m'] * 2
+
+    def proj_k(workload_dict):
+        return workload_dict['gemm16']['configuration']['m'] * 2
+
+    assert hash_function_code(proj_q) == hash_function_code(proj_k)
+    memo_key = hash_function_code(proj_q)
+    previous_env = os.environ.get(key_memo_env)
+    os.environ[key_memo_env] = os.path.join(get_path(output_root), 'performance_cache')
+    try:
+        memo_workload_dict = copy.deepcopy(workload_dict)
+        for function, m, update, hit in [(proj_q, 16, None, False), (proj_k, 16, None, True), (proj_q, 64, 'm', False), (proj_k, 64, 'gemm32', True), (proj_q, 64, 'registry', True)]:
+            if update == 'm':
+                memo_workload_dict['gemm16']['configuration']['m'] = m
+            elif update == 'gemm32':
+                memo_workload_dict['gemm32']['configuration']['m'] = 1
+            elif update == 'registry':
+                # results of other runs are read from the performance cache
+                memo_registry.clear()
+                memo_path_registry.clear()
+            previous_hit = get_memo_stats()['hit']
+            result, record_list = call_memo(memo_key, function.__name__, function, OrderedDict({'workload_dict': memo_workload_dict}))
+            assert result == m * 2
+            assert (get_memo_stats()['hit'] > previous_hit) == hit, logger.error(f'Mismatch of memo hit <{not hit}> for <{function.__name__}> after update <{update}>.')
+    finally:
+        if previous_env is None:
+            os.environ.pop(key_memo_env)
+        else:
+            os.environ[key_memo_env] = previous_env
+
+
+def test_delta():
+    logger.info(f'\n----------------------------------------------\nStep 4: Compare delta and full simulation\n----------------------------------------------\n')
+    index = 0
+    for metric in ['area', 'leakage_power', 'dynamic_energy', 'cycle_count', 'runtime']:
+        for workload, event in [('gemm16', 'gemm16'), ('gemm16', 'mac_array'), ('gemm32', 'gemm32'), ('gemm32', 'sram_rd')]:
+            index += 1
+            logger.info(f'\n\nTest <{index}>: Aggregate <{metric}> for event <{event}> in workload <{workload}>.')
+            full_result = aggregate_event_metric(event_graph=full_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+            delta_result = aggregate_event_metric(event_graph=delta_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+            assert full_result == delta_result, logger.error(f'Mismatch of delta <{delta_result}> and full <{full_result}> simulation.')
+            logger.success(f'result <{delta_result}>.')
+
+
+def test_plan():
+    logger.info(f'\n----------------------------------------------\nStep 5: Load saved plans of the checkpoint\n----------------------------------------------\n')
+    plan = get_event_plan(event_graph)
+    plan_registry.clear()
+    load_event_graph(base_checkpoint_file)
+    assert plan_registry[plan['hash']]['version'] == plan_version
+
+    # plans of another version or structure are ignored, and compiled again on first use
+    for key, value in [('version', plan_version + 1), ('hash', '0' * len(plan['hash']))]:
+        stale_plan = copy.copy(plan)
+        stale_plan[key] = value
+        save_event_plan(stale_plan, base_checkpoint_file + plan_suffix)
+        plan_registry.clear()
+        stale_graph = load_event_graph(base_checkpoint_file)
+        assert len(plan_registry) == 0, logger.error(f'Register stale plan with <{key}> <{value}>.')
+        assert get_event_plan(stale_graph)['hash'] == plan['hash']
+        assert get_event_plan(stale_graph)['version'] == plan_version
+
+
+def test_cleanup():
+    path = get_path(output_root)
+    shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    test_dependency()
+    test_dependency_default()
+    test_dependency_pool()
+    test_tracking_dict()
+    test_memo()
+    test_delta()
+    test_plan()
+    test_cleanup()
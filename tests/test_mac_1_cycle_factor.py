@@ -1,13 +1,15 @@
 # following two lines are used in testing
 import sys, os, shutil
+from concurrent.futures import ThreadPoolExecutor
 
 from loguru import logger
 
+import numpy as np
 import graph_tool.all as gt
 
 from archx.architecture import create_architecture_dict, save_architecture_dict
-from archx.event import create_event_graph, save_event_graph
-from archx.metric import create_metric_dict, save_metric_dict, aggregate_event_metric, create_event_metrics, query_module_metric, aggregate_tag_metric, aggregate_event_count
+from archx.event import create_event_graph, save_event_graph, clear_graph_cache, index_event_graph, get_event_node, get_tag_nodes
+from archx.metric import create_metric_dict, save_metric_dict, aggregate_event_metric, create_event_metrics, query_module_metric, aggregate_tag_metric, aggregate_event_count, aggregate_event_metrics, aggregate_tag_metrics, aggregate_breakdown_metric, aggregate_batch_metrics, update_edge_count, update_module_metric, MetricQuery
 from archx.workload import create_workload_dict, save_workload_dict
 from archx.performance import simulate_performance_all_events
 from archx.utils import get_path
@@ -359,6 +361,22 @@ def test_tag():
     logger.success(f'result <{result}>.')
 
 
+def test_tag_string():
+    logger.info(f'\n----------------------------------------------\nStep 7: Find modules of a tag string\n----------------------------------------------\n')
+    # a module with a tag string instead of a list of tags matches any part of the string
+    sram_node = get_event_node(event_graph, 'sram')
+    sram_tags = event_graph.vp.tag[sram_node]
+    try:
+        event_graph.vp.tag[sram_node] = 'onchip_memory'
+        index_event_graph(event_graph)
+        for tag in ['onchip', 'memory', 'onchip_memory']:
+            assert int(sram_node) in [int(v) for v in get_tag_nodes(event_graph, tag)], logger.error(f'Missing module <sram> in tag <{tag}>.')
+        assert int(sram_node) not in [int(v) for v in get_tag_nodes(event_graph, 'offchip')]
+    finally:
+        event_graph.vp.tag[sram_node] = sram_tags
+        index_event_graph(event_graph)
+
+
 def test_count():
     logger.info(f'\n----------------------------------------------\nStep 7: Aggregate results\n----------------------------------------------\n')
     index = 0
@@ -391,6 +409,159 @@ def test_count():
     logger.success(f'result <{result}>.')
 
 
+def test_metrics():
+    logger.info(f'\n----------------------------------------------\nStep 7: Aggregate results\n----------------------------------------------\n')
+    index = 0
+
+    index += 1
+    metrics = ['area', 'leakage_power', 'dynamic_energy', 'cycle_count', 'runtime']
+    workload = 'gemm16'
+    event = 'mac_array'
+    logger.info(f'\n\nTest <{index}>: Aggregate <{metrics}> for event <{event}> in workload <{workload}>.')
+    result = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+    for metric in metrics:
+        single_result = aggregate_event_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+        assert abs(result[metric]['value'] - single_result['value']) <= 1e-9 * abs(single_result['value'])
+    logger.success(f'result <{result}>.')
+
+    index += 1
+    metrics = ['area', 'leakage_power', 'dynamic_energy']
+    workload = 'gemm16'
+    tag = 'onchip'
+    logger.info(f'\n\nTest <{index}>: Aggregate <{metrics}> for tag <{tag}> in workload <{workload}>.')
+    result = aggregate_tag_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, tag=tag)
+    for metric in metrics:
+        single_result = aggregate_tag_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, workload=workload, tag=tag)
+        assert abs(result[metric]['value'] - single_result['value']) <= 1e-9 * abs(single_result['value'])
+    logger.success(f'result <{result}>.')
+
+
+def test_metric_query():
+    logger.info(f'\n----------------------------------------------\nStep 7: Aggregate results\n----------------------------------------------\n')
+    index = 0
+
+    index += 1
+    metric_list = [['area'], ['dynamic_energy'], ['cycle_count', 'runtime'], ['area', 'leakage_power', 'dynamic_energy', 'cycle_count', 'runtime']]
+    event_list = [('gemm16', 'gemm16'), ('gemm32', 'gemm32'), ('gemm16', 'mac_array'), ('gemm32', 'mac_array'), (None, 'mac_array'), ('gemm16', 'multiplication'), ('gemm16', 'sram_rd'), ('gemm32', 'sram_wr')]
+    queries = [(metrics, workload, event) for metrics in metric_list for workload, event in event_list] * 4
+    logger.info(f'\n\nTest <{index}>: Aggregate <{len(queries)}> queries concurrently on a cold cache.')
+
+    # serial reference on a cold cache
+    clear_graph_cache(event_graph)
+    serial_results = [aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event) for metrics, workload, event in queries]
+
+    # concurrent queries on a cold cache recompute the same subtotals at the same time
+    clear_graph_cache(event_graph)
+    metric_query = MetricQuery(event_graph=event_graph, metric_dict=metric_dict)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda query: metric_query.aggregate_event_metrics(metrics=query[0], workload=query[1], event=query[2]), queries))
+    for (metrics, workload, event), result, serial_result in zip(queries, results, serial_results):
+        for metric in metrics:
+            assert result[metric]['value'] == serial_result[metric]['value'], logger.error(f'Mismatch of concurrent <{result[metric]["value"]}> and serial <{serial_result[metric]["value"]}> result of metric <{metric}> for event <{event}> in workload <{workload}>.')
+    logger.success(f'result <{results[0]}>.')
+
+
+def test_breakdown():
+    logger.info(f'\n----------------------------------------------\nStep 7: Aggregate results\n----------------------------------------------\n')
+    index = 0
+
+    index += 1
+    metric = 'dynamic_energy'
+    workload = 'gemm16'
+    logger.info(f'\n\nTest <{index}>: Break down <{metric}> in workload <{workload}>.')
+    result = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, workload=workload)
+    for event in ['gemm16', 'mac_array', 'sram_rd', 'sram']:
+        single_result = aggregate_event_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+        assert abs(result.loc[event].sum() - single_result['value']) <= 1e-9 * abs(single_result['value'])
+    logger.success(f'result <{result}>.')
+
+    index += 1
+    metric = 'area'
+    event = 'gemm16'
+    logger.info(f'\n\nTest <{index}>: Break down <{metric}> for event <{event}>.')
+    result = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric)
+    single_result = aggregate_event_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, event=event)
+    assert abs(result.loc[event].sum() - single_result['value']) <= 1e-9 * abs(single_result['value'])
+    logger.success(f'result <{result}>.')
+
+
+def test_update():
+    logger.info(f'\n----------------------------------------------\nStep 7: Aggregate results\n----------------------------------------------\n')
+    index = 0
+
+    index += 1
+    metrics = ['dynamic_energy', 'cycle_count', 'runtime']
+    workload = 'gemm16'
+    event = 'gemm16'
+    logger.info(f'\n\nTest <{index}>: Update count of <sram_rd> in <{event}> and aggregate <{metrics}> incrementally.')
+    aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+    count = [event_graph.ep.count[e] for e in event_graph.edges() if event_graph.vp.event[e.source()] == event and event_graph.vp.event[e.target()] == 'sram_rd'][0]
+    update_edge_count(event_graph=event_graph, event=event, subevent='sram_rd', count=count * 2)
+    result = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+    clear_graph_cache(event_graph)
+    full_result = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+    for metric in metrics:
+        assert abs(result[metric]['value'] - full_result[metric]['value']) <= 1e-9 * abs(full_result[metric]['value'])
+    update_edge_count(event_graph=event_graph, event=event, subevent='sram_rd', count=count)
+    logger.success(f'result <{result}>.')
+
+    index += 1
+    metric = 'dynamic_energy'
+    module = 'sram'
+    logger.info(f'\n\nTest <{index}>: Update <{metric}> of module <{module}> and aggregate <{metric}> incrementally.')
+    module_metric = query_module_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, module=module, operation='read')
+    before_result = aggregate_event_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+    update_module_metric(event_graph=event_graph, module=module, metric=metric, module_metric={'read': {'value': module_metric['value'] * 2, 'unit': module_metric['unit']}, 'write': query_module_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, module=module, operation='write')})
+    result = aggregate_event_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+    clear_graph_cache(event_graph)
+    full_result = aggregate_event_metric(event_graph=event_graph, metric_dict=metric_dict, metric=metric, workload=workload, event=event)
+    assert result['value'] > before_result['value']
+    assert abs(result['value'] - full_result['value']) <= 1e-9 * abs(full_result['value'])
+    logger.success(f'result <{result}>.')
+
+    index += 1
+    logger.info(f'\n\nTest <{index}>: Write count of <sram_rd> in <{event}> directly and aggregate <{metrics}>.')
+    before_result = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+    before_breakdown = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric='dynamic_energy', workload=workload)
+    edge = [e for e in event_graph.edges() if event_graph.vp.event[e.source()] == event and event_graph.vp.event[e.target()] == 'sram_rd'][0]
+    event_graph.ep.count[edge] = count * 2
+    result = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+    breakdown = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric='dynamic_energy', workload=workload)
+    clear_graph_cache(event_graph)
+    full_result = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+    full_breakdown = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric='dynamic_energy', workload=workload)
+    assert result['dynamic_energy']['value'] > before_result['dynamic_energy']['value']
+    assert breakdown.loc[workload].sum() > before_breakdown.loc[workload].sum()
+    for metric in metrics:
+        assert abs(result[metric]['value'] - full_result[metric]['value']) <= 1e-9 * abs(full_result[metric]['value'])
+    assert np.allclose(breakdown.values, full_breakdown.values, equal_nan=True)
+    event_graph.ep.count[edge] = count
+    result = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+    for metric in metrics:
+        assert abs(result[metric]['value'] - before_result[metric]['value']) <= 1e-9 * abs(before_result[metric]['value'])
+    logger.success(f'result <{result}>.')
+
+
+def test_batch():
+    logger.info(f'\n----------------------------------------------\nStep 7: Aggregate results\n----------------------------------------------\n')
+    index = 0
+
+    index += 1
+    metrics = ['area', 'dynamic_energy', 'cycle_count', 'runtime']
+    workload = 'gemm16'
+    event = 'sram_rd'
+    logger.info(f'\n\nTest <{index}>: Aggregate <{metrics}> for event <{event}> in workload <{workload}> in a batch of configs.')
+    scaled_event_graph = event_graph.copy()
+    count = [scaled_event_graph.ep.count[e] for e in scaled_event_graph.edges() if scaled_event_graph.vp.event[e.source()] == workload and scaled_event_graph.vp.event[e.target()] == event][0]
+    update_edge_count(event_graph=scaled_event_graph, event=workload, subevent=event, count=count * 2)
+    result = aggregate_batch_metrics(event_graphs=[event_graph, scaled_event_graph], metric_dict=metric_dict, metrics=metrics, workload=workload, event=event, configs=['base', 'scaled'])
+    for config, config_event_graph in zip(['base', 'scaled'], [event_graph, scaled_event_graph]):
+        single_result = aggregate_event_metrics(event_graph=config_event_graph, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event)
+        for metric in metrics:
+            assert abs(result.at[config, metric] - single_result[metric]['value']) <= 1e-9 * abs(single_result[metric]['value'])
+    logger.success(f'result <{result}>.')
+
+
 def test_cleanup():
     path = get_path(output_root)
     shutil.rmtree(path)
@@ -404,6 +575,12 @@ if __name__ == '__main__':
     test_runtime()
     test_module()
     test_tag()
+    test_tag_string()
     test_count()
+    test_metrics()
+    test_metric_query()
+    test_breakdown()
+    test_update()
+    test_batch()
     test_cleanup()
 
@@ -1,9 +1,10 @@
 # following two lines are used in testing
-import sys, os, shutil
+import sys, os, shutil, copy
+import numpy as np
 
 from loguru import logger
 
-from archx.workload import create_workload_dict, save_workload_dict, load_workload_dict
+from archx.workload import create_workload_dict, save_workload_dict, load_workload_dict, stack_workload_dict
 from archx.utils import get_path, check_dict_equal
 
 
@@ -18,6 +19,23 @@ def test_create_workload_dict():
     assert check_dict_equal(workload_dict, workload_dict_loaded)
 
 
+def test_stack_workload_dict():
+    workload_file = 'examples/mac_1_cycle/input/workload/example.workload.yaml'
+    workload_dict = create_workload_dict(workload_file)
+    workload_dict_list = []
+    for m in [8, 16, 32]:
+        batch_workload_dict = copy.deepcopy(workload_dict)
+        batch_workload_dict['gemm16']['configuration']['m'] = m
+        workload_dict_list.append(batch_workload_dict)
+
+    # only values that differ across the batch are stacked
+    stacked_dict = stack_workload_dict(workload_dict_list)
+    assert isinstance(stacked_dict['gemm16']['configuration']['m'], np.ndarray)
+    assert stacked_dict['gemm16']['configuration']['m'].tolist() == [8, 16, 32]
+    assert stacked_dict['gemm16']['configuration']['k'] == workload_dict['gemm16']['configuration']['k']
+    assert check_dict_equal(stacked_dict['gemm32'], workload_dict['gemm32'])
+
+
 def test_cleanup():
     path = get_path('tests/test_workload/')
     shutil.rmtree(path)
@@ -25,5 +43,6 @@ def test_cleanup():
 
 if __name__ == "__main__":
     test_create_workload_dict()
+    test_stack_workload_dict()
     test_cleanup()
 
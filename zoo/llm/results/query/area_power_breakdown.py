@@ -1,5 +1,4 @@
-from archx.metric import aggregate_event_metric, aggregate_tag_metric, query_module_metric
-from zoo.llm.results.query.utils import query_area, query_tag_power, load_yaml, query_dynamic_energy
+from zoo.llm.results.query.utils import query_area, query_tag_area_power, load_yaml
 import matplotlib.pyplot as plt
 import pandas as pd
 import os
@@ -112,15 +111,13 @@ def query(input_path, output_path):
                     'arch_dim': arch_dim,
                 }
 
+                tag_area_dict, tag_power_dict = query_tag_area_power(tag_list=tag_list, event_graph=event_graph, metric_dict=metric_dict, workload=model, event=model)
+
                 total_area = 0
                 total_power = 0
                 for tag in tag_list:
-                    try:
-                        tag_area = query_area(tag=tag, event_graph=event_graph, metric_dict=metric_dict, workload=model)
-                        tag_power = query_tag_power(tag=tag, event_graph=event_graph, metric_dict=metric_dict, workload=model, event=model)
-                    except:
-                        tag_area = 0
-                        tag_power = 0
+                    tag_area = tag_area_dict[tag]
+                    tag_power = tag_power_dict[tag]
                     total_area += tag_area
                     total_power += tag_power
                     area_row[tag] = tag_area
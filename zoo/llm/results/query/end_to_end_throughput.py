@@ -1,8 +1,5 @@
-from zoo.llm.results.query.utils import query_execution_time, compute_latency, load_yaml
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
+from zoo.llm.results.query.utils import load_yaml, query_batch_metrics
 import pandas as pd
-import numpy as np
 import os
 
 def query(input_path, output_path):
@@ -27,59 +24,41 @@ def query(input_path, output_path):
     network = 'single_node'
 
     end_to_end_breakdown = pd.DataFrame()
+    layer_list = ['projection', 'attention', 'ffn', 'nonlinear']
 
+    config_list = []
+    yaml_dict_list = []
     for arch in vlp_list + baseline_list:
        for arch_dim in (vlp_arch_dim_list if arch in vlp_list else baseline_arch_dim_list if arch in baseline_list else ['8x16x16'] if arch in ['tensor'] else ['']):
             for subarch in (systolic_subarch_list if arch in ['systolic'] else simd_subarch_list if arch in ['simd'] else mugi_subarch_list if arch in ['mugi'] else ['']):
                 for model in model_list:
 
-                    module = gemm_vlp_latency_module if arch in vlp_list else gemm_baseline_latency_module
-                    nonlinear_module = mugi_nonlinear_module if arch in ['mugi'] else baseline_nonlinear_module
                     termination_path = 'full_termination' if arch == 'mugi' else ''
                     run_path = os.path.normpath(f'{input_path}{arch}/{network}/{subarch}/{arch_dim}/{model}/{max_seq_len}/{batch_size}/{termination_path}/')
-                    yaml_dict = load_yaml(run_path)
-
-                    event_graph = yaml_dict['event_graph']
-                    metric_dict = yaml_dict['metric_dict']
-
-                    proj_execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=model, event='projection')
-                    proj_latency_eff_dict = {
-                        'latency': proj_execution_time
-                    }
-
-                    attn_execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=model, event='attention')
-                    attn_latency_eff_dict = {
-                        'latency': attn_execution_time
-                    }
-
-                    ffn_execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=model, event='ffn')
-                    ffn_latency_eff_dict = {
-                        'latency': ffn_execution_time
-                    }
-
-                    nonlinear_execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=model, event='nonlinear')
-                    nonlinear_latency_eff_dict = {
-                        'latency': nonlinear_execution_time
-                    }
-
-                    proj_metric_df = pd.DataFrame(proj_latency_eff_dict, index=[0])
-                    proj_metric_df['layer'] = 'projection'
-                    attn_metric_df = pd.DataFrame(attn_latency_eff_dict, index=[0])
-                    attn_metric_df['layer'] = 'attention'
-                    ffn_metric_df = pd.DataFrame(ffn_latency_eff_dict, index=[0])
-                    ffn_metric_df['layer'] = 'ffn'
-                    nonlinear_metric_df = pd.DataFrame(nonlinear_latency_eff_dict, index=[0])
-                    nonlinear_metric_df['layer'] = 'nonlinear'
-
-
-                    end_to_end_metric_df = pd.concat([proj_metric_df, attn_metric_df, ffn_metric_df, nonlinear_metric_df])
-                    end_to_end_metric_df['arch'] = arch
-                    end_to_end_metric_df['subarch'] = subarch
-                    end_to_end_metric_df['arch_dim'] = arch_dim
-                    end_to_end_metric_df['model'] = model
-
-                    end_to_end_metric_df = end_to_end_metric_df.drop(columns=['flops', 'execution_time', 'power', 'energy'], errors='ignore')
-                    end_to_end_breakdown = pd.concat([end_to_end_breakdown, end_to_end_metric_df], axis=0)
+                    config_list.append({'arch': arch, 'subarch': subarch, 'arch_dim': arch_dim, 'model': model})
+                    yaml_dict_list.append(load_yaml(run_path))
+
+    # all configs of a model share the workload, and each layer is aggregated once per batch of identical event graphs
+    layer_latency_dict = {}
+    for model in model_list:
+        model_index_list = [index for index, config in enumerate(config_list) if config['model'] == model]
+        for layer in layer_list:
+            execution_time_df = query_batch_metrics(yaml_dict_list=[yaml_dict_list[index] for index in model_index_list], metrics=['runtime'], workload=model, event=layer)
+            for batch_index, index in enumerate(model_index_list):
+                layer_latency_dict[(index, layer)] = execution_time_df.at[batch_index, 'runtime'] / 10**3 # ms -> s
+
+    for index, config in enumerate(config_list):
+        end_to_end_metric_df = pd.DataFrame({
+            'latency': [layer_latency_dict[(index, layer)] for layer in layer_list],
+            'layer': layer_list
+        }, index=[0] * len(layer_list))
+        end_to_end_metric_df['arch'] = config['arch']
+        end_to_end_metric_df['subarch'] = config['subarch']
+        end_to_end_metric_df['arch_dim'] = config['arch_dim']
+        end_to_end_metric_df['model'] = config['model']
+
+        end_to_end_metric_df = end_to_end_metric_df.drop(columns=['flops', 'execution_time', 'power', 'energy'], errors='ignore')
+        end_to_end_breakdown = pd.concat([end_to_end_breakdown, end_to_end_metric_df], axis=0)
 
     end_to_end_breakdown.to_csv(output_path + 'end_to_end_latency_breakdown.csv', index=False)
 
@@ -1,11 +1,12 @@
-from archx.metric import query_module_metric, aggregate_event_metric, aggregate_tag_metric, aggregate_event_count
+from archx.metric import query_module_metric, aggregate_event_metric, aggregate_tag_metric, aggregate_event_count, aggregate_event_metrics, aggregate_tag_metrics, aggregate_breakdown_metric, aggregate_batch_metrics
 from collections import OrderedDict
 from archx.utils import get_prod, read_yaml
 from archx.architecture import load_architecture_dict
-from archx.event import load_event_graph
+from archx.event import load_event_graph, get_tag_nodes, get_event_plan
 from archx.metric import load_metric_dict
 import statistics
 import numpy as np
+import pandas as pd
 
 def geomean(dict_list: list[OrderedDict]) -> OrderedDict:
     geomean_dict = OrderedDict()
@@ -49,6 +50,68 @@ def query_leakage_power(event_graph, metric_dict, workload, event=None, tag=None
         leakage_power =  aggregate_tag_metric(event_graph=event_graph, metric_dict=metric_dict, metric='leakage_power', workload=workload, tag=tag)
     return leakage_power['value'] / 10**3 # mW -> W
 
+def query_execution_time_cycle_count(event_graph, metric_dict, workload, event) -> tuple:
+    # runtime and cycle count share one traversal of the event graph
+    metrics_dict = aggregate_event_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=['runtime', 'cycle_count'], workload=workload, event=event)
+    return metrics_dict['runtime']['value'] / 10**3, metrics_dict['cycle_count']['value'] # ms -> s
+
+def query_dynamic_energy_leakage_power(event_graph, metric_dict, workload, tag) -> tuple:
+    # dynamic energy and leakage power share one breakdown of the event graph
+    metrics_dict = aggregate_tag_metrics(event_graph=event_graph, metric_dict=metric_dict, metrics=['dynamic_energy', 'leakage_power'], workload=workload, tag=tag)
+    return metrics_dict['dynamic_energy']['value'] / 10**9, metrics_dict['leakage_power']['value'] / 10**3 # nJ -> J, mW -> W
+
+def query_event_dynamic_energy_leakage_power(event_graph, metric_dict, event, tag) -> tuple:
+    # the breakdown without workload is cached per graph, and the row of an event is the contribution of each module to one occurrence of the event
+    dynamic_energy_df = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric='dynamic_energy')
+    leakage_power_df = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric='leakage_power')
+    dynamic_energy = query_tag_breakdown(event_graph=event_graph, breakdown_df=dynamic_energy_df, tag=tag, event=event)
+    leakage_power = query_tag_breakdown(event_graph=event_graph, breakdown_df=leakage_power_df, tag=tag, event=event)
+    return dynamic_energy / 10**9, leakage_power / 10**3 # nJ -> J, mW -> W
+
+def query_tag_breakdown(event_graph, breakdown_df, tag, event=None) -> np.float64:
+    # sum the modules with the tag in a breakdown table, so all tags share one breakdown of the event graph
+    # if event is none, each module takes its own row, otherwise the row of the event
+    tag_modules = [event_graph.vp.event[v] for v in get_tag_nodes(event_graph, tag)]
+    assert len(tag_modules) > 0, f'Invalid tag <{tag}>.'
+    return sum(breakdown_df.at[module if event is None else event, module] for module in tag_modules)
+
+def query_tag_area_power(tag_list, event_graph, metric_dict, workload, event) -> tuple:
+    # area and power of all tags from one breakdown per metric
+    # same as aggregate_tag_metric, a tag is 0 if it has no modules, or if any of its modules is not in the workload
+    execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=workload, event=event)
+    area_df = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric='area', workload=workload)
+    dynamic_energy_df = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric='dynamic_energy', workload=workload)
+    leakage_power_df = aggregate_breakdown_metric(event_graph=event_graph, metric_dict=metric_dict, metric='leakage_power', workload=workload)
+
+    tag_area_dict = OrderedDict()
+    tag_power_dict = OrderedDict()
+    for tag in tag_list:
+        tag_modules = [event_graph.vp.event[v] for v in get_tag_nodes(event_graph, tag)]
+        if len(tag_modules) == 0 or any(module not in area_df.index for module in tag_modules):
+            tag_area_dict[tag] = 0
+            tag_power_dict[tag] = 0
+            continue
+        tag_area_dict[tag] = query_tag_breakdown(event_graph=event_graph, breakdown_df=area_df, tag=tag)
+        dynamic_energy = query_tag_breakdown(event_graph=event_graph, breakdown_df=dynamic_energy_df, tag=tag) / 10**9 # nJ -> J
+        leakage_power = query_tag_breakdown(event_graph=event_graph, breakdown_df=leakage_power_df, tag=tag) / 10**3 # mW -> W
+        tag_power_dict[tag] = (leakage_power + (dynamic_energy / execution_time)) * 10**3 # W -> mW
+
+    return tag_area_dict, tag_power_dict
+
+def query_batch_metrics(yaml_dict_list, metrics, workload, event) -> pd.DataFrame:
+    # configs with identical event graph structure are aggregated in one batch, and the table is indexed by position in the yaml dict list
+    batch_dict = OrderedDict()
+    for index, yaml_dict in enumerate(yaml_dict_list):
+        batch_dict.setdefault(get_event_plan(yaml_dict['event_graph'])['hash'], []).append(index)
+
+    batch_df_list = []
+    for index_list in batch_dict.values():
+        event_graphs = [yaml_dict_list[index]['event_graph'] for index in index_list]
+        metric_dict = yaml_dict_list[index_list[0]]['metric_dict']
+        batch_df_list.append(aggregate_batch_metrics(event_graphs=event_graphs, metric_dict=metric_dict, metrics=metrics, workload=workload, event=event, configs=index_list))
+
+    return pd.concat(batch_df_list).sort_index()
+
 def query_area(event_graph, metric_dict, workload=None, tag=None, module=None) -> np.float64:
 
     if module is not None:
@@ -61,8 +124,7 @@ def query_area(event_graph, metric_dict, workload=None, tag=None, module=None) -
 
 def query_operational_carbon(tag, event_graph, metric_dict, workload, event, CI) -> OrderedDict:
     execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=workload, event=event)
-    dynamic_energy = query_dynamic_energy(event_graph=event_graph, metric_dict=metric_dict, workload=workload, tag=tag)
-    leakage_power = query_leakage_power(event_graph=event_graph, metric_dict=metric_dict, workload=workload, tag=tag)
+    dynamic_energy, leakage_power = query_dynamic_energy_leakage_power(event_graph=event_graph, metric_dict=metric_dict, workload=workload, tag=tag)
     power = (leakage_power + (dynamic_energy / execution_time)) * 10**3 # W -> mW
 
     op_carbon = CI * (power / 1000000) * (execution_time / 3600) # mW -> KW, s -> H
@@ -71,8 +133,7 @@ def query_operational_carbon(tag, event_graph, metric_dict, workload, event, CI)
 
 def query_tag_power(tag, event_graph, metric_dict, workload, event) -> OrderedDict:
     execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=workload, event=event)
-    dynamic_energy = query_dynamic_energy(event_graph=event_graph, metric_dict=metric_dict, workload=workload, tag=tag)
-    leakage_power = query_leakage_power(event_graph=event_graph, metric_dict=metric_dict, workload=workload, tag=tag)
+    dynamic_energy, leakage_power = query_dynamic_energy_leakage_power(event_graph=event_graph, metric_dict=metric_dict, workload=workload, tag=tag)
     power = (leakage_power + (dynamic_energy / execution_time)) * 10**3 # W -> mW
 
     return power
@@ -131,11 +192,9 @@ def query_throughput_metrics(event_graph, metric_dict, module, workload, event)-
 
 def query_performance_metrics(event_graph, metric_dict, module, workload, event) -> OrderedDict:
 
-    execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=event, event=event)
-    cycle_count = query_cycle_count(event_graph=event_graph, metric_dict=metric_dict, workload=event, event=event)
+    execution_time, cycle_count = query_execution_time_cycle_count(event_graph=event_graph, metric_dict=metric_dict, workload=event, event=event)
     pe_count = aggregate_event_count(event_graph=event_graph, workload=event, event=module)
-    dynamic_energy = query_dynamic_energy(event_graph=event_graph, metric_dict=metric_dict, workload=event, tag='onchip')
-    leakage_power = query_leakage_power(event_graph=event_graph, metric_dict=metric_dict, workload=event, tag='onchip')
+    dynamic_energy, leakage_power = query_event_dynamic_energy_leakage_power(event_graph=event_graph, metric_dict=metric_dict, event=event, tag='onchip')
 
     flops = pe_count * 2 / 10**9 # GFLOPS
 
@@ -185,8 +244,7 @@ def query_performance_gemm_metrics(event_graph, metric_dict, module, workload, e
 
     execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=event, event=event)
     pe_count = aggregate_event_count(event_graph=event_graph, workload=event, event=module)
-    dynamic_energy = query_dynamic_energy(event_graph=event_graph, metric_dict=metric_dict, workload=event, tag='onchip')
-    leakage_power = query_leakage_power(event_graph=event_graph, metric_dict=metric_dict, workload=event, tag='onchip')
+    dynamic_energy, leakage_power = query_event_dynamic_energy_leakage_power(event_graph=event_graph, metric_dict=metric_dict, event=event, tag='onchip')
 
     flops = pe_count * 2 / 10**9 # GFLOPS
 
@@ -201,11 +259,9 @@ def query_performance_gemm_metrics(event_graph, metric_dict, module, workload, e
 
 def query_performance_nonlinear_metrics(event_graph, metric_dict, module, workload, event) -> OrderedDict:
 
-    execution_time = query_execution_time(event_graph=event_graph, metric_dict=metric_dict, workload=event, event=event)
+    execution_time, cycle_count = query_execution_time_cycle_count(event_graph=event_graph, metric_dict=metric_dict, workload=event, event=event)
     pe_count = aggregate_event_count(event_graph=event_graph, workload=event, event=module)
-    dynamic_energy = query_dynamic_energy(event_graph=event_graph, metric_dict=metric_dict, workload=event, tag='onchip')
-    leakage_power = query_leakage_power(event_graph=event_graph, metric_dict=metric_dict, workload=event, tag='onchip')
-    cycle_count = query_cycle_count(event_graph=event_graph, metric_dict=metric_dict, workload=event, event=event)
+    dynamic_energy, leakage_power = query_event_dynamic_energy_leakage_power(event_graph=event_graph, metric_dict=metric_dict, event=event, tag='onchip')
 
     flops = pe_count * 3 / 10**9 # GFLOPS
 